@@ -25,7 +25,7 @@ from quast_libs.metautils import Assembly, correct_meta_references, correct_asse
     get_downloaded_refs_with_alignments, partition_contigs, calculate_ave_read_support
 from quast_libs.options_parser import parse_options, remove_from_quast_py_args, prepare_regular_quast_args
 
-from quast_libs import contigs_analyzer, search_references_meta, plotter_data, qutils
+from quast_libs import contigs_analyzer, executors, search_references_meta, plotter_data, qutils
 from quast_libs.qutils import cleanup, check_dirpath, is_python2, run_parallel
 
 from quast_libs.log import get_logger
@@ -212,6 +212,10 @@ def main(args):
 
     # Running combined reference
     combined_output_dirpath = os.path.join(output_dirpath, qconfig.combined_output_name)
+    if not qconfig.aligner_index_dirpath and not qconfig.space_efficient:
+        # reference indexes are shared by the combined reference and per reference runs
+        quast_py_args += ['--aligner-index-dir', os.path.join(combined_output_dirpath, qconfig.detailed_contigs_reports_dirname,
+                                                              qconfig.aligner_output_dirname)]
     qconfig.reference = combined_ref_fpath
 
     if qconfig.bed:
@@ -328,7 +332,8 @@ def main(args):
         parallel_run_args = [(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_assemblies, num_notifications, True)
                              for ref_fpath, ref_assemblies in assemblies_by_reference]
         ref_names, ref_json_texts, ref_notifications = \
-            run_parallel(_run_quast_per_ref, parallel_run_args, qconfig.max_threads, filter_results=True)
+            run_parallel(_run_quast_per_ref, parallel_run_args, qconfig.max_threads, filter_results=True,
+                         executor_type=executors.FORK)  # each run sets up its own loggers and modules
         per_ref_num_notifications = list(map(sum, zip(*ref_notifications)))
         total_num_notifications = list(map(sum, zip(total_num_notifications, per_ref_num_notifications)))
         if json_texts is not None:
@@ -18,7 +18,7 @@ qconfig.check_python_version()
 
 from site import addsitedir
 addsitedir(os.path.join(qconfig.LIBS_LOCATION, 'site_packages'))
-from quast_libs import qutils, run_barrnap, plotter_data, unique_kmers
+from quast_libs import executors, profiling, qutils, run_barrnap, plotter_data, unique_kmers
 from quast_libs.qutils import cleanup, check_dirpath, check_reads_fpaths
 from quast_libs.options_parser import parse_options
 
@@ -54,6 +54,9 @@ def main(args):
             logger.warning('Python locale settings can\'t be changed')
     quast_path = [__file__]
     quast_py_args, contigs_fpaths = parse_options(logger, quast_path + args)
+    executors.shutdown()  # workers of the reused pool should be started with the loggers of this run
+    first_stage = len(executors.stages_usage)  # MetaQUAST runs QUAST several times
+    profiling.start()
     output_dirpath, ref_fpath, labels = qconfig.output_dirpath, qconfig.reference, qconfig.labels
     corrected_dirpath = os.path.join(output_dirpath, qconfig.corrected_dirname)
     logger.main_info()
@@ -85,14 +88,16 @@ def main(args):
         logger.main_info()
         logger.main_info('Reference:')
         original_ref_fpath = ref_fpath
-        ref_fpath = qutils.correct_reference(ref_fpath, corrected_dirpath)
+        with profiling.stage('reference'):
+            ref_fpath = qutils.correct_reference(ref_fpath, corrected_dirpath)
         if qconfig.optimal_assembly:
             if not qconfig.pacbio_reads and not qconfig.nanopore_reads and not qconfig.mate_pairs:
                 logger.warning('Upper Bound Assembly cannot be created. It requires mate-pairs or long reads (Pacbio SMRT or Oxford Nanopore).')
             else:
                 from quast_libs import optimal_assembly
-                optimal_assembly_fpath = optimal_assembly.do(ref_fpath, original_ref_fpath,
-                                                             os.path.join(output_dirpath, qconfig.optimal_assembly_basename))
+                with profiling.stage('optimal_assembly'):
+                    optimal_assembly_fpath = optimal_assembly.do(ref_fpath, original_ref_fpath,
+                                                                 os.path.join(output_dirpath, qconfig.optimal_assembly_basename))
                 if optimal_assembly_fpath is not None:
                     contigs_fpaths.insert(0, optimal_assembly_fpath)
                     labels.insert(0, 'UpperBound')
@@ -104,7 +109,8 @@ def main(args):
     logger.main_info()
     logger.main_info('Contigs:')
 
-    contigs_fpaths, old_contigs_fpaths = qutils.correct_contigs(contigs_fpaths, corrected_dirpath, labels, reporting)
+    with profiling.stage('contigs'):
+        contigs_fpaths, old_contigs_fpaths = qutils.correct_contigs(contigs_fpaths, corrected_dirpath, labels, reporting)
     for contigs_fpath in contigs_fpaths:
         report = reporting.get(contigs_fpath)
         report.add_field(reporting.Fields.NAME, qutils.label_from_fpath(contigs_fpath))
@@ -115,9 +121,10 @@ def main(args):
     physical_cov_fpath = qconfig.phys_cov_fpath
     if qconfig.reads_fpaths or qconfig.reference_sam or qconfig.reference_sam or qconfig.sam_fpaths or qconfig.bam_fpaths:
         from quast_libs import reads_analyzer
-        bed_fpath, cov_fpath, physical_cov_fpath = reads_analyzer.do(ref_fpath, contigs_fpaths,
-                                                                     os.path.join(output_dirpath, qconfig.reads_stats_dirname),
-                                                                     external_logger=logger)
+        with profiling.stage('reads_analyzer'):
+            bed_fpath, cov_fpath, physical_cov_fpath = reads_analyzer.do(ref_fpath, contigs_fpaths,
+                                                                         os.path.join(output_dirpath, qconfig.reads_stats_dirname),
+                                                                         external_logger=logger)
         qconfig.bed = bed_fpath
 
     if not contigs_fpaths:
@@ -146,10 +153,12 @@ def main(args):
     ### Stats and plots
     ########################################################################
     from quast_libs import basic_stats
-    icarus_gc_fpath, circos_gc_fpath = basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
+    with profiling.stage('basic_stats'):
+        gc_track_fpath = basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
 
     if qconfig.use_kmc and ref_fpath:
-        unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
+        with profiling.stage('unique_kmers'):
+            unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
 
     aligned_contigs_fpaths = []
     aligned_lengths_lists = []
@@ -161,9 +170,10 @@ def main(args):
         ########################################################################
         from quast_libs import contigs_analyzer
         is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
-        aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
-            ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname),
-            old_contigs_fpaths, qconfig.bed)
+        with profiling.stage('contigs_analyzer'):
+            aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
+                ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname),
+                old_contigs_fpaths, qconfig.bed)
         for contigs_fpath in contigs_fpaths:
             if aligner_statuses[contigs_fpath] == contigs_analyzer.AlignerStatus.OK:
                 aligned_contigs_fpaths.append(contigs_fpath)
@@ -182,18 +192,20 @@ def main(args):
         ### NAx and NGAx ("aligned Nx and NGx")
         ########################################################################
         from quast_libs import aligned_stats
-        aligned_stats.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            aligned_lengths_lists, os.path.join(output_dirpath, 'aligned_stats'))
+        with profiling.stage('aligned_stats'):
+            aligned_stats.do(
+                ref_fpath, aligned_contigs_fpaths, output_dirpath,
+                aligned_lengths_lists, os.path.join(output_dirpath, 'aligned_stats'))
 
         ########################################################################
         ### GENOME_ANALYZER
         ########################################################################
         from quast_libs import genome_analyzer
-        features_containers = genome_analyzer.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            qconfig.features, qconfig.operons, detailed_contigs_reports_dirpath,
-            os.path.join(output_dirpath, 'genome_stats'))
+        with profiling.stage('genome_analyzer'):
+            features_containers = genome_analyzer.do(
+                ref_fpath, aligned_contigs_fpaths, output_dirpath,
+                qconfig.features, qconfig.operons, detailed_contigs_reports_dirpath,
+                os.path.join(output_dirpath, 'genome_stats'))
 
     genes_by_labels = None
     if qconfig.glimmer:
@@ -201,20 +213,23 @@ def main(args):
         ### Glimmer
         ########################################################################
         from quast_libs import glimmer
-        genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
+        with profiling.stage('glimmer'):
+            genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
     if qconfig.gene_finding:
         ########################################################################
         ### GeneMark
         ########################################################################
         from quast_libs import genemark
-        genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
-                    qconfig.prokaryote, qconfig.metagenemark)
+        with profiling.stage('genemark'):
+            genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
+                        qconfig.prokaryote, qconfig.metagenemark)
     if genes_by_labels is None:
         logger.main_info("")
         logger.notice("Genes are not predicted by default. Use --gene-finding or --glimmer option to enable it.")
 
     if qconfig.rna_gene_finding:
-        run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
+        with profiling.stage('barrnap'):
+            run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
 
     if qconfig.run_busco and not qconfig.is_combined_ref:
         if qconfig.platform_name == 'macosx':
@@ -225,9 +240,11 @@ def main(args):
             logger.warning("BUSCO does not support Python versions earlier than 2.7.")
         else:
             from quast_libs import run_busco
-            run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
+            with profiling.stage('busco'):
+                run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
     ########################################################################
-    reports_fpaths, transposed_reports_fpaths = reporting.save_total(output_dirpath)
+    with profiling.stage('reporting'):
+        reports_fpaths, transposed_reports_fpaths = reporting.save_total(output_dirpath)
 
     ########################################################################
     ### LARGE DRAWING TASKS
@@ -250,7 +267,8 @@ def main(args):
                 # full report in PDF format: all tables and plots
                 logger.main_info(
                     '  1 of %d: Creating PDF with all tables and plots...' % number_of_steps)
-                plotter.fill_all_pdf_file(all_pdf_fpath)
+                with profiling.stage('pdf_report'):
+                    plotter.fill_all_pdf_file(all_pdf_fpath)
 
             if draw_alignment_plots:
                 ########################################################################
@@ -258,17 +276,19 @@ def main(args):
                 ########################################################################
                 logger.main_info('  %d of %d: Creating Icarus viewers...' % (2 if all_pdf_fpath else 1, number_of_steps))
                 from quast_libs import icarus
-                icarus_html_fpath = icarus.do(
-                    contigs_fpaths, report_for_icarus_fpath_pattern, output_dirpath, ref_fpath,
-                    stdout_pattern=stdout_pattern, features=features_containers,
-                    cov_fpath=cov_fpath, physical_cov_fpath=physical_cov_fpath, gc_fpath=icarus_gc_fpath,
-                    json_output_dir=qconfig.json_output_dirpath, genes_by_labels=genes_by_labels)
+                with profiling.stage('icarus'):
+                    icarus_html_fpath = icarus.do(
+                        contigs_fpaths, report_for_icarus_fpath_pattern, output_dirpath, ref_fpath,
+                        stdout_pattern=stdout_pattern, features=features_containers,
+                        cov_fpath=cov_fpath, physical_cov_fpath=physical_cov_fpath, gc_fpath=gc_track_fpath,
+                        json_output_dir=qconfig.json_output_dirpath, genes_by_labels=genes_by_labels)
 
             if draw_circos_plot:
                 logger.main_info('  %d of %d: Creating Circos plot...' % (number_of_steps, number_of_steps))
                 from quast_libs import circos
-                circos_png_fpath, circos_legend_fpath = circos.do(ref_fpath, contigs_fpaths, report_for_icarus_fpath_pattern, circos_gc_fpath,
-                                                                  features_containers, cov_fpath, os.path.join(output_dirpath, 'circos'), logger)
+                with profiling.stage('circos'):
+                    circos_png_fpath, circos_legend_fpath = circos.do(ref_fpath, contigs_fpaths, report_for_icarus_fpath_pattern, gc_track_fpath,
+                                                                      features_containers, cov_fpath, os.path.join(output_dirpath, 'circos'), logger)
 
             logger.main_info('Done')
         except KeyboardInterrupt:
@@ -286,8 +306,9 @@ def main(args):
 
     if qconfig.html_report:
         from quast_libs.html_saver import html_saver
-        html_saver.save_colors(output_dirpath, contigs_fpaths, plotter_data.dict_color_and_ls)
-        html_saver.save_total_report(output_dirpath, qconfig.min_contig, ref_fpath)
+        with profiling.stage('html_report'):
+            html_saver.save_colors(output_dirpath, contigs_fpaths, plotter_data.dict_color_and_ls)
+            html_saver.save_total_report(output_dirpath, qconfig.min_contig, ref_fpath)
 
     if all_pdf_fpath and os.path.isfile(all_pdf_fpath):
         logger.main_info('  PDF version (tables and plots) is saved to ' + all_pdf_fpath)
@@ -300,6 +321,8 @@ def main(args):
     if icarus_html_fpath:
         logger.main_info('  Icarus (contig browser) is saved to %s' % icarus_html_fpath)
 
+    profiling.save(output_dirpath)
+    executors.save_usage_report(os.path.join(output_dirpath, qconfig.cpu_usage_fname), first_stage)
     cleanup(corrected_dirpath)
     return logger.finish_up(check_test=qconfig.test)
 
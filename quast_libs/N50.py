@@ -5,6 +5,16 @@
 # See file LICENSE for details.
 ############################################################################
 
+try:
+    from itertools import accumulate
+except ImportError:  # python 2
+    def accumulate(values):
+        total = 0
+        for value in values:
+            total += value
+            yield total
+
+
 def NG50(numlist, reference_length, percentage = 50.0):
     """
     Abstract: Returns the NG50 value of the passed list of numbers.
@@ -72,4 +82,80 @@ def NG50_and_LG50(numlist, reference_length, percentage=50.0, need_sort=False):
 
 
 def N50_and_L50(numlist, percentage = 50.0):
-    return NG50_and_LG50(numlist, sum(numlist), percentage)
\ No newline at end of file
+    return NG50_and_LG50(numlist, sum(numlist), percentage)
+
+
+def _bisect_first(lo, hi, is_reached):
+    """
+    Returns the first index in [lo, hi) for which monotone predicate is_reached is True, or hi if there is no such index
+    """
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if is_reached(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class NxCurve(object):
+    """
+    Nx-like statistics (Nx, NGx, NAx, NGAx and corresponding Lx-like values) of the passed list of lengths.
+    Lengths are sorted once, and any percentage is found by binary search in cumulative lengths.
+    Usage: curve = NxCurve(lengths); n50, l50 = curve.N50_and_L50(); ng50, lg50 = curve.NG50_and_LG50(reference_length)
+    """
+    def __init__(self, lengths, is_sorted=False):
+        self.lengths = lengths if is_sorted else sorted(lengths, reverse=True)
+        self.cumulative_lengths = list(accumulate(self.lengths))
+        self.total_length = self.cumulative_lengths[-1] if self.cumulative_lengths else 0
+
+    def NG50_and_LG50(self, reference_length, percentage=50.0):
+        assert percentage >= 0.0
+        assert percentage <= 100.0
+        limit = reference_length * (100.0 - percentage) / 100.0
+        cumulative_lengths = self.cumulative_lengths
+        idx = _bisect_first(0, len(cumulative_lengths), lambda i: reference_length - cumulative_lengths[i] <= limit)
+        if idx == len(cumulative_lengths):
+            return None, None
+        return self.lengths[idx], idx + 1
+
+    def N50_and_L50(self, percentage=50.0):
+        return self.NG50_and_LG50(self.total_length, percentage)
+
+    def get_values(self, percentages, reference_length=None):
+        """
+        Returns list of (Nx, Lx) for all percentages (NGx and LGx if reference_length is specified)
+        """
+        if reference_length is None:
+            reference_length = self.total_length
+        return [self.NG50_and_LG50(reference_length, percentage) for percentage in percentages]
+
+    def get_x_values(self, reference_length=None):
+        """
+        Returns cumulative lengths in percents of reference_length (of total length by default), i.e. X-coordinates of the curve
+        """
+        if reference_length is None:
+            reference_length = self.total_length
+        return [cumulative_length * 100.0 / reference_length for cumulative_length in self.cumulative_lengths]
+
+    def get_plot_points(self, reference_length=None, min_difference=0):
+        """
+        Returns X- and Y-coordinates of the stepped Nx-like curve.
+        A step is added only if the length decreases by more than min_difference, so only the added points are calculated
+        """
+        if not self.lengths:
+            return [], []
+        if reference_length is None:
+            reference_length = self.total_length
+        lengths = self.lengths
+        vals_x = [0.0]
+        vals_y = [lengths[0]]
+        idx = 0
+        while idx < len(lengths):
+            l = lengths[idx]
+            vals_x.append(vals_x[-1] + 1e-10)  # eps
+            vals_y.append(l)
+            vals_x.append(self.cumulative_lengths[idx] * 100.0 / reference_length)
+            vals_y.append(l)
+            idx = _bisect_first(idx + 1, len(lengths), lambda i: l - lengths[i] > min_difference)
+        return vals_x, vals_y
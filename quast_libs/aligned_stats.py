@@ -37,12 +37,10 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath,
 
     for i, (contigs_fpath, lens, assembly_len) in enumerate(
             zip(aligned_contigs_fpaths, aligned_lengths_lists, assembly_lengths)):
-        sorted_lengths = sorted(lens, reverse=True)
-        na50, la50 = N50.NG50_and_LG50(sorted_lengths, assembly_len)
-        nax, lax = N50.NG50_and_LG50(sorted_lengths, assembly_len, qconfig.x_for_additional_Nx)
+        nx_curve = N50.NxCurve(lens)
+        (na50, la50), (nax, lax) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx], assembly_len)
         if not qconfig.is_combined_ref:
-            nga50, lga50 = N50.NG50_and_LG50(sorted_lengths, reference_length)
-            ngax, lgax = N50.NG50_and_LG50(sorted_lengths, reference_length, qconfig.x_for_additional_Nx)
+            (nga50, lga50), (ngax, lgax) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx], reference_length)
 
         logger.info('  ' +
                     qutils.index_to_str(i) +
@@ -54,7 +52,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath,
                  (', LGA50 = ' + str(lga50) if not qconfig.is_combined_ref and lga50 else ''))
         report = reporting.get(contigs_fpath)
         report.add_field(reporting.Fields.LARGALIGN, max(lens))
-        report.add_field(reporting.Fields.TOTAL_ALIGNED_LEN, sum(lens))
+        report.add_field(reporting.Fields.TOTAL_ALIGNED_LEN, nx_curve.total_length)
         report.add_field(reporting.Fields.NA50, na50)
         report.add_field(reporting.Fields.NAx, nax)
         report.add_field(reporting.Fields.LA50, la50)
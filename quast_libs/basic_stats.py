@@ -12,19 +12,30 @@ import re
 from os.path import join
 
 from quast_libs import fastaparser, qconfig, qutils, reporting, plotter
-from quast_libs.circos import set_window_size
+from quast_libs.tracks import TrackWriter, GC, NO_VALUE, TRACK_EXT, get_GC_percent_by_counts
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 MIN_HISTOGRAM_POINTS = 5
 MIN_GC_WINDOW_SIZE = qconfig.GC_window_size // 2
+GC_WINDOWS_PER_BLOCK = 100000
+MIN_NUMPY_WINDOWS = 20  # numpy is slower for short sequences
 
+_cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
 
-def GC_content(contigs_fpath, skip=False):
+# numpy is optional: GC content of windows of long sequences is computed over the sequence bytes if it is available
+try:
+    import numpy
+    _N, _G, _C = numpy.uint8(ord('N')), numpy.uint8(ord('G')), numpy.uint8(ord('C'))
+except ImportError:
+    numpy = None
+
+
+def calculate_stats(contigs_fpath, skip_gc=False):
     """
-       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+       Reads the assembly once and returns list of contig lengths, total number of Ns, coverage distribution
+       (total length of contigs by _cov_ value in contig names), percent of GC for assembly,
+       GC distribution: (list of GC%, list of # windows), and contigs GC distribution: (list of GC%, list of # contigs)
     """
-    total_GC_amount = 0
-    total_contig_length = 0
     GC_contigs_bin_num = int(100 / qconfig.GC_contig_bin_size) + 1
     GC_contigs_distribution_x = [i * qconfig.GC_contig_bin_size for i in range(0, GC_contigs_bin_num)] # list of X-coordinates, i.e. GC %
     GC_contigs_distribution_y = [0] * GC_contigs_bin_num # list of Y-coordinates, i.e. # contigs with GC % = x
@@ -32,25 +43,33 @@ def GC_content(contigs_fpath, skip=False):
     GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
     GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
     GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
-    total_GC = None
-    if skip:
-        return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
 
-    for name, seq_full in fastaparser.read_fasta(contigs_fpath): # in tuples: (name, seq)
-        contig_ACGT_len = len(seq_full) - seq_full.count("N")
-        if not contig_ACGT_len:
+    if not skip_gc:
+        # the index is created during the same pass, so contig lengths and N and GC counts are taken from it
+        for name, seq in fastaparser.read_fasta_bytes(contigs_fpath, save_index=True):
+            _, GC_percents = get_windows_GC(seq, qconfig.GC_window_size)
+            add_to_GC_distribution(GC_distribution_y, GC_percents)
+
+    lengths = []
+    number_of_Ns = 0
+    coverage_distribution = []
+    total_GC_amount = 0
+    total_contig_length = 0
+    for entry in fastaparser.get_fasta_index(contigs_fpath):
+        lengths.append(entry.length)
+        number_of_Ns += entry.ns
+        cov = _cov_pattern.findall(entry.name)
+        if cov:
+            cov = int(float(cov[0]))
+            if len(coverage_distribution) <= cov:
+                coverage_distribution += [0] * (cov - len(coverage_distribution) + 1)
+            coverage_distribution[cov] += entry.length
+        contig_ACGT_len = entry.length - entry.ns
+        if skip_gc or not contig_ACGT_len:
             continue
-        contig_GC_len = seq_full.count("G") + seq_full.count("C")
-        contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
+        contig_GC_percent = 100.0 * entry.gc / contig_ACGT_len
         GC_contigs_distribution_y[int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
-
-        n = qconfig.GC_window_size
-        # non-overlapping windows
-        for seq in (seq_full[i:i+n] for i in range(0, len(seq_full), n)):
-            GC_percent = get_GC_percent(seq)
-            if GC_percent is not None:
-                GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
-        total_GC_amount += contig_GC_len
+        total_GC_amount += entry.gc
         total_contig_length += contig_ACGT_len
 
     if total_contig_length == 0:
@@ -58,44 +77,107 @@ def GC_content(contigs_fpath, skip=False):
     else:
         total_GC = total_GC_amount * 100.0 / total_contig_length
 
-    return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+    return lengths, number_of_Ns, coverage_distribution, total_GC, \
+           (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+
+
+def GC_content(contigs_fpath, skip=False):
+    """
+       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+    """
+    return calculate_stats(contigs_fpath, skip_gc=skip)[3:]
 
 
 def get_GC_percent(seq):
     if len(seq) < MIN_GC_WINDOW_SIZE:
         return None
-    ACGT_len = len(seq) - seq.count("N")
+    ACGT_len = len(seq) - seq.count(b'N')
     # skip block if it has less than half of ACGT letters (it also helps with "ends of contigs")
     if ACGT_len < len(seq) // 2:
         return None
 
-    GC_len = seq.count("G") + seq.count("C")
+    GC_len = seq.count(b'G') + seq.count(b'C')
     GC_percent = 100 * GC_len // ACGT_len
     return GC_percent
 
 
-def save_icarus_GC(ref_fpath, gc_fpath):
-    chr_index = 0
-    window_size = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size  # non-overlapping windows
-    with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            out_f.write('#' + name + ' ' + str(chr_index) + '\n')
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq)
-                if GC_percent is not None:
-                    out_f.write(str(chr_index) + ' ' + str(GC_percent) + '\n')
-
-
-def save_circos_GC(ref_fpath, reference_length, gc_fpath):
-    window_size = set_window_size(reference_length)
-    with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq)
-                if GC_percent is not None:
-                    out_f.write('\t'.join([name, str(i), str(i + len(seq)), str(GC_percent) + '\n']))
+def get_windows_GC(seq, window_size):
+    """
+       Splits seq (bytes) into non-overlapping windows and returns starts and GC % of windows
+       that are not skipped by get_GC_percent
+    """
+    starts, GC_percents = [], []
+    full_windows_len = 0
+    if numpy is not None and len(seq) >= window_size * MIN_NUMPY_WINDOWS:
+        # full windows are counted in blocks to limit memory used for temporary arrays
+        full_windows_len = len(seq) - len(seq) % window_size
+        block_size = window_size * GC_WINDOWS_PER_BLOCK
+        for block_start in range(0, full_windows_len, block_size):
+            windows = numpy.frombuffer(seq, dtype=numpy.uint8, offset=block_start,
+                                       count=min(block_size, full_windows_len - block_start)).reshape(-1, window_size)
+            ACGT_lens = window_size - numpy.count_nonzero(windows == _N, axis=1)
+            GC_lens = numpy.count_nonzero((windows == _G) | (windows == _C), axis=1)
+            is_valid = (ACGT_lens >= window_size // 2) & (ACGT_lens > 0)
+            if window_size < MIN_GC_WINDOW_SIZE:
+                is_valid[:] = False
+            starts.extend((numpy.flatnonzero(is_valid) * window_size + block_start).tolist())
+            GC_percents.extend((100 * GC_lens[is_valid] // ACGT_lens[is_valid]).tolist())
+    for i in range(full_windows_len, len(seq), window_size):
+        GC_percent = get_GC_percent(seq[i:i + window_size])
+        if GC_percent is not None:
+            starts.append(i)
+            GC_percents.append(GC_percent)
+    return starts, GC_percents
+
+
+def add_to_GC_distribution(GC_distribution_y, GC_percents):
+    if numpy is None or not GC_percents:
+        for GC_percent in GC_percents:
+            GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
+        return
+    bins = ((numpy.array(GC_percents) / qconfig.GC_bin_size).astype(numpy.int64) * qconfig.GC_bin_size).astype(numpy.int64)
+    for bin_idx, windows in enumerate(numpy.bincount(bins).tolist()):
+        if windows:
+            GC_distribution_y[bin_idx] += windows
+
+
+def get_windows_GC_counts(seq, window_size):
+    """
+       Splits seq (bytes) into non-overlapping windows and returns numbers of GC and ACGT letters of all windows
+    """
+    GC_lens, ACGT_lens = [], []
+    full_windows_len = 0
+    if numpy is not None and len(seq) >= window_size * MIN_NUMPY_WINDOWS:
+        full_windows_len = len(seq) - len(seq) % window_size
+        block_size = window_size * GC_WINDOWS_PER_BLOCK
+        for block_start in range(0, full_windows_len, block_size):
+            windows = numpy.frombuffer(seq, dtype=numpy.uint8, offset=block_start,
+                                       count=min(block_size, full_windows_len - block_start)).reshape(-1, window_size)
+            ACGT_lens.extend((window_size - numpy.count_nonzero(windows == _N, axis=1)).tolist())
+            GC_lens.extend(numpy.count_nonzero((windows == _G) | (windows == _C), axis=1).tolist())
+    for i in range(full_windows_len, len(seq), window_size):
+        window = seq[i:i + window_size]
+        ACGT_lens.append(len(window) - window.count(b'N'))
+        GC_lens.append(window.count(b'G') + window.count(b'C'))
+    return GC_lens, ACGT_lens
+
+
+def save_GC_track(ref_fpath, track_fpath):
+    """
+       Reads the reference once and saves GC content of its windows into the multi-resolution track,
+       Icarus and Circos take GC % of their windows from it
+    """
+    window_size = qconfig.GC_window_size
+    track_writer = TrackWriter(track_fpath, GC, window_size)
+    for name, seq in fastaparser.read_fasta_bytes(ref_fpath):
+        track_writer.start_chrom(name)
+        GC_lens, ACGT_lens = get_windows_GC_counts(seq, window_size)
+        for i, (GC_len, ACGT_len) in enumerate(zip(GC_lens, ACGT_lens)):
+            length = min(window_size, len(seq) - i * window_size)
+            GC_percent = get_GC_percent_by_counts(length, GC_len, ACGT_len)
+            GC_percent = NO_VALUE if GC_percent is None else GC_percent
+            track_writer.add_bin(GC_len, ACGT_len, GC_percent, GC_percent, length=length)
+    track_writer.close()
 
 
 def binning_coverage(cov_values, nums_contigs):
@@ -185,19 +267,15 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     reference_length = None
     reference_lengths = []
     reference_fragments = None
-    icarus_gc_fpath = None
-    circos_gc_fpath = None
+    gc_track_fpath = None
     if ref_fpath:
         reference_lengths = sorted(fastaparser.get_chr_lengths_from_fastafile(ref_fpath).values(), reverse=True)
         reference_fragments = len(reference_lengths)
         reference_length = sum(reference_lengths)
         reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = GC_content(ref_fpath)
-        if qconfig.create_icarus_html or qconfig.draw_plots:
-            icarus_gc_fpath = join(output_dirpath, 'gc.icarus.txt')
-            save_icarus_GC(ref_fpath, icarus_gc_fpath)
-        if qconfig.draw_circos:
-            circos_gc_fpath = join(output_dirpath, 'gc.circos.txt')
-            save_circos_GC(ref_fpath, reference_length, circos_gc_fpath)
+        if qconfig.create_icarus_html or qconfig.draw_plots or qconfig.draw_circos:
+            gc_track_fpath = join(output_dirpath, 'gc' + TRACK_EXT)
+            save_GC_track(ref_fpath, gc_track_fpath)
 
         logger.info('  Reference genome:')
         logger.info('    ' + os.path.basename(ref_fpath) + ', length = ' + str(reference_length) +
@@ -215,26 +293,16 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     lists_of_lengths = []
     numbers_of_Ns = []
     coverage_dict = dict()
-    cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
+    GC_stats = []
     for id, contigs_fpath in enumerate(contigs_fpaths):
-        coverage_dict[contigs_fpath] = []
         assembly_label = qutils.label_from_fpath(contigs_fpath)
 
         logger.info('    ' + qutils.index_to_str(id) + assembly_label)
-        # lists_of_lengths.append(fastaparser.get_lengths_from_fastafile(contigs_fpath))
-        list_of_length = []
-        number_of_Ns = 0
-        for (name, seq) in fastaparser.read_fasta(contigs_fpath):
-            list_of_length.append(len(seq))
-            number_of_Ns += seq.count('N')
-            if cov_pattern.findall(name):
-                cov = int(float(cov_pattern.findall(name)[0]))
-                if len(coverage_dict[contigs_fpath]) <= cov:
-                    coverage_dict[contigs_fpath] += [0] * (cov - len(coverage_dict[contigs_fpath]) + 1)
-                coverage_dict[contigs_fpath][cov] += len(seq)
-
+        list_of_length, number_of_Ns, coverage_dict[contigs_fpath], total_GC, GC_distribution, GC_contigs_distribution = \
+            calculate_stats(contigs_fpath, skip_gc=qconfig.no_gc)
         lists_of_lengths.append(list_of_length)
         numbers_of_Ns.append(number_of_Ns)
+        GC_stats.append((total_GC, GC_distribution, GC_contigs_distribution))
 
     lists_of_lengths = [sorted(list, reverse=True) for list in lists_of_lengths]
     num_contigs = max([len(list_of_length) for list_of_length in lists_of_lengths])
@@ -275,18 +343,15 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     list_of_GC_contigs_distributions = []
     largest_contig = 0
     from . import N50
-    for id, (contigs_fpath, lengths_list, number_of_Ns) in enumerate(zip(contigs_fpaths, lists_of_lengths, numbers_of_Ns)):
+    for id, (contigs_fpath, lengths_list, number_of_Ns, (total_GC, GC_distribution, GC_contigs_distribution)) in \
+            enumerate(zip(contigs_fpaths, lists_of_lengths, numbers_of_Ns, GC_stats)):
         report = reporting.get(contigs_fpath)
-        n50, l50 = N50.N50_and_L50(lengths_list)
-        ng50, lg50 = None, None
-        if reference_length:
-            ng50, lg50 = N50.NG50_and_LG50(lengths_list, reference_length)
-        nx, lx = N50.N50_and_L50(lengths_list, qconfig.x_for_additional_Nx)
-        ngx, lgx = None, None
+        nx_curve = N50.NxCurve(lengths_list, is_sorted=True)
+        (n50, l50), (nx, lx) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx])
+        (ng50, lg50), (ngx, lgx) = (None, None), (None, None)
         if reference_length:
-            ngx, lgx = N50.NG50_and_LG50(lengths_list, reference_length, qconfig.x_for_additional_Nx)
-        total_length = sum(lengths_list)
-        total_GC, GC_distribution, GC_contigs_distribution = GC_content(contigs_fpath, skip=qconfig.no_gc)
+            (ng50, lg50), (ngx, lgx) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx], reference_length)
+        total_length = nx_curve.total_length
         list_of_GC_distributions.append(GC_distribution)
         list_of_GC_contigs_distributions.append(GC_contigs_distribution)
         logger.info('    ' + qutils.index_to_str(id) +
@@ -360,4 +425,4 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
             draw_coverage_histograms(coverage_dict, contigs_fpaths, output_dirpath)
 
     logger.main_info('Done.')
-    return icarus_gc_fpath, circos_gc_fpath
+    return gc_track_fpath
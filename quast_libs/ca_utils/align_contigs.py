@@ -11,14 +11,21 @@ import re
 import os
 from os.path import isfile
 import datetime
+import hashlib
+try:
+    from sys import intern
+except ImportError:  # python 2, intern is a builtin
+    pass
 
 from quast_libs import qconfig, qutils
 from quast_libs.ca_utils.analyze_misassemblies import Mapping
-from quast_libs.ca_utils.misc import minimap_fpath, parse_cs_tag
+from quast_libs.ca_utils.coords_store import CoordsWriter, get_store_fpath, remove_coords
+from quast_libs.ca_utils.cs_tag import CsTag, MATCH, MISMATCH, INSERTION, DELETION
+from quast_libs.ca_utils.misc import minimap_fpath
 
 from quast_libs.log import get_logger
 from quast_libs.qconfig import SPLIT_ALIGN_THRESHOLD
-from quast_libs.qutils import md5, is_non_empty_file
+from quast_libs.qutils import file_checksum, is_non_empty_file
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -32,8 +39,8 @@ class AlignerStatus:
 
 def create_successful_check(fpath, contigs_fpath, ref_fpath):
     successful_check_file = open(fpath, 'w')
-    successful_check_file.write("Assembly md5 checksum: %s\n" % md5(contigs_fpath))
-    successful_check_file.write("Reference md5 checksum: %s\n" % md5(ref_fpath))
+    successful_check_file.write("Assembly md5 checksum: %s\n" % file_checksum(contigs_fpath))
+    successful_check_file.write("Reference md5 checksum: %s\n" % file_checksum(ref_fpath))
     successful_check_file.write("Successfully finished on " +
                                        datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S') + '\n')
     successful_check_file.close()
@@ -43,32 +50,33 @@ def check_successful_check(fpath, contigs_fpath, ref_fpath):
     successful_check_content = open(fpath).read().split('\n')
     if len(successful_check_content) < 2:
         return False
-    if successful_check_content[0].strip().split()[-1] != str(md5(contigs_fpath)):
+    if successful_check_content[0].strip().split()[-1] != str(file_checksum(contigs_fpath)):
         return False
-    if successful_check_content[1].strip().split()[-1] != str(md5(ref_fpath)):
+    if successful_check_content[1].strip().split()[-1] != str(file_checksum(ref_fpath)):
         return False
     return True
 
 
-def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):  # run minimap2 for AGB
+def get_minimap_preset():
+    if qconfig.is_agb_mode or qconfig.min_IDY < 90:
+        return 'asm20'
+    elif qconfig.min_IDY < 95:
+        return 'asm10'
+    return 'asm5'
+
+
+def get_minimap_agb_cmdline(ref_fpath, contigs_fpath, max_threads):  # run minimap2 for AGB
     mask_level = '1' if qconfig.min_IDY < 95 else '0.9'
-    cmdline = [minimap_fpath(), '-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
+    cmdline = [minimap_fpath(), '-cx', get_minimap_preset(), '--mask-level', mask_level, '-N', '100',
                '--score-N', '0', '-E', '1,0', '-f', '200', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
-    return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
-                                         indent='  ' + qutils.index_to_str(index))
-    return return_code
+    return cmdline
 
 
-def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):
+def get_minimap_cmdline(ref_fpath, contigs_fpath, max_threads):
     if qconfig.is_agb_mode:
-        return run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads)
+        return get_minimap_agb_cmdline(ref_fpath, contigs_fpath, max_threads)
 
-    if qconfig.min_IDY < 90:
-        preset = 'asm20'
-    elif qconfig.min_IDY < 95:
-        preset = 'asm10'
-    else:
-        preset = 'asm5'
+    preset = get_minimap_preset()
     # -s -- min CIGAR score, -z -- affects how often to stop alignment extension, -B -- mismatch penalty
     # -O -- gap penalty, -r -- max gap size
     mask_level = '1' if qconfig.is_combined_ref else '0.9'
@@ -77,10 +85,81 @@ def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_t
                           '-N', num_alignments, '-s', str(qconfig.min_alignment), '-z', '200']
     cmdline = [minimap_fpath(), '-c', '-x', preset] + (additional_options if not qconfig.large_genome else []) + \
               ['--mask-level', mask_level, '--min-occ', '200', '-g', '2500', '--score-N', '2', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
-    return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
-                                         indent='  ' + qutils.index_to_str(index))
-
-    return return_code
+    return cmdline
+
+
+def get_minimap_index_fpath(ref_fpath, index_dirpath):
+    # minimizers depend only on the preset (k-mer and window sizes), the mapping options are applied
+    # to the prebuilt index, so the index is identified by the reference content and the preset
+    index_options = ' '.join(['-x', get_minimap_preset()])
+    index_key = hashlib.md5((file_checksum(ref_fpath) + ' ' + index_options).encode('utf-8')).hexdigest()
+    return os.path.join(index_dirpath, qutils.name_from_fpath(ref_fpath) + '.' + index_key[:16] + '.mmi')
+
+
+def build_minimap_index(ref_fpath, index_dirpath, max_threads):
+    """
+        Builds minimap2 index of the reference to share it among all assemblies (it is built once
+        and reused by later runs with the same reference and preset). Returns None if it failed
+    """
+    if not os.path.isdir(index_dirpath):
+        os.makedirs(index_dirpath)
+    index_fpath = get_minimap_index_fpath(ref_fpath, index_dirpath)
+    if is_non_empty_file(index_fpath):
+        logger.info('  Using existing reference index ' + qutils.relpath(index_fpath) + '...')
+        return index_fpath
+
+    logger.info('  Building reference index...')
+    # other runs sharing the directory may build the same index at the same time and should not see an incomplete one
+    tmp_index_fpath = index_fpath + '.' + str(os.getpid()) + '.tmp'
+    stderr_fpath = index_fpath + '.' + str(os.getpid()) + '.stderr'
+    cmdline = [minimap_fpath(), '-x', get_minimap_preset(), '-t', str(max_threads), '-d', tmp_index_fpath, ref_fpath]
+    return_code = qutils.call_subprocess(cmdline, stdout=open(os.devnull, 'w'), stderr=open(stderr_fpath, 'w'),
+                                         indent='  ')
+    if return_code == 0 and is_non_empty_file(tmp_index_fpath) and not is_non_empty_file(index_fpath):
+        try:
+            os.rename(tmp_index_fpath, index_fpath)
+        except OSError:
+            pass
+    if isfile(tmp_index_fpath):
+        os.remove(tmp_index_fpath)
+    if not is_non_empty_file(index_fpath):
+        logger.warning('  Failed building reference index, contigs will be aligned to the reference sequences. '
+                       'See ' + qutils.relpath(stderr_fpath) + ' for details.')
+        return None
+    if isfile(stderr_fpath):
+        os.remove(stderr_fpath)
+    return index_fpath
+
+
+def run_minimap(coords_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads, ref_index_fpath=None):
+    """
+        Runs minimap2 with its output read through a pipe, the alignments are filtered as they arrive
+        and written into the coords file. Returns the exit code, the number of read PAF lines
+        and the filtered alignments
+    """
+    indent = '  ' + qutils.index_to_str(index)
+    cmdline = get_minimap_cmdline(ref_index_fpath or ref_fpath, contigs_fpath, max_threads)
+    log_err_f = open(log_err_fpath, 'a')
+    proc = qutils.open_subprocess_pipe(cmdline, stderr=log_err_f, indent=indent)
+    raw_lines_counter = [0]
+
+    def _read_lines():
+        for line in proc.stdout:
+            raw_lines_counter[0] += 1
+            yield line
+
+    aligns = []
+    coords_writer = CoordsWriter(coords_fpath, compress=not qconfig.no_gzip)
+    try:
+        for align in parse_minimap_output(_read_lines()):
+            coords_writer.write_align(align)
+            align.idy = float(align.idy)  # the same values as if the line was read by Mapping.from_line
+            aligns.append(align)
+        coords_writer.close()
+    finally:  # minimap2 is stopped and waited for even if the filter failed
+        return_code = qutils.wait_subprocess_pipe(proc, stderr=log_err_f, indent=indent)
+        log_err_f.close()
+    return return_code, raw_lines_counter[0], aligns
 
 
 def get_aux_out_fpaths(fname):
@@ -91,157 +170,180 @@ def get_aux_out_fpaths(fname):
     return coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath
 
 
-def parse_minimap_output(raw_coords_fpath, coords_fpath):
+def parse_minimap_output(raw_lines):
+    """
+        Parses minimap2 PAF lines, yields the alignments passing the identity filter
+        (the lines with a low identity are split into smaller alignments)
+    """
     cigar_pattern = re.compile(r'(\d+[M=XIDNSH])')
 
-    with open(raw_coords_fpath) as f:
-        with open(coords_fpath, 'w') as coords_file:
-            for line in f:
-                fs = line.split('\t')
-                if len(fs) < 10:
-                    continue
-                contig, align_start, align_end, strand, ref_name, ref_start = \
-                    fs[0], fs[2], fs[3], fs[4], fs[5], fs[7]
-                align_start, align_end, ref_start = map(int, (align_start, align_end, ref_start))
-                align_start += 1
-                ref_start += 1
-                if fs[-1].startswith('cs'):
-                    cs = fs[-1].strip()
-                    cigar = fs[-2]
-                else:
-                    cs = ''
-                    cigar = fs[-1]
-                cigar = cigar.split(':')[-1]
-
-                strand_direction = 1
-                if strand == '-':
-                    align_start, align_end = align_end, align_start
-                    strand_direction = -1
-                align_len = 0
-                ref_len = 0
-                matched_bases, bases_in_mapping = map(int, (fs[9], fs[10]))
-                operations = cigar_pattern.findall(cigar)
-
-                for op in operations:
-                    n_bases, operation = int(op[:-1]), op[-1]
-                    if operation == 'S' or operation == 'H':
-                        align_start += n_bases
-                    elif operation == 'M' or operation == '=' or operation == 'X':
-                        align_len += n_bases
-                        ref_len += n_bases
-                    elif operation == 'D':
-                        ref_len += n_bases
-                    elif operation == 'I':
-                        align_len += n_bases
-
-                align_end = align_start + (align_len - 1) * strand_direction
-                ref_end = ref_start + ref_len - 1
-
-                idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
-                if ref_name != "*":
-                    if float(idy) >= qconfig.min_IDY:
-                        align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
-                                        len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
-                        coords_file.write(align.coords_str() + '\n')
-                    else:
-                        split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs)
-
-
-def split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs):
+    for line in raw_lines:
+        fs = line.split('\t')
+        if len(fs) < 10:
+            continue
+        contig, align_start, align_end, strand, ref_name, ref_start = \
+            intern(fs[0]), fs[2], fs[3], fs[4], intern(fs[5]), fs[7]
+        align_start, align_end, ref_start = map(int, (align_start, align_end, ref_start))
+        align_start += 1
+        ref_start += 1
+        if fs[-1].startswith('cs'):
+            cs = fs[-1].strip()
+            cigar = fs[-2]
+        else:
+            cs = ''
+            cigar = fs[-1]
+        cigar = cigar.split(':')[-1]
+
+        strand_direction = 1
+        if strand == '-':
+            align_start, align_end = align_end, align_start
+            strand_direction = -1
+        align_len = 0
+        ref_len = 0
+        matched_bases, bases_in_mapping = map(int, (fs[9], fs[10]))
+        operations = cigar_pattern.findall(cigar)
+
+        for op in operations:
+            n_bases, operation = int(op[:-1]), op[-1]
+            if operation == 'S' or operation == 'H':
+                align_start += n_bases
+            elif operation == 'M' or operation == '=' or operation == 'X':
+                align_len += n_bases
+                ref_len += n_bases
+            elif operation == 'D':
+                ref_len += n_bases
+            elif operation == 'I':
+                align_len += n_bases
+
+        align_end = align_start + (align_len - 1) * strand_direction
+        ref_end = ref_start + ref_len - 1
+
+        idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
+        if ref_name != "*":
+            if float(idy) >= qconfig.min_IDY:
+                yield Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
+                              len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
+            else:
+                for align in split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
+                    yield align
+
+
+def split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
     def _write_align():
-        if align.len2 < qconfig.min_alignment or not align.len1 or not align.cigar:
+        if align.len2 < qconfig.min_alignment or not align.len1 or first_op >= last_op:
             return
         align.e1 = align.s1 + align.len1 - 1
         align.e2 = align.s2 + (align.len2 - 1) * strand_direction
         align.idy = '%.2f' % (matched_bases * 100.0 / max(align.len1, align.len2))
         if float(align.idy) >= qconfig.min_IDY:
-            coords_file.write(align.coords_str() + '\n')
+            align.cigar = tag.substring(first_op, last_op)
+            split_aligns.append(align.clone())
 
-    def _try_split(matched_bases, prev_op, n_refbases=0, n_alignbases=0):
+    def _try_split(matched_bases, op_idx, n_ops, n_refbases=0, n_alignbases=0):
         ## split alignment in positions of indels or stretch of mismatches to get smaller alignments with higher identity
+        ## (operations op_idx..op_idx + n_ops - 1), returns the index of the first operation of the current alignment
         if n_alignbases > SPLIT_ALIGN_THRESHOLD or n_refbases > SPLIT_ALIGN_THRESHOLD:
             _write_align()
             align.s1 += align.len1 + n_refbases
             align.s2 += (align.len2 + n_alignbases) * strand_direction
             align.len1, align.len2 = 0, 0
-            align.cigar = ''
-            matched_bases = 0
-        else:
-            align.len1 += n_refbases
-            align.len2 += n_alignbases
-            align.cigar += prev_op
-        return matched_bases
+            return 0, op_idx + n_ops
+        align.len1 += n_refbases
+        align.len2 += n_alignbases
+        return matched_bases, first_op
 
+    split_aligns = []
     matched_bases = 0
     align = Mapping(s1=ref_start, e1=ref_start, s2=align_start, e2=align_start, len1=0,
                     len2=0, ref=ref_name, contig=contig, cigar='')
-    cur_mismatch_stretch = ''
-    for op in parse_cs_tag(cs):
-        if op.startswith('*'):
-            cur_mismatch_stretch += op
+    # the cs string of the current alignment is the part of the original one with operations first_op..last_op - 1
+    tag = CsTag(cs)
+    first_op, last_op = 0, 0
+    mismatch_stretch_start = None
+    for op_idx, (code, n_bases, _, _) in enumerate(tag):
+        if code == MISMATCH:
+            if mismatch_stretch_start is None:
+                mismatch_stretch_start = op_idx
             continue
-        if cur_mismatch_stretch:
-            n_bases = cur_mismatch_stretch.count('*')
-            matched_bases = _try_split(matched_bases, cur_mismatch_stretch, n_bases, n_bases)
-        cur_mismatch_stretch = ''
-        if op.startswith(':'):
-            n_bases = int(op[1:])
-            align.cigar += op
+        if mismatch_stretch_start is not None:
+            n_mismatches = op_idx - mismatch_stretch_start
+            matched_bases, first_op = _try_split(matched_bases, mismatch_stretch_start, n_mismatches, n_mismatches, n_mismatches)
+            last_op = op_idx
+        mismatch_stretch_start = None
+        if code == MATCH:
             align.len1 += n_bases
             align.len2 += n_bases
             matched_bases += n_bases
-        else:
-            n_bases = len(op) - 1
-            if op.startswith('+'):
-                matched_bases = _try_split(matched_bases, op, n_alignbases=n_bases)
-            elif op.startswith('-'):
-                matched_bases = _try_split(matched_bases, op, n_refbases=n_bases)
+        elif code == INSERTION:
+            matched_bases, first_op = _try_split(matched_bases, op_idx, 1, n_alignbases=n_bases)
+        elif code == DELETION:
+            matched_bases, first_op = _try_split(matched_bases, op_idx, 1, n_refbases=n_bases)
+        last_op = op_idx + 1
     _write_align()
+    return split_aligns
+
+
+def get_coords_to_reuse_fpath(out_basename):
+    if qconfig.alignments_for_reuse_dirpath is not None and os.path.isdir(qconfig.alignments_for_reuse_dirpath):
+        _, coords_to_reuse_fname, _, _ = get_aux_out_fpaths(os.path.basename(out_basename))
+        coords_to_reuse_fpath = os.path.join(qconfig.alignments_for_reuse_dirpath, coords_to_reuse_fname)
+        if isfile(coords_to_reuse_fpath):
+            return coords_to_reuse_fpath
+    return None
+
+
+def has_existing_alignments(output_fpath, out_basename, ref_fpath, old_contigs_fpath):
+    successful_check_fpath = out_basename + '.sf'
+    return isfile(successful_check_fpath) and isfile(output_fpath) and \
+           check_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
 
 
-def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads, log_out_fpath, log_err_fpath):
+def is_alignment_needed(output_fpath, out_basename, ref_fpath, old_contigs_fpath):
+    return get_coords_to_reuse_fpath(out_basename) is None and \
+           not has_existing_alignments(output_fpath, out_basename, ref_fpath, old_contigs_fpath)
+
+
+def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads, log_out_fpath, log_err_fpath,
+                  ref_index_fpath=None):
+    """
+        Returns the aligner status and the filtered alignments if they were just computed
+        (None if the existing or reused alignments should be read from the coords file)
+    """
     log_out_f = open(log_out_fpath, 'w')
 
     successful_check_fpath = out_basename + '.sf'
     log_out_f.write('Aligning contigs to reference...\n')
 
     # Special case: if there is a need to reuse alignments from the combined_reference stage
-    if qconfig.alignments_for_reuse_dirpath is not None and os.path.isdir(qconfig.alignments_for_reuse_dirpath):
-        _, coords_to_reuse_fname, _, _ = get_aux_out_fpaths(os.path.basename(out_basename))
-        coords_to_reuse_fpath = os.path.join(qconfig.alignments_for_reuse_dirpath, coords_to_reuse_fname)
-        if isfile(coords_to_reuse_fpath):
-            # symlink coords.filtered from combined_reference stage to coords in the current run
-            if isfile(output_fpath):
-                os.remove(output_fpath)
-            os.symlink(os.path.relpath(coords_to_reuse_fpath, os.path.dirname(output_fpath)), output_fpath)
-            log_out_f.write('\tReusing alignments from the combined_reference stage...\n')
-            logger.info('  ' + qutils.index_to_str(index) + 'Reusing alignments from the combined_reference stage... ')
-            return AlignerStatus.OK
+    coords_to_reuse_fpath = get_coords_to_reuse_fpath(out_basename)
+    if coords_to_reuse_fpath:
+        # symlink coords.filtered from combined_reference stage to coords in the current run
+        remove_coords(output_fpath)
+        for src_fpath, dst_fpath in [(coords_to_reuse_fpath, output_fpath),
+                                     (get_store_fpath(coords_to_reuse_fpath), get_store_fpath(output_fpath))]:
+            if isfile(src_fpath):
+                os.symlink(os.path.relpath(src_fpath, os.path.dirname(dst_fpath)), dst_fpath)
+        log_out_f.write('\tReusing alignments from the combined_reference stage...\n')
+        logger.info('  ' + qutils.index_to_str(index) + 'Reusing alignments from the combined_reference stage... ')
+        return AlignerStatus.OK, None
     qconfig.alignments_for_reuse_dirpath = None
 
     # Checking if there are existing previous alignments.
     # If they exist, using them to save time.
-    if isfile(successful_check_fpath) and isfile(output_fpath):
-        if check_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath):
-            log_out_f.write('\tUsing existing alignments...\n')
-            logger.info('  ' + qutils.index_to_str(index) + 'Using existing alignments... ')
-            return AlignerStatus.OK
+    if has_existing_alignments(output_fpath, out_basename, ref_fpath, old_contigs_fpath):
+        log_out_f.write('\tUsing existing alignments...\n')
+        logger.info('  ' + qutils.index_to_str(index) + 'Using existing alignments... ')
+        return AlignerStatus.OK, None
 
     log_out_f.write('\tAligning contigs to the reference\n')
     logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
 
-    tmp_output_fpath = output_fpath + '_tmp'
-    exit_code = run_minimap(tmp_output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads)
-    if exit_code != 0:
-        return AlignerStatus.ERROR
-
-    if not isfile(tmp_output_fpath):
-        return AlignerStatus.FAILED
-    if not is_non_empty_file(tmp_output_fpath):
-        return AlignerStatus.NOT_ALIGNED
-
-    create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
     log_out_f.write('Filtering alignments...\n')
-    parse_minimap_output(tmp_output_fpath, output_fpath)
-    return AlignerStatus.OK
+    exit_code, raw_lines_count, aligns = run_minimap(output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads,
+                                                    ref_index_fpath)
+    if exit_code != 0 or not raw_lines_count:
+        remove_coords(output_fpath)
+        return (AlignerStatus.ERROR if exit_code != 0 else AlignerStatus.NOT_ALIGNED), None
 
+    create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+    return AlignerStatus.OK, aligns
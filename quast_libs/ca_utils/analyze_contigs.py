@@ -6,10 +6,15 @@
 ############################################################################
 from collections import defaultdict
 
-from quast_libs import fastaparser, qconfig
+from quast_libs import executors, fastaparser, qconfig
 from quast_libs.ca_utils.analyze_misassemblies import process_misassembled_contig, IndelsInfo, find_all_sv, Misassembly
 from quast_libs.ca_utils.best_set_selection import get_best_aligns_sets, get_used_indexes, score_single_align
+from quast_libs.ca_utils.coords_store import CoordsBuffer
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes
+from quast_libs.qutils import imap_parallel
+
+SHARDS_PER_THREAD = 4
+ALIGN_WEIGHT = 1000  # contig bases which take as much time to analyze as one alignment
 
 
 def add_potential_misassembly(ref, misassemblies_by_ref, refs_with_translocations):
@@ -91,8 +96,73 @@ def save_unaligned_info(sorted_aligns, contig, ctg_len, unaligned_len, unaligned
     unaligned_info_file.write('\t'.join([contig, str(ctg_len), str(unaligned_len), unaligned_type, unaligned_parts_str]) + '\n')
 
 
-def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, ref_lens,
-                    is_cyclic=None):
+class _TextBuffer(object):
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+def get_contigs_shards(contigs_fpath, aligns, threads):
+    """
+    Splits contigs into consecutive shards of similar weights (contig length and alignments)
+    for the parallel analysis. Returns list of (contig names, weight) or None if contigs should be analyzed serially
+    """
+    if threads <= 1 or qconfig.memory_efficient or executors.is_worker():
+        return None
+    entries = fastaparser.get_fasta_index(contigs_fpath)
+    names = [entry.name for entry in entries]
+    if len(names) < 2 or len(set(names)) < len(names):  # shards are read by contig names
+        return None
+    weights = [entry.length + ALIGN_WEIGHT * len(aligns.get(entry.name, [])) for entry in entries]
+    # there are more shards than threads, so the largest shards are started first and the rest fill the gaps
+    n_shards = min(len(names), threads * SHARDS_PER_THREAD)
+    shard_weight = float(sum(weights)) / n_shards
+    shards = []
+    cur_names, cur_weight = [], 0
+    for name, weight in zip(names, weights):
+        cur_names.append(name)
+        cur_weight += weight
+        if cur_weight >= shard_weight:
+            shards.append((cur_names, cur_weight))
+            cur_names, cur_weight = [], 0
+    if cur_names:
+        shards.append((cur_names, cur_weight))
+    return shards if len(shards) > 1 else None
+
+
+def merge_contigs_stats(stats, part_stats):
+    """
+    Adds statistics of the next part of contigs to the statistics of the previous parts (None for the first part)
+    """
+    if stats is None:
+        return part_stats
+    for name in ['unaligned', 'partially_unaligned', 'fully_unaligned_bases', 'partially_unaligned_bases',
+                 'ambiguous_contigs', 'ambiguous_contigs_extra_bases', 'ambiguous_contigs_len',
+                 'half_unaligned_with_misassembly', 'misassembly_internal_overlap']:
+        stats[name] += part_stats[name]
+    for name in ['region_misassemblies', 'aligned_lengths', 'contigs_aligned_lengths', 'misassemblies_in_contigs']:
+        stats[name].extend(part_stats[name])
+    for name in ['ref_aligns', 'misassemblies_by_ref']:
+        for ref, values in part_stats[name].items():
+            stats[name].setdefault(ref, []).extend(values)
+    stats['misassembled_contigs'].update(part_stats['misassembled_contigs'])
+    for ref, translocations in part_stats['istranslocations_by_ref'].items():
+        for other_ref, count in translocations.items():
+            stats['istranslocations_by_ref'][ref][other_ref] += count
+    stats['total_indels_info'] += part_stats['total_indels_info']
+    return stats
+
+
+def analyze_contigs_part(ca_output, contigs, aligns, ref_features, ref_lens, is_cyclic, region_struct_variations,
+                         unaligned_file, unaligned_info_file):
+    """
+    Analyzes contigs (pairs of name and sequence) and returns the statistics, see merge_contigs_stats
+    """
     maxun = 10
     epsilon = 0.99
 
@@ -113,8 +183,6 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
     misassembled_contigs = dict()
     misassemblies_in_contigs = []
 
-    region_struct_variations = find_all_sv(qconfig.bed)
-
     istranslocations_by_ref = dict()
     misassemblies_by_ref = defaultdict(list)
     for ref in ref_labels_by_chromosomes.values():
@@ -123,10 +191,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
     # for counting SNPs and indels (both original (.all_snps) and corrected from local misassemblies)
     total_indels_info = IndelsInfo()
 
-    unaligned_file = open(unaligned_fpath, 'w')
-    unaligned_info_file = open(unaligned_info_fpath, 'w')
-    unaligned_info_file.write('\t'.join(['Contig', 'Total_length', 'Unaligned_length', 'Unaligned_type', 'Unaligned_parts']) + '\n')
-    for contig, seq in fastaparser.read_fasta(contigs_fpath):
+    for contig, seq in contigs:
         #Recording contig stats
         ctg_len = len(seq)
         ca_output.stdout_f.write('CONTIG: %s (%dbp)\n' % (contig, ctg_len))
@@ -172,7 +237,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                     ca_output.stdout_f.write('\t\tOne align captures most of this contig: %s\n' % str(top_aligns[0]))
                     ca_output.icarus_out_f.write(top_aligns[0].icarus_report_str() + '\n')
                     ref_aligns.setdefault(top_aligns[0].ref, []).append(top_aligns[0])
-                    ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + '\n')
+                    ca_output.coords_filtered_f.write_align(top_aligns[0])
                     aligned_lengths.append(top_aligns[0].len2)
                     contigs_aligned_lengths[-1] = top_aligns[0].len2
                 else:
@@ -198,7 +263,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                         ref_aligns.setdefault(top_aligns[0].ref, []).append(top_aligns[0])
                         aligned_lengths.append(top_aligns[0].len2)
                         contigs_aligned_lengths[-1] = top_aligns[0].len2
-                        ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + '\n')
+                        ca_output.coords_filtered_f.write_align(top_aligns[0])
                         top_aligns = top_aligns[1:]
                         for align in top_aligns:
                             ca_output.stdout_f.write('\t\t\tSkipping alignment ' + str(align) + '\n')
@@ -211,7 +276,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                         while len(top_aligns):
                             ca_output.stdout_f.write('\t\t\tAlignment: %s\n' % str(top_aligns[0]))
                             ca_output.icarus_out_f.write(top_aligns[0].icarus_report_str(ambiguity=True) + '\n')
-                            ca_output.coords_filtered_f.write(top_aligns[0].coords_str() + ('\n' if first_alignment else ' ambiguous\n'))
+                            ca_output.coords_filtered_f.write_align(top_aligns[0], ambiguous=not first_alignment)
                             ref_aligns.setdefault(top_aligns[0].ref, []).append(top_aligns[0])
                             if first_alignment:
                                 first_alignment = False
@@ -264,7 +329,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                             ca_output.stdout_f.write('\t\tAlignment: %s\n' % str(align))
                             ref_aligns.setdefault(align.ref, []).append(align)
                             ambiguous_contigs_extra_bases += align.len2
-                            ca_output.coords_filtered_f.write(align.coords_str() + " ambiguous\n")
+                            ca_output.coords_filtered_f.write_align(align, ambiguous=True)
                             ca_output.icarus_out_f.write(align.icarus_report_str(is_best=False) + '\n')
 
                 ca_output.stdout_f.write('\t\t\tThe best set is below. Score: %.1f, number of alignments: %d, unaligned bases: %d\n' % \
@@ -276,7 +341,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                     the_only_align = real_aligns[0]
 
                     #There is only one alignment of this contig to the reference
-                    ca_output.coords_filtered_f.write(the_only_align.coords_str() + '\n')
+                    ca_output.coords_filtered_f.write_align(the_only_align)
                     aligned_lengths.append(the_only_align.len2)
                     contigs_aligned_lengths[-1] = the_only_align.len2
 
@@ -342,7 +407,7 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
                             ca_output.stdout_f.write('\t\tAlignment: %s\n' % str(align))
                             ca_output.icarus_out_f.write(align.icarus_report_str() + '\n')
                             ca_output.icarus_out_f.write('unknown\n')
-                            ca_output.coords_filtered_f.write(align.coords_str() + '\n')
+                            ca_output.coords_filtered_f.write_align(align)
                             aligned_lengths.append(align.len2)
                             ref_aligns.setdefault(align.ref, []).append(align)
 
@@ -385,24 +450,83 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
         ca_output.icarus_out_f.write('\t'.join(['CONTIG', contig, str(ctg_len), contig_type]) + '\n')
         ca_output.stdout_f.write('\n')
 
+    return {'unaligned': unaligned, 'partially_unaligned': partially_unaligned,
+            'fully_unaligned_bases': fully_unaligned_bases, 'partially_unaligned_bases': partially_unaligned_bases,
+            'ambiguous_contigs': ambiguous_contigs, 'ambiguous_contigs_extra_bases': ambiguous_contigs_extra_bases,
+            'ambiguous_contigs_len': ambiguous_contigs_len,
+            'half_unaligned_with_misassembly': half_unaligned_with_misassembly,
+            'misassembly_internal_overlap': misassembly_internal_overlap,
+            'region_misassemblies': region_misassemblies, 'aligned_lengths': aligned_lengths,
+            'contigs_aligned_lengths': contigs_aligned_lengths, 'misassemblies_in_contigs': misassemblies_in_contigs,
+            'ref_aligns': ref_aligns, 'misassemblies_by_ref': misassemblies_by_ref,
+            'misassembled_contigs': misassembled_contigs, 'istranslocations_by_ref': istranslocations_by_ref,
+            'total_indels_info': total_indels_info}
+
+
+def analyze_contigs_shard(contigs_fpath, names, aligns, ref_features, ref_lens, is_cyclic, region_struct_variations):
+    """
+    Analyzes the contigs with the specified names in a worker, the outputs are returned as texts
+    (log, Icarus, misassemblies, unaligned contigs and unaligned info) and buffered alignments of the coords file
+    """
+    from quast_libs.contigs_analyzer import CAOutput
+
+    outputs = [_TextBuffer() for _ in range(5)]
+    stdout_f, icarus_out_f, misassembly_f, unaligned_file, unaligned_info_file = outputs
+    coords_buffer = CoordsBuffer()
+    ca_output = CAOutput(stdout_f=stdout_f, misassembly_f=misassembly_f, coords_filtered_f=coords_buffer,
+                         icarus_out_f=icarus_out_f)
+    contigs = fastaparser.read_fasta_entries(contigs_fpath, names)
+    stats = analyze_contigs_part(ca_output, contigs, aligns, ref_features, ref_lens, is_cyclic,
+                                 region_struct_variations, unaligned_file, unaligned_info_file)
+    return [output.getvalue() for output in outputs], coords_buffer, stats
+
+
+def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, ref_lens,
+                    is_cyclic=None, threads=1):
+    region_struct_variations = find_all_sv(qconfig.bed)
+
+    unaligned_file = open(unaligned_fpath, 'w')
+    unaligned_info_file = open(unaligned_info_fpath, 'w')
+    unaligned_info_file.write('\t'.join(['Contig', 'Total_length', 'Unaligned_length', 'Unaligned_type', 'Unaligned_parts']) + '\n')
+    shards = get_contigs_shards(contigs_fpath, aligns, threads)
+    if shards:
+        stats = None
+        shards_args = [(contigs_fpath, names, dict((name, aligns[name]) for name in names if name in aligns),
+                        ref_features, ref_lens, is_cyclic, region_struct_variations) for names, weight in shards]
+        # shards are analyzed in parallel, their outputs are written in the order of contigs
+        for outputs, coords_buffer, part_stats in imap_parallel(analyze_contigs_shard, shards_args, threads,
+                                                                 task_sizes=[weight for names, weight in shards]):
+            for out_f, text in zip([ca_output.stdout_f, ca_output.icarus_out_f, ca_output.misassembly_f,
+                                    unaligned_file, unaligned_info_file], outputs):
+                out_f.write(text)
+            coords_buffer.write_to(ca_output.coords_filtered_f)
+            stats = merge_contigs_stats(stats, part_stats)
+    else:
+        stats = analyze_contigs_part(ca_output, fastaparser.read_fasta(contigs_fpath), aligns, ref_features, ref_lens,
+                                     is_cyclic, region_struct_variations, unaligned_file, unaligned_info_file)
     unaligned_file.close()
     unaligned_info_file.close()
+    misassembled_contigs = stats['misassembled_contigs']
     misassembled_bases = sum(misassembled_contigs.values())
 
     # special case: --skip-unaligned-mis-contigs is specified
+    half_unaligned_with_misassembly = stats['half_unaligned_with_misassembly']
     if qconfig.unaligned_mis_threshold == 0.0:
         half_unaligned_with_misassembly = None
 
-    result = {'region_misassemblies': region_misassemblies,
+    result = {'region_misassemblies': stats['region_misassemblies'],
               'misassembled_contigs': misassembled_contigs, 'misassembled_bases': misassembled_bases,
-              'misassembly_internal_overlap': misassembly_internal_overlap,
-              'unaligned': unaligned, 'partially_unaligned': partially_unaligned,
-              'partially_unaligned_bases': partially_unaligned_bases, 'fully_unaligned_bases': fully_unaligned_bases,
-              'aligned_assembly_bases': sum(contigs_aligned_lengths),
-              'ambiguous_contigs': ambiguous_contigs, 'ambiguous_contigs_extra_bases': ambiguous_contigs_extra_bases,
-              'ambiguous_contigs_len': ambiguous_contigs_len,
+              'misassembly_internal_overlap': stats['misassembly_internal_overlap'],
+              'unaligned': stats['unaligned'], 'partially_unaligned': stats['partially_unaligned'],
+              'partially_unaligned_bases': stats['partially_unaligned_bases'],
+              'fully_unaligned_bases': stats['fully_unaligned_bases'],
+              'aligned_assembly_bases': sum(stats['contigs_aligned_lengths']),
+              'ambiguous_contigs': stats['ambiguous_contigs'],
+              'ambiguous_contigs_extra_bases': stats['ambiguous_contigs_extra_bases'],
+              'ambiguous_contigs_len': stats['ambiguous_contigs_len'],
               'half_unaligned_with_misassembly': half_unaligned_with_misassembly,
-              'misassemblies_by_ref': misassemblies_by_ref,
-              'istranslocations_by_refs': istranslocations_by_ref}
+              'misassemblies_by_ref': stats['misassemblies_by_ref'],
+              'istranslocations_by_refs': stats['istranslocations_by_ref']}
 
-    return result, ref_aligns, total_indels_info, aligned_lengths, misassembled_contigs, misassemblies_in_contigs, contigs_aligned_lengths
\ No newline at end of file
+    return result, stats['ref_aligns'], stats['total_indels_info'], stats['aligned_lengths'], misassembled_contigs, \
+           stats['misassemblies_in_contigs'], stats['contigs_aligned_lengths']
@@ -7,9 +7,14 @@
 
 from __future__ import with_statement
 from __future__ import division
+try:
+    from sys import intern
+except ImportError:  # python 2, intern is a builtin
+    pass
 
 from quast_libs import qconfig
-from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome, parse_cs_tag
+from quast_libs.ca_utils.cs_tag import get_cs_tag
+from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -47,9 +52,13 @@ class StructuralVariations(object):
 
 
 class Mapping(object):
+    # there may be millions of alignments, so they are kept without per-instance dicts
+    __slots__ = ('s1', 'e1', 's2', 'e2', 'len1', 'len2', 'idy', 'ref', 'contig', '_cigar', '_cs_tag', 'ns_pos', 'sv_type')
+
     def __init__(self, s1, e1, s2=None, e2=None, len1=None, len2=None, idy=None, ref=None, contig=None, cigar=None, ns_pos=None, sv_type=None):
         self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig = s1, e1, s2, e2, len1, len2, idy, ref, contig
-        self.cigar = cigar
+        self._cigar = cigar
+        self._cs_tag = None
         self.ns_pos = ns_pos
         self.sv_type = sv_type
 
@@ -59,13 +68,43 @@ class Mapping(object):
         # 4324128  4496883  |   112426   285180  |   172755   172756  |  99.9900  | gi|48994873|gb|U00096.2|  NODE_333_length_285180_cov_221082  | cs:Z::172755
         line = line.split()
         assert line[2] == line[5] == line[8] == line[10] == line[13] == '|', line
-        ref = line[11]
-        contig = line[12]
+        ref = intern(line[11])  # names are shared by all alignments of the same reference/contig
+        contig = intern(line[12])
         s1, e1, s2, e2, len1, len2 = [int(line[i]) for i in [0, 1, 3, 4, 6, 7]]
         idy = float(line[9])
         cigar = line[14]
         return Mapping(s1, e1, s2, e2, len1, len2, idy, ref, contig, cigar)
 
+    @property
+    def cigar(self):
+        if self._cigar is None and self._cs_tag is not None:
+            self._cigar = str(self._cs_tag)
+        return self._cigar
+
+    @cigar.setter
+    def cigar(self, cigar):
+        self._cigar = cigar
+        self._cs_tag = None
+
+    @property
+    def cs_tag(self):
+        """cs tag tokenized on the first use, the string is built from the tag only when it is needed"""
+        if self._cs_tag is None:
+            self._cs_tag = get_cs_tag(self._cigar or '')
+        return self._cs_tag
+
+    @cs_tag.setter
+    def cs_tag(self, cs_tag):
+        self._cs_tag = cs_tag
+        self._cigar = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
     def __str__(self):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2, '|',
                                          self.idy, '|', self.ref, self.contig])
@@ -81,7 +120,9 @@ class Mapping(object):
         return '\t'.join(str(x) for x in [self.s1, self.e1, self.s2, self.e2, self.ref, self.contig, self.idy, ambiguity, is_best])
 
     def clone(self):
-        return Mapping(self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig, self.cigar)
+        align = Mapping(self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig, self._cigar)
+        align._cs_tag = self._cs_tag
+        return align
 
     def start(self):
         """Return start on contig (always <= end)"""
@@ -330,55 +371,9 @@ def check_is_scaffold_gap(inconsistency, contig_seq, align1, align2):
 def exclude_internal_overlaps(align1, align2, i=None):
     # returns size of align1.len2 decrease (or 0 if not changed). It is important for cur_aligned_len calculation
     def __shift_cigar(align, new_start=None, new_end=None):
-        new_cigar = 'cs:Z:'
-        ctg_pos = align.s2
-        strand_direction = 1 if align.s2 < align.e2 else -1
-        diff_len = 0
-        if not align.cigar:
-            return diff_len
-
-        for op in parse_cs_tag(align.cigar):
-            if op.startswith('*'):
-                if (new_start and ctg_pos >= new_start) or \
-                        (new_end and ctg_pos <= new_end):
-                    new_cigar += op
-                ctg_pos += 1 * strand_direction
-            else:
-                if op.startswith(':'):
-                    n_bases = int(op[1:])
-                else:
-                    n_bases = len(op) - 1
-                corr_n_bases = n_bases
-                if new_end and (ctg_pos + n_bases * strand_direction > new_end or ctg_pos > new_end):
-                    corr_n_bases = new_end - ctg_pos + (n_bases if strand_direction == -1 else 1)
-                elif new_start and (ctg_pos < new_start or ctg_pos + n_bases * strand_direction < new_start):
-                    corr_n_bases = ctg_pos + (n_bases if strand_direction == 1 else 1) - new_start
-
-                if corr_n_bases < 1:
-                    if not op.startswith('-'):
-                        ctg_pos += n_bases * strand_direction
-                    if op.startswith('-'):
-                        diff_len -= n_bases
-                    if op.startswith('+'):
-                        diff_len += n_bases
-                    continue
-                if op.startswith('+'):
-                    ctg_pos += n_bases * strand_direction
-                    diff_len += (n_bases - corr_n_bases)
-                    if new_start:
-                        new_cigar += '+' + op[1 + (corr_n_bases - n_bases):]
-                    elif new_end:
-                        new_cigar += op[:corr_n_bases + 1]
-                elif op.startswith('-'):
-                    diff_len -= (n_bases - corr_n_bases)
-                    if new_start:
-                        new_cigar += '-' + op[1 + (corr_n_bases - n_bases):]
-                    elif new_end:
-                        new_cigar += op[:corr_n_bases + 1]
-                elif op.startswith(':'):
-                    ctg_pos += n_bases * strand_direction
-                    new_cigar += ':' + str(corr_n_bases)
-        align.cigar = new_cigar
+        if not align.cs_tag:
+            return 0
+        align.cs_tag, diff_len = align.cs_tag.trim(align.s2, 1 if align.s2 < align.e2 else -1, new_start, new_end)
         return diff_len
 
     def __shift_start(align, new_start, diff_len):
@@ -499,7 +494,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
         ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s\n' % (i+1, str(prev_align)))
 
         ref_aligns.setdefault(prev_align.ref, []).append(prev_align)
-        ca_output.coords_filtered_f.write(prev_align.coords_str() + '\n')
+        ca_output.coords_filtered_f.write_align(prev_align)
         prev_ref, next_ref = get_ref_by_chromosome(prev_align.ref), get_ref_by_chromosome(next_align.ref)
         if aux_data["is_sv"]:
             ca_output.stdout_f.write('\t\t\t  Not a misassembly (structural variation of the genome) between these two alignments\n')
@@ -623,7 +618,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
     ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s' % (i + 1, str(next_align)) + '\n')
     ca_output.icarus_out_f.write(next_align.icarus_report_str() + '\n')
     ref_aligns.setdefault(next_align.ref, []).append(next_align)
-    ca_output.coords_filtered_f.write(next_align.coords_str() + '\n')
+    ca_output.coords_filtered_f.write_align(next_align)
 
     contig_aligned_lengths.append(cur_aligned_length)
     contig_aligned_length = sum(contig_aligned_lengths)
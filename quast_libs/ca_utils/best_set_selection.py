@@ -5,16 +5,15 @@
 # See file LICENSE for details.
 ############################################################################
 
+from bisect import bisect_left
 from heapq import heappush, heappop
-try:
-   from collections import OrderedDict
-except ImportError:
-   from quast_libs.site_packages.ordered_dict import OrderedDict
 from quast_libs import qconfig
 from quast_libs.ca_utils.analyze_misassemblies import is_misassembly, exclude_internal_overlaps, Misassembly, \
     is_fragmented_ref_fake_translocation
 from quast_libs.ca_utils.misc import is_same_reference
 
+SCORE_EPS = 1e-6
+
 
 class ScoredSet(object):
     def __init__(self, score, indexes, uncovered):
@@ -23,6 +22,58 @@ class ScoredSet(object):
         self.uncovered = uncovered
 
 
+class ChainedScoredSet(object):
+    """
+    Scored set used in the dynamic programming. It keeps only its last alignment index and a reference
+    to the preceding set, so extending a set does not copy its indexes
+    """
+    __slots__ = ('score', 'uncovered', 'last_index', 'prev', 'size')
+
+    def __init__(self, score, uncovered, last_index=-1, prev=None):
+        self.score = score
+        self.uncovered = uncovered
+        self.last_index = last_index
+        self.prev = prev
+        self.size = prev.size + 1 if prev is not None else 0
+
+    @property
+    def indexes(self):
+        indexes = []
+        scored_set = self
+        while scored_set.size:
+            indexes.append(scored_set.last_index)
+            scored_set = scored_set.prev
+        return indexes[::-1]
+
+
+class ExtendedSetAligns(object):
+    """
+    Alignments of a scored set extended by a new alignment, as they are used by get_score (negative indexes only).
+    get_score modifies only the three last alignments, so only they are cloned,
+    the preceding ones are taken from sorted_aligns on demand
+    """
+    __slots__ = ('sorted_aligns', 'aligns', 'scored_set', 'size')
+    num_cloned = 3
+
+    def __init__(self, sorted_aligns, scored_set, align):
+        self.sorted_aligns = sorted_aligns
+        self.size = scored_set.size + 1
+        self.aligns = [align.clone()]  # in reversed order
+        while scored_set.size and len(self.aligns) < self.num_cloned:
+            self.aligns.append(sorted_aligns[scored_set.last_index].clone())
+            scored_set = scored_set.prev
+        self.scored_set = scored_set
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        while len(self.aligns) < -idx:
+            self.aligns.append(self.sorted_aligns[self.scored_set.last_index])
+            self.scored_set = self.scored_set.prev
+        return self.aligns[-idx - 1]
+
+
 class PutativeBestSet(object):
     def __init__(self, indexes, score_drop, uncovered):
         self.indexes = indexes
@@ -174,7 +225,8 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
 
     # Stage 1: Dynamic programming for finding the best score
     stdout_f.write('\t\t\tLooking for the best set of alignments (out of %d total alignments)\n' % len(sorted_aligns))
-    all_scored_sets = [ScoredSet(0, [], ctg_len)]
+    all_scored_sets = [ChainedScoredSet(0, ctg_len)]
+    max_scores = [0]  # max_scores[i] is the best score among all_scored_sets[:i + 1]
     max_score = 0
 
     cur_solid_idx = -1
@@ -186,19 +238,26 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
         if solids and align == solids[-1]:
             next_solid_idx = idx
             del solids[-1]
-        for scored_set in reversed(all_scored_sets):
-            if scored_set.indexes and scored_set.indexes[-1] < cur_solid_idx:
+        # adding an alignment cannot increase the score of a set by more than the score of the alignment itself,
+        # so the earlier sets with too low scores are not checked
+        max_gain = score_single_align(align, ctg_len=align.end() - align.start() + 1)
+        for set_idx in range(len(all_scored_sets) - 1, -1, -1):
+            scored_set = all_scored_sets[set_idx]
+            if scored_set.size and scored_set.last_index < cur_solid_idx:
+                break
+            if max_scores[set_idx] + max_gain <= local_max_score:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
+            cur_set_aligns = ExtendedSetAligns(sorted_aligns, scored_set, align)
             score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
                                          seq, region_struct_variations, penalties)
             if score is None:  # incorrect set, i.e. internal overlap excluding resulted in incorrectly short alignment
                 continue
             if score > local_max_score:
                 local_max_score = score
-                new_scored_set = ScoredSet(score, scored_set.indexes + [idx], uncovered)
+                new_scored_set = ChainedScoredSet(score, uncovered, idx, scored_set)
         if new_scored_set:
             all_scored_sets.append(new_scored_set)
+            max_scores.append(max(max_scores[-1], local_max_score))
             if local_max_score > max_score:
                 max_score = local_max_score
         if next_solid_idx != cur_solid_idx:
@@ -213,16 +272,17 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
         best_set = all_scored_sets.pop()
         while best_set.score != max_score:
             best_set = all_scored_sets.pop()
-        return False, False, sorted_aligns, [best_set]
+        return False, False, sorted_aligns, [ScoredSet(best_set.score, best_set.indexes, best_set.uncovered)]
 
     max_allowed_score_drop = max_score - max_score * qconfig.ambiguity_score
 
     putative_sets = []
     best_sets = []
+    set_last_indexes = [scored_set.last_index for scored_set in all_scored_sets]
     for scored_set in all_scored_sets:
         score_drop = max_score - scored_set.score
         if score_drop <= max_allowed_score_drop:
-            heappush(putative_sets, PutativeBestSet([scored_set.indexes[-1]], score_drop, scored_set.uncovered))
+            heappush(putative_sets, PutativeBestSet([scored_set.last_index], score_drop, scored_set.uncovered))
 
     ambiguity_check_is_needed = True
     too_much_best_sets = False
@@ -245,28 +305,35 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
             continue
         # the main part: trying to enlarge the set to the left (use "earlier" alignments)
         align = sorted_aligns[putative_set.indexes[0]]
+        max_gain = score_single_align(align, ctg_len=align.end() - align.start() + 1)
+        allowed_score_drop = max_allowed_score_drop - putative_set.score_drop
         local_max_score = 0
         local_uncovered = putative_set.uncovered
-        putative_predecessors = OrderedDict()
-        for scored_set in all_scored_sets:
-            # we can enlarge the set with "earlier" alignments only
-            if scored_set.indexes and scored_set.indexes[-1] >= putative_set.indexes[0]:
+        putative_predecessors = []
+        # we can enlarge the set with "earlier" alignments only (all_scored_sets are sorted by the last index).
+        # The latest sets are checked first, so the earlier sets which cannot fit into the allowed score drop
+        # are skipped (SCORE_EPS is a margin for rounding errors)
+        set_idx = bisect_left(set_last_indexes, putative_set.indexes[0]) - 1
+        while set_idx >= 0:
+            if max_scores[set_idx] + max_gain < local_max_score - allowed_score_drop - SCORE_EPS:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
+            scored_set = all_scored_sets[set_idx]
+            cur_set_aligns = ExtendedSetAligns(sorted_aligns, scored_set, align)
             score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
                                          seq, region_struct_variations, penalties)
+            set_idx -= 1
             if score is not None:
-                putative_predecessors[scored_set] = (score, uncovered)
+                putative_predecessors.append((scored_set, score, uncovered))
                 if score > local_max_score:
                     local_max_score = score
                     local_uncovered = uncovered
                 elif score == local_max_score and uncovered < local_uncovered:
                     local_uncovered = uncovered
-        for preceding_set, (score, uncovered) in putative_predecessors.items():
+        for preceding_set, score, uncovered in reversed(putative_predecessors):
             score_drop = local_max_score - score + putative_set.score_drop
             if score_drop > max_allowed_score_drop:
                 continue
-            new_index = preceding_set.indexes[-1] if preceding_set.indexes else -1
+            new_index = preceding_set.last_index
             new_uncovered = uncovered + (putative_set.uncovered - local_uncovered)
             heappush(putative_sets, PutativeBestSet([new_index] + putative_set.indexes,
                                                     score_drop, new_uncovered))
@@ -0,0 +1,274 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Binary columnar copy of .coords files: it is written together with the text file
+# and read instead of it by the contig analyzer, the genome analyzer and Circos.
+#
+# Layout: magic, header length (uint32) and JSON header with the names of references
+# and contigs and the positions of columns, then the columns (aligned to 8 bytes).
+# Numeric columns are stored in the native byte order, so they are memory-mapped
+# without parsing; the cs strings may be compressed with zlib.
+#
+############################################################################
+
+from __future__ import with_statement
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+try:
+    from sys import intern
+except ImportError:  # python 2, intern is a builtin
+    pass
+
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+
+STORE_EXT = '.bin'
+MAGIC = b'QCOORDS\x01'
+ALIGNMENT = 8
+
+try:
+    array('q')
+    INT_TYPECODE = 'q'
+except ValueError:  # python 2
+    INT_TYPECODE = 'l'
+
+INT_COLUMNS = ['s1', 'e1', 's2', 'e2', 'len1', 'len2']
+# name --> typecode, the index columns (row numbers grouped by contig and by reference) are built on writing
+COLUMNS = [(name, INT_TYPECODE) for name in INT_COLUMNS] + \
+          [('idy', 'd'), ('ref_ids', 'i'), ('contig_ids', 'i'), ('ambiguous', 'b'), ('cs_offsets', INT_TYPECODE),
+           ('rows_by_contig', 'i'), ('contig_offsets', INT_TYPECODE), ('rows_by_ref', 'i'), ('ref_offsets', INT_TYPECODE)]
+
+
+def get_store_fpath(coords_fpath):
+    return coords_fpath + STORE_EXT
+
+
+def _to_bytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _add_index(columns, rows_name, offsets_name, ids_column, n_ids, key):
+    # rows of the i-th object are rows_name[offsets_name[i]:offsets_name[i + 1]]
+    columns[rows_name].extend(sorted(range(len(ids_column)), key=key))
+    offsets = [0] * (n_ids + 1)
+    for obj_id in ids_column:
+        offsets[obj_id + 1] += 1
+    for i in range(1, len(offsets)):
+        offsets[i] += offsets[i - 1]
+    columns[offsets_name].extend(offsets)
+
+
+class CoordsWriter(object):
+    """
+    Writes alignments into the text coords file and collects them for the binary store,
+    which is saved on closing
+    """
+    def __init__(self, coords_fpath, compress=False):
+        self.coords_fpath = coords_fpath
+        self.coords_file = open(coords_fpath, 'w')
+        self.compress = compress
+        self.columns = dict((name, array(typecode)) for name, typecode in COLUMNS)
+        self.ref_ids = {}
+        self.contig_ids = {}
+        self.cs_strings = []
+
+    def write_align(self, align, ambiguous=False):
+        self.coords_file.write(align.coords_str() + (' ambiguous\n' if ambiguous else '\n'))
+        columns = self.columns
+        for name in INT_COLUMNS:
+            columns[name].append(getattr(align, name))
+        columns['idy'].append(float(align.idy))
+        columns['ref_ids'].append(self.ref_ids.setdefault(align.ref, len(self.ref_ids)))
+        columns['contig_ids'].append(self.contig_ids.setdefault(align.contig, len(self.contig_ids)))
+        columns['ambiguous'].append(1 if ambiguous else 0)
+        self.cs_strings.append(align.cigar or '')
+
+    def close(self):
+        if self.coords_file.closed:
+            return
+        self.coords_file.close()
+        store_fpath = get_store_fpath(self.coords_fpath)
+        if self.coords_fpath != os.devnull:
+            self._save(store_fpath)
+
+    def _save(self, store_fpath):
+        columns = self.columns
+        # rows of each contig are kept in the file order, rows of each reference are sorted by the start
+        contig_ids, ref_ids, starts = columns['contig_ids'], columns['ref_ids'], columns['s1']
+        _add_index(columns, 'rows_by_contig', 'contig_offsets', contig_ids, len(self.contig_ids),
+                   key=lambda row: contig_ids[row])
+        _add_index(columns, 'rows_by_ref', 'ref_offsets', ref_ids, len(self.ref_ids),
+                   key=lambda row: (ref_ids[row], starts[row]))
+        cs_bytes = ''.join(self.cs_strings).encode('utf-8')
+        cs_offsets = columns['cs_offsets']
+        cs_offsets.append(0)
+        for cs in self.cs_strings:
+            cs_offsets.append(cs_offsets[-1] + len(cs))
+        if self.compress:
+            cs_bytes = zlib.compress(cs_bytes, 1)
+
+        header = {'text_size': os.path.getsize(self.coords_fpath), 'n_rows': len(columns['s1']),
+                  'byteorder': sys.byteorder, 'compressed': self.compress,
+                  'refs': sorted(self.ref_ids, key=self.ref_ids.get),
+                  'contigs': sorted(self.contig_ids, key=self.contig_ids.get), 'columns': []}
+        blobs = [(name, typecode, _to_bytes(columns[name])) for name, typecode in COLUMNS] + [('cs', '', cs_bytes)]
+        # offsets are counted from the end of the header, so the header can be written after calculating them
+        offset = 0
+        for name, typecode, data in blobs:
+            header['columns'].append([name, typecode, offset, len(data)])
+            offset += len(data) + (-len(data)) % ALIGNMENT
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_bytes += b' ' * ((-len(MAGIC) - 4 - len(header_bytes)) % ALIGNMENT)
+
+        tmp_fpath = store_fpath + '.tmp'
+        with open(tmp_fpath, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for name, typecode, data in blobs:
+                f.write(data)
+                f.write(b'\0' * ((-len(data)) % ALIGNMENT))
+        os.rename(tmp_fpath, store_fpath)
+
+
+class CoordsBuffer(object):
+    """
+    Keeps copies of alignments written by the analysis of a part of contigs (in a worker),
+    they are written into the coords file in the main process
+    """
+    def __init__(self):
+        self.aligns = []
+
+    def write_align(self, align, ambiguous=False):
+        self.aligns.append((align.clone(), ambiguous))
+
+    def write_to(self, coords_writer):
+        for align, ambiguous in self.aligns:
+            coords_writer.write_align(align, ambiguous=ambiguous)
+
+
+class CoordsStore(object):
+    """
+    Read-only view of the binary store: numeric columns (s1, e1, s2, e2, len1, len2, idy, ref_ids,
+    contig_ids, ambiguous) are sequences indexed by row, refs and contigs are lists of names
+    """
+    def __init__(self, store_fpath):
+        with open(store_fpath, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Not a coords store: ' + store_fpath)
+            header_len = struct.unpack('<I', f.read(4))[0]
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError('Coords store was created on a platform with a different byte order')
+            data_start = len(MAGIC) + 4 + header_len
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = header
+        self.n_rows = header['n_rows']
+        self.refs = [intern(str(name)) for name in header['refs']]
+        self.contigs = [intern(str(name)) for name in header['contigs']]
+        self._cs_blob = None
+        for name, typecode, offset, size in header['columns']:
+            start = data_start + offset
+            if name == 'cs':
+                self._cs_location = (start, size)
+            else:
+                setattr(self, name, self._read_column(typecode, start, size))
+
+    def _read_column(self, typecode, start, size):
+        typecode = str(typecode)
+        if hasattr(memoryview, 'cast'):  # the column is used directly from the mapped file
+            return memoryview(self._mmap)[start:start + size].cast(typecode)
+        values = array(typecode)
+        values.fromstring(self._mmap[start:start + size])
+        return values
+
+    def __len__(self):
+        return self.n_rows
+
+    def _get_cs_blob(self):
+        if self._cs_blob is None:
+            start, size = self._cs_location
+            cs_bytes = self._mmap[start:start + size]
+            if self.header['compressed']:
+                cs_bytes = zlib.decompress(cs_bytes)
+            self._cs_blob = cs_bytes.decode('utf-8')
+        return self._cs_blob
+
+    def cs(self, row):
+        return self._get_cs_blob()[self.cs_offsets[row]:self.cs_offsets[row + 1]]
+
+    def contig_rows(self, contig_id):
+        return self.rows_by_contig[self.contig_offsets[contig_id]:self.contig_offsets[contig_id + 1]]
+
+    def ref_rows(self, ref_id):
+        """
+            Rows of alignments to the reference sorted by the start
+        """
+        return self.rows_by_ref[self.ref_offsets[ref_id]:self.ref_offsets[ref_id + 1]]
+
+    def get_mapping(self, row):
+        return Mapping(self.s1[row], self.e1[row], self.s2[row], self.e2[row], self.len1[row], self.len2[row],
+                       self.idy[row], self.refs[self.ref_ids[row]], self.contigs[self.contig_ids[row]], self.cs(row))
+
+    def mappings_by_contig(self, ref_names=None):
+        """
+            Returns contig --> list of alignments (only alignments to ref_names if specified) in the order of
+            the coords file, they are the same as Mapping.from_line would make from the text lines
+        """
+        is_ref_used = [ref_names is None or ref in ref_names for ref in self.refs]
+        rows_by_contig = []
+        for contig_id, contig in enumerate(self.contigs):
+            rows = [row for row in self.contig_rows(contig_id) if is_ref_used[self.ref_ids[row]]]
+            if rows:
+                rows_by_contig.append((rows, contig))
+        aligns = {}
+        for rows, contig in sorted(rows_by_contig):  # in the order of the first alignments of contigs
+            aligns[contig] = [self.get_mapping(row) for row in rows]
+        return aligns
+
+
+def open_coords_store(coords_fpath):
+    """
+        Returns the binary store of the coords file or None if it is missing or out of date
+        (then the text file should be parsed)
+    """
+    store_fpath = get_store_fpath(coords_fpath)
+    if not os.path.isfile(store_fpath) or not os.path.isfile(coords_fpath):
+        return None
+    try:
+        store = CoordsStore(store_fpath)
+    except (ValueError, KeyError, IOError, OSError, struct.error):
+        return None
+    if store.header['text_size'] != os.path.getsize(coords_fpath):
+        return None
+    return store
+
+
+def read_mappings_by_contig(coords_fpath, ref_names=None):
+    """
+        Returns contig --> list of alignments from the coords file, the binary store is used if it is available
+    """
+    store = open_coords_store(coords_fpath)
+    if store is not None:
+        return store.mappings_by_contig(ref_names)
+    aligns = {}
+    with open(coords_fpath) as coords_file:
+        for line in coords_file:
+            mapping = Mapping.from_line(line)
+            if ref_names is None or mapping.ref in ref_names:
+                aligns.setdefault(mapping.contig, []).append(mapping)
+    return aligns
+
+
+def remove_coords(coords_fpath):
+    for fpath in [coords_fpath, get_store_fpath(coords_fpath)]:
+        if os.path.isfile(fpath):
+            os.remove(fpath)
@@ -0,0 +1,246 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# This is auxiliary file for contigs_analyzer.py
+#
+############################################################################
+
+from __future__ import with_statement
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
+
+MATCH = 1
+MISMATCH = 2
+DELETION = 3
+INSERTION = 4
+OP_CODES = {':': MATCH, '*': MISMATCH, '-': DELETION, '+': INSERTION}
+OP_CHARS = dict((code, op_char) for op_char, code in OP_CODES.items())
+
+cs_pattern = re.compile(r':\d+|\*[acgtn]+|\-[acgtn]+|\+[acgtn]+')
+
+MAX_CACHED_TAGS = 1000
+_cached_tags = OrderedDict()  # the same alignment is cloned and trimmed many times in the best set selection
+
+
+class CsTag(object):
+    """
+    cs tag (minimap2 difference string) tokenized once into compact arrays: operation code, number of bases
+    and the start and end of the operation bases in the string. Tags are not changed after creation,
+    so they are shared by alignment clones, and trimmed tags refer to the bases of the original string.
+    """
+    __slots__ = ('cs', 'codes', 'lengths', 'starts', 'ends', 'doubled_ops', '_str', '_positions')
+
+    def __init__(self, cs=''):
+        self.cs = cs
+        self._str = cs
+        self.doubled_ops = None
+        self._positions = None
+        ops = cs_pattern.findall(cs)
+        op_lens = [len(op) for op in ops]
+        first_op_start = len(cs) - sum(op_lens)
+        if cs[first_op_start:] == ''.join(ops):  # operations follow each other till the end of the string
+            codes = [OP_CODES[op[0]] for op in ops]
+            starts = [first_op_start + 1] * len(ops)
+            for i in range(1, len(ops)):
+                starts[i] = starts[i - 1] + op_lens[i - 1]
+            ends = [start + op_len - 1 for start, op_len in zip(starts, op_lens)]
+        else:
+            matches = list(cs_pattern.finditer(cs))
+            codes = [OP_CODES[match.group()[0]] for match in matches]
+            starts = [match.start() + 1 for match in matches]
+            ends = [match.end() for match in matches]
+            ops = [match.group() for match in matches]
+        self.codes = array('b', codes)
+        self.lengths = array('l', [int(op[1:]) if code == MATCH else 1 if code == MISMATCH else len(op) - 1
+                                   for op, code in zip(ops, codes)])
+        self.starts = array('l', starts)
+        self.ends = array('l', ends)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __bool__(self):
+        return self._str is None or bool(self._str)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        """
+            Yields (code, n_bases, start, end) for each operation, bases are cs[start:end]
+        """
+        return zip(self.codes, self.lengths, self.starts, self.ends)
+
+    def __str__(self):
+        if self._str is None:
+            self._str = 'cs:Z:' + ''.join(self._op_str(i) for i in range(len(self.codes)))
+        return self._str
+
+    def __getstate__(self):
+        return self.cs, self.codes, self.lengths, self.starts, self.ends, self.doubled_ops, self._str
+
+    def __setstate__(self, state):
+        self.cs, self.codes, self.lengths, self.starts, self.ends, self.doubled_ops, self._str = state
+        self._positions = None
+
+    def _op_str(self, i):
+        code = self.codes[i]
+        if code == MATCH:
+            return ':' + str(self.lengths[i])
+        op_char = OP_CHARS[code]
+        if self.doubled_ops and i in self.doubled_ops:
+            # the operation character is written twice, as it was done by the former trimming of cs strings
+            op_char *= 2
+        return op_char + self.cs[self.starts[i]:self.ends[i]]
+
+    def substring(self, first_op, last_op):
+        """
+            Returns the part of the original cs string with operations first_op..last_op - 1
+        """
+        if first_op >= last_op:
+            return ''
+        return self.cs[self.starts[first_op] - 1:self.ends[last_op - 1]]
+
+    def _get_positions(self):
+        """
+            Returns arrays used for trimming (i-th element corresponds to the first i operations):
+            contig shifts, max of (contig shift + bases) for non-mismatches, the same with at least one base
+            for all operations, and the difference between inserted and deleted bases
+        """
+        if self._positions is None:
+            n_ops = len(self.codes)
+            shifts, max_reaches, max_base_reaches, diff_lens = [0] * (n_ops + 1), [0] * n_ops, [0] * n_ops, [0] * (n_ops + 1)
+            shift, max_reach, max_base_reach, diff_len = 0, float('-inf'), float('-inf'), 0
+            for i, (code, n_bases) in enumerate(zip(self.codes, self.lengths)):
+                max_reach = max(max_reach, shift + (0 if code == MISMATCH else n_bases))
+                max_base_reach = max(max_base_reach, shift + max(1, n_bases))
+                max_reaches[i], max_base_reaches[i] = max_reach, max_base_reach
+                if code == INSERTION:
+                    diff_len += n_bases
+                elif code == DELETION:
+                    diff_len -= n_bases
+                if code != DELETION:
+                    shift += n_bases
+                shifts[i + 1], diff_lens[i + 1] = shift, diff_len
+            self._positions = shifts, max_reaches, max_base_reaches, diff_lens
+        return self._positions
+
+    def trim(self, ctg_pos, strand_direction, new_start=None, new_end=None):
+        """
+            Keeps only the part of the alignment starting from new_start (or ending at new_end) on the contig,
+            ctg_pos is the contig position of the first operation.
+            Returns the new tag and the difference between the removed reference and contig lengths
+        """
+        trimmed = CsTag()
+        trimmed.cs = self.cs
+        trimmed._str = None
+        n_ops = len(self.codes)
+        if bool(new_start) == bool(new_end):
+            return trimmed, self._trim_ops(trimmed, 0, n_ops, ctg_pos, strand_direction, new_start, new_end)
+
+        # the operations far from the new boundary are either kept unchanged or removed,
+        # only the operations near the boundary are checked one by one
+        shifts, max_reaches, max_base_reaches, diff_lens = self._get_positions()
+        is_kept_first = (new_end and strand_direction == 1) or (new_start and strand_direction == -1)
+        boundary_shift = (new_end or new_start) - ctg_pos if strand_direction == 1 else ctg_pos - (new_end or new_start)
+        if is_kept_first:
+            kept_end = bisect_right(max_reaches, boundary_shift)
+            removed_start = max(kept_end, bisect_right(shifts, boundary_shift, 0, n_ops))
+            self._copy_ops(trimmed, 0, kept_end)
+            diff_len = self._trim_ops(trimmed, kept_end, removed_start, ctg_pos + shifts[kept_end] * strand_direction,
+                                      strand_direction, new_start, new_end)
+            return trimmed, diff_len + diff_lens[n_ops] - diff_lens[removed_start]
+        else:
+            removed_end = bisect_right(max_base_reaches, boundary_shift)
+            kept_start = max(removed_end, bisect_left(shifts, boundary_shift, 0, n_ops))
+            diff_len = diff_lens[removed_end] + self._trim_ops(trimmed, removed_end, kept_start,
+                                                               ctg_pos + shifts[removed_end] * strand_direction,
+                                                               strand_direction, new_start, new_end)
+            self._copy_ops(trimmed, kept_start, n_ops)
+            return trimmed, diff_len
+
+    def _copy_ops(self, trimmed, first_op, last_op):
+        if 0 in self.lengths[first_op:last_op]:  # empty matches are always removed by trimming
+            for i in range(first_op, last_op):
+                if self.lengths[i]:
+                    trimmed._add_op(self.codes[i], self.lengths[i], self.starts[i], self.ends[i])
+            return
+        trimmed.codes.extend(self.codes[first_op:last_op])
+        trimmed.lengths.extend(self.lengths[first_op:last_op])
+        trimmed.starts.extend(self.starts[first_op:last_op])
+        trimmed.ends.extend(self.ends[first_op:last_op])
+
+    def _add_op(self, code, n_bases, start, end, is_doubled=False):
+        if is_doubled:
+            if self.doubled_ops is None:
+                self.doubled_ops = set()
+            self.doubled_ops.add(len(self.codes))
+        self.codes.append(code)
+        self.lengths.append(n_bases)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def _trim_ops(self, trimmed, first_op, last_op, ctg_pos, strand_direction, new_start, new_end):
+        diff_len = 0
+        for i in range(first_op, last_op):
+            code, n_bases, start, end = self.codes[i], self.lengths[i], self.starts[i], self.ends[i]
+            if code == MISMATCH:
+                if (new_start and ctg_pos >= new_start) or (new_end and ctg_pos <= new_end):
+                    trimmed._add_op(code, n_bases, start, end)
+                ctg_pos += strand_direction
+                continue
+            corr_n_bases = n_bases
+            if new_end and (ctg_pos + n_bases * strand_direction > new_end or ctg_pos > new_end):
+                corr_n_bases = new_end - ctg_pos + (n_bases if strand_direction == -1 else 1)
+            elif new_start and (ctg_pos < new_start or ctg_pos + n_bases * strand_direction < new_start):
+                corr_n_bases = ctg_pos + (n_bases if strand_direction == 1 else 1) - new_start
+
+            if corr_n_bases < 1:
+                if code != DELETION:
+                    ctg_pos += n_bases * strand_direction
+                if code == DELETION:
+                    diff_len -= n_bases
+                if code == INSERTION:
+                    diff_len += n_bases
+                continue
+            if code == MATCH:
+                ctg_pos += n_bases * strand_direction
+                trimmed._add_op(code, corr_n_bases, start, end)
+                continue
+            if code == INSERTION:
+                ctg_pos += n_bases * strand_direction
+                diff_len += n_bases - corr_n_bases
+            else:
+                diff_len -= n_bases - corr_n_bases
+            if new_start:
+                # the same bases as the former op[1 + (corr_n_bases - n_bases):]
+                if corr_n_bases == n_bases - 1:
+                    trimmed._add_op(code, n_bases, start, end, is_doubled=True)
+                elif corr_n_bases < n_bases:
+                    trimmed._add_op(code, n_bases - corr_n_bases - 1, start + corr_n_bases + 1, end)
+                else:
+                    trimmed._add_op(code, n_bases, start, end)
+            elif new_end:
+                trimmed._add_op(code, corr_n_bases, start, start + corr_n_bases)
+        return diff_len
+
+
+def get_cs_tag(cs):
+    """
+        Returns the tokenized cs string, recently used tags are reused
+    """
+    cs_tag = _cached_tags.get(cs)
+    if cs_tag is None:
+        cs_tag = CsTag(cs)
+        if len(_cached_tags) >= MAX_CACHED_TAGS:
+            _cached_tags.popitem(last=False)
+        _cached_tags[cs] = cs_tag
+    return cs_tag
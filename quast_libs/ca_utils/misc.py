@@ -12,7 +12,6 @@
 from __future__ import with_statement
 import gzip
 import os
-import re
 from itertools import repeat
 from os.path import isdir, join, basename
 
@@ -21,13 +20,15 @@ try:
 except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
-from quast_libs import qconfig
+from quast_libs import executors, qconfig
+from quast_libs.ca_utils.cs_tag import cs_pattern
 from quast_libs.qutils import compile_tool, val_to_str, get_path_to_program
 
 contig_aligner_dirpath = join(qconfig.LIBS_LOCATION, 'minimap2')
 ref_labels_by_chromosomes = OrderedDict()
 intergenomic_misassemblies_by_asm = {}
 contigs_aligned_lengths = {}
+executors.share_module_state(__name__, ['ref_labels_by_chromosomes'])  # used by analysis of contigs in workers
 
 
 def bin_fpath(fname):
@@ -61,7 +62,6 @@ def get_ref_by_chromosome(chrom):
 
 
 def parse_cs_tag(cigar):
-    cs_pattern = re.compile(r':\d+|\*[acgtn]+|\-[acgtn]+|\+[acgtn]+')
     return cs_pattern.findall(cigar)
 
 
@@ -9,7 +9,6 @@ from __future__ import with_statement
 
 import os
 import re
-import shutil
 from collections import defaultdict
 from os.path import join, exists, dirname, realpath
 
@@ -20,11 +19,13 @@ except ImportError:
 
 from quast_libs import qutils, qconfig
 from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths
+from quast_libs.ca_utils.coords_store import open_coords_store
 from quast_libs.ca_utils.misc import create_minimap_output_dir, parse_cs_tag
 from quast_libs.fastaparser import get_chr_lengths_from_fastafile
 from quast_libs.icarus_utils import get_assemblies, check_misassembled_blocks, Alignment
 from quast_libs.qutils import get_path_to_program, is_non_empty_file, relpath
 from quast_libs.reads_analyzer import COVERAGE_FACTOR
+from quast_libs.tracks import open_track
 
 circos_png_fname = 'circos.png'
 TRACK_WIDTH = 0.04
@@ -222,15 +223,20 @@ def create_alignment_plots(assembly, ref_len, output_dir):
     return conf_fpath
 
 
-def create_gc_plot(gc_fpath, data_dir):
+def create_gc_plot(gc_fpath, window_size, data_dir):
+    gc_track = open_track(gc_fpath)
+    dst_gc_fpath = join(data_dir, 'gc.txt')
     gc_values = []
-    with open(gc_fpath) as f:
-        for line in f:
-            gc_values.append(float(line.split()[-1]))
+    with open(dst_gc_fpath, 'w') as out_f:
+        for chrom in gc_track.chrom_names:
+            chrom_len = gc_track.get_length(chrom)
+            starts, GC_percents = gc_track.get_values(chrom, window_size)
+            for start, GC_percent in zip(starts, GC_percents):
+                end = min(start + window_size, chrom_len)
+                out_f.write('\t'.join([chrom, str(start), str(end), str(GC_percent) + '\n']))
+            gc_values.extend(GC_percents)
     max_points = len(gc_values)
     min_gc, max_gc = int(min(gc_values)), int(max(gc_values))
-    dst_gc_fpath = join(data_dir, 'gc.txt')
-    shutil.copy(gc_fpath, dst_gc_fpath)
     return dst_gc_fpath, min_gc, max_gc, max_points
 
 
@@ -239,9 +245,23 @@ def create_coverage_plot(cov_fpath, window_size, chr_lengths, output_dir):
     if not cov_fpath:
         return None, max_points
 
-    cov_by_chrom = dict()
     cov_data_fpath = join(output_dir, 'coverage.txt')
     chr_lengths = list(chr_lengths.values())
+    cov_track = open_track(cov_fpath)
+    if cov_track is not None:  # mean depth of windows is taken from the track
+        with open(cov_data_fpath, 'w') as out_f:
+            for chrom_order, chrom in enumerate(cov_track.chrom_names):
+                chrom_len = chr_lengths[chrom_order]
+                avg_depths = [0] * (chrom_len // window_size + 2)
+                for start, length, total, weight, min_depth, max_depth in cov_track.iter_windows(chrom, window_size):
+                    if weight and start // window_size < len(avg_depths):
+                        avg_depths[start // window_size] = total / weight
+                for i, avg_depth in enumerate(avg_depths):
+                    out_f.write('\t'.join([chrom, str(i * window_size), str(((i + 1) * window_size)), str(avg_depth)]) + '\n')
+                    max_points += 1
+        return cov_data_fpath, max_points
+
+    cov_by_chrom = dict()
     with open(cov_fpath) as f:
         pos = 0
         for index, line in enumerate(f):
@@ -266,6 +286,20 @@ def create_coverage_plot(cov_fpath, window_size, chr_lengths, output_dir):
     return cov_data_fpath, max_points
 
 
+def iter_coords_cs(coords_fpath):
+    # ambiguous alignments are not counted (the last column of their lines is not a cs string)
+    coords_store = open_coords_store(coords_fpath)
+    if coords_store is not None:
+        for row in range(len(coords_store)):
+            if not coords_store.ambiguous[row]:
+                yield coords_store.s1[row], coords_store.refs[coords_store.ref_ids[row]], coords_store.cs(row)
+        return
+    with open(coords_fpath) as coords_file:
+        for line in coords_file:
+            fs = line.split()
+            yield int(fs[0]), fs[11], fs[-1]
+
+
 def create_mismatches_plot(assembly, window_size, ref_len, root_dir, output_dir):
     assembly_label = qutils.label_from_fpath_for_fname(assembly.fpath)
     aligner_dirpath = join(root_dir, '..', qconfig.detailed_contigs_reports_dirname)
@@ -276,19 +310,15 @@ def create_mismatches_plot(assembly, window_size, ref_len, root_dir, output_dir)
 
     mismatches_fpath = join(output_dir, assembly_label + '.mismatches.txt')
     mismatch_density_by_chrom = defaultdict(lambda : [0] * (ref_len // window_size + 1))
-    with open(coords_filtered_fpath) as coords_file:
-        for line in coords_file:
-            s1 = int(line.split('|')[0].split()[0])
-            chrom = line.split()[11].strip()
-            cigar = line.split()[-1].strip()
-            ref_pos = s1
-            for op in parse_cs_tag(cigar):
-                n_bases = len(op) - 1
-                if op.startswith('*'):
-                    mismatch_density_by_chrom[chrom][int(ref_pos) // window_size] += 1
-                    ref_pos += 1
-                elif not op.startswith('+'):
-                    ref_pos += n_bases
+    for s1, chrom, cigar in iter_coords_cs(coords_filtered_fpath):
+        ref_pos = s1
+        for op in parse_cs_tag(cigar):
+            n_bases = len(op) - 1
+            if op.startswith('*'):
+                mismatch_density_by_chrom[chrom][int(ref_pos) // window_size] += 1
+                ref_pos += 1
+            elif not op.startswith('+'):
+                ref_pos += n_bases
     with open(mismatches_fpath, 'w') as out_f:
         for chrom, density_list in mismatch_density_by_chrom.items():
             start, end = 0, 0
@@ -437,7 +467,7 @@ def create_conf(ref_fpath, contigs_fpaths, contig_report_fpath_pattern, output_d
     if not alignments_fpaths:
         return None
 
-    gc_fpath, min_gc, max_gc, gc_points = create_gc_plot(gc_fpath, data_dir)
+    gc_fpath, min_gc, max_gc, gc_points = create_gc_plot(gc_fpath, window_size, data_dir)
     feature_fpaths, gene_points = create_genes_plot(features_containers, window_size, ref_len, data_dir)
     mismatches_fpaths = [create_mismatches_plot(assembly, window_size, ref_len, output_dir, data_dir) for assembly in assemblies]
     cov_data_fpath, cov_points = create_coverage_plot(cov_fpath, window_size, chr_lengths, data_dir)
@@ -23,20 +23,24 @@ import re
 from collections import defaultdict
 from os.path import join, dirname
 
-from quast_libs import reporting, qconfig, qutils, fastaparser
+from quast_libs import executors, reporting, qconfig, qutils, fastaparser
 from quast_libs.ca_utils import misc
 from quast_libs.ca_utils.analyze_contigs import analyze_contigs
-from quast_libs.ca_utils.analyze_misassemblies import Mapping, IndelsInfo
+from quast_libs.ca_utils.analyze_misassemblies import IndelsInfo
+from quast_libs.ca_utils.coords_store import CoordsWriter, read_mappings_by_contig
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes, compile_aligner, \
-    create_minimap_output_dir, close_handlers, parse_cs_tag
+    create_minimap_output_dir, close_handlers
+from quast_libs.ca_utils import cs_tag
 
-from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, AlignerStatus
+from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, AlignerStatus, \
+    is_alignment_needed, build_minimap_index
 from quast_libs.ca_utils.save_results import print_results, save_result, save_result_for_unaligned, \
     save_combined_ref_stats
 from quast_libs.fastaparser import get_genome_stats
+from quast_libs.intervals import GenomeCoverage
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import is_python2, run_parallel
+from quast_libs.qutils import is_python2, run_parallel, get_files_sizes
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -52,62 +56,48 @@ class CAOutput():
 
 def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath):
     indels_info = IndelsInfo()
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    genome_coverage = GenomeCoverage(reference_chromosomes)
     with open(used_snps_fpath, 'w') as used_snps_f:
         for chr_name, aligns in ref_aligns.items():
             for align in aligns:
                 ref_pos, ctg_pos = align.s1, align.s2
                 strand_direction = 1 if align.s2 < align.e2 else -1
-                for op in parse_cs_tag(align.cigar):
-                    if op.startswith(':'):
-                        n_bases = int(op[1:])
-                    else:
-                        n_bases = len(op) - 1
-                    if op.startswith('*'):
-                        ref_nucl, ctg_nucl = op[1].upper(), op[2].upper()
+                cs = align.cs_tag.cs
+                for code, n_bases, start, end in align.cs_tag:
+                    if code == cs_tag.MISMATCH:
+                        ref_nucl, ctg_nucl = cs[start].upper(), cs[start + 1].upper()
                         if ctg_nucl != 'N' and ref_nucl != 'N':
                             indels_info.mismatches += 1
                             if qconfig.show_snps:
                                 used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
                         ref_pos += 1
                         ctg_pos += 1 * strand_direction
-                    elif op.startswith('+'):
+                    elif code == cs_tag.INSERTION:
                         indels_info.indels_list.append(n_bases)
                         indels_info.insertions += n_bases
                         if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = '.', op[1:].upper()
+                            ref_nucl, ctg_nucl = '.', cs[start:end].upper()
                             used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
                         ctg_pos += n_bases * strand_direction
-                    elif op.startswith('-'):
+                    elif code == cs_tag.DELETION:
                         indels_info.indels_list.append(n_bases)
                         indels_info.deletions += n_bases
                         if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = op[1:].upper(), '.'
+                            ref_nucl, ctg_nucl = cs[start:end].upper(), '.'
                             used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
                         ref_pos += n_bases
                     else:
                         ref_pos += n_bases
                         ctg_pos += n_bases * strand_direction
-                if align.s1 < align.e1:
-                    for pos in range(align.s1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
-                else:
-                    for pos in range(align.s1, len(genome_mapping[align.ref])):
-                        genome_mapping[align.ref][pos] = 1
-                    for pos in range(1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
-            for i in ns_by_chromosomes[align.ref]:
-                genome_mapping[align.ref][i] = 0
-
-    covered_ref_bases = sum([sum(genome_mapping[chrom]) for chrom in genome_mapping])
+                genome_coverage.add(align.ref, align.s1, align.e1, cyclic=True)
+
+    covered_ref_bases = genome_coverage.total_covered_length(ns_by_chromosomes)
     return covered_ref_bases, indels_info
 
 
 # former plantagora and plantakolya
 def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath,
-                      reference_chromosomes, ns_by_chromosomes, old_contigs_fpath, bed_fpath, threads=1):
+                      reference_chromosomes, ns_by_chromosomes, old_contigs_fpath, bed_fpath, threads=1, ref_index_fpath=None):
     tmp_output_dirpath = create_minimap_output_dir(output_dirpath)
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
@@ -140,8 +130,8 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
         logger.info('  ' + qutils.index_to_str(index) + 'Logging is disabled.')
 
     coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath = get_aux_out_fpaths(out_basename)
-    status = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
-                           log_out_fpath, log_err_fpath)
+    status, mappings = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
+                                     log_out_fpath, log_err_fpath, ref_index_fpath)
     if status != AlignerStatus.OK:
         with open(log_err_fpath, 'a') as log_err_f:
             if status == AlignerStatus.ERROR:
@@ -161,11 +151,11 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     # Loading the alignment files
     log_out_f.write('Parsing coords...\n')
     aligns = {}
-    with open(coords_fpath) as coords_file:
-        for line in coords_file:
-            mapping = Mapping.from_line(line)
-            if not qconfig.alignments_for_reuse_dirpath or mapping.ref in reference_chromosomes.keys():
-                aligns.setdefault(mapping.contig, []).append(mapping)
+    if mappings is not None:  # just computed alignments are passed in memory
+        for mapping in mappings:
+            aligns.setdefault(mapping.contig, []).append(mapping)
+    else:
+        aligns = read_mappings_by_contig(coords_fpath, reference_chromosomes if qconfig.alignments_for_reuse_dirpath else None)
 
     # Loading the reference sequences
     log_out_f.write('Loading reference...\n') # TODO: move up
@@ -186,12 +176,13 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f.write('\tTotal Regions: %d\n' % total_regions)
     log_out_f.write('\tTotal Region Length: %d\n' % total_reg_len)
 
-    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=open(coords_filtered_fpath, 'w'),
+    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=CoordsWriter(coords_filtered_fpath, compress=not qconfig.no_gzip),
                          icarus_out_f=icarus_out_f)
 
     log_out_f.write('Analyzing contigs...\n')
     result, ref_aligns, total_indels_info, aligned_lengths, misassembled_contigs, misassemblies_in_contigs, aligned_lengths_by_contigs =\
-        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes, is_cyclic)
+        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes, is_cyclic,
+                        threads)
 
     log_out_f.write('Analyzing coverage...\n')
     if qconfig.show_snps:
@@ -204,8 +195,7 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
 
     if not qconfig.space_efficient:
         ## outputting misassembled contigs to separate file
-        fasta = [(name, seq) for name, seq in fastaparser.read_fasta(contigs_fpath)
-                 if name in misassembled_contigs.keys()]
+        fasta = fastaparser.read_fasta_entries(contigs_fpath, misassembled_contigs.keys())
         fastaparser.write_fasta(join(output_dirpath, qutils.name_from_fpath(contigs_fpath) + '.mis_contigs.fa'), fasta)
 
     if qconfig.is_combined_ref:
@@ -259,16 +249,26 @@ def do(reference, contigs_fpaths, is_cyclic, output_dir, old_contigs_fpaths, bed
         return dict(zip(contigs_fpaths, [AlignerStatus.FAILED] * len(contigs_fpaths))), None
 
     num_nf_errors = logger._num_nf_errors
-    create_minimap_output_dir(output_dir)
+    minimap_output_dirpath = create_minimap_output_dir(output_dir)
     n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    threads = max(1, qconfig.max_threads // n_jobs)
 
     genome_size, reference_chromosomes, ns_by_chromosomes = get_genome_stats(reference, skip_ns=True)
-    threads = qconfig.max_threads if qconfig.memory_efficient else threads
+    ref_index_fpath = None
+    if not qconfig.space_efficient or qconfig.aligner_index_dirpath:
+        # the reference is indexed once for all assemblies instead of indexing it in each minimap2 run
+        for contigs_fpath, old_contigs_fpath in zip(contigs_fpaths, old_contigs_fpaths):
+            out_basename = join(minimap_output_dirpath, qutils.label_from_fpath_for_fname(contigs_fpath))
+            if is_alignment_needed(get_aux_out_fpaths(out_basename)[0], out_basename, reference, old_contigs_fpath):
+                index_dirpath = os.path.abspath(qconfig.aligner_index_dirpath or minimap_output_dirpath)
+                ref_index_fpath = build_minimap_index(reference, index_dirpath, qconfig.max_threads)
+                break
     args = [(is_cyclic, i, contigs_fpath, output_dir, reference, reference_chromosomes, ns_by_chromosomes,
-            old_contigs_fpath, bed_fpath, threads)
+            old_contigs_fpath, bed_fpath, executors.AUTO_THREADS, ref_index_fpath)
             for i, (contigs_fpath, old_contigs_fpath) in enumerate(zip(contigs_fpaths, old_contigs_fpaths))]
-    statuses, results, aligned_lengths, misassemblies_in_contigs, aligned_lengths_by_contigs = run_parallel(align_and_analyze, args, n_jobs)
+    # minimap2 threads are given to the assemblies proportionally to their sizes, largest assemblies are started first
+    statuses, results, aligned_lengths, misassemblies_in_contigs, aligned_lengths_by_contigs = \
+        run_parallel(align_and_analyze, args, n_jobs, task_sizes=get_files_sizes(contigs_fpaths),
+                     task_names=[qutils.label_from_fpath(contigs_fpath) for contigs_fpath in contigs_fpaths])
     reports = []
 
     aligner_statuses = dict(zip(contigs_fpaths, statuses))
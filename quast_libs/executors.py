@@ -0,0 +1,441 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+from __future__ import with_statement
+import atexit
+import importlib
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import traceback
+import types
+from multiprocessing.pool import ThreadPool
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from quast_libs import qconfig
+from quast_libs.log import get_logger
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+# Executor types:
+# process -- pool of worker processes created once and reused by all stages,
+#            qconfig and registered module variables are sent to workers with the tasks (see share_module_state)
+# fork    -- new worker processes for each call, workers inherit the whole state of the main process
+# thread  -- pool of threads, nothing is pickled (for tasks which mostly wait for external tools)
+# serial  -- tasks are run one by one in the current process
+PROCESS = 'process'
+FORK = 'fork'
+THREAD = 'thread'
+SERIAL = 'serial'
+EXECUTOR_TYPES = [PROCESS, FORK, THREAD, SERIAL]
+
+
+class _AutoThreads(object):
+    def __repr__(self):
+        return 'AUTO_THREADS'
+
+    def __reduce__(self):
+        return 'AUTO_THREADS'
+
+# placeholder in task arguments, it is replaced by the number of threads given to the task when the task starts
+AUTO_THREADS = _AutoThreads()
+
+
+class StageUsage(object):
+    """
+    CPU usage of a parallel stage: cpu_time is the time of all processes (including external tools)
+    spent on the stage, thread_time is the sum of threads given to tasks multiplied by task durations.
+    tasks are (task name, threads, wall time, resources used by the task or None), see get_resources
+    """
+    def __init__(self, name, n_tasks, n_jobs, max_threads):
+        self.name = name
+        self.n_tasks = n_tasks
+        self.n_jobs = n_jobs
+        self.max_threads = max_threads
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.thread_time = 0.0
+        self.tasks = []
+
+    def add_task(self, name, threads, wall_time, resources=None):
+        self.tasks.append((name, threads, wall_time, resources))
+        self.thread_time += threads * wall_time
+
+    def utilization(self):
+        if not self.wall_time:
+            return 0.0
+        return 100.0 * self.cpu_time / (self.wall_time * self.max_threads)
+
+stages_usage = []
+
+_shared_modules = [('quast_libs.qconfig', None)]
+_process_pool = None
+_process_pool_size = 0
+_is_worker = False
+_worker_state = None
+_main_thread = threading.current_thread()
+
+
+def share_module_state(module_name, var_names=None):
+    """
+    Registers variables of the module which are changed at runtime and used by tasks running in the reused pool.
+    If var_names is None, all public picklable variables of the module are sent
+    """
+    if (module_name, var_names) not in _shared_modules:
+        _shared_modules.append((module_name, var_names))
+
+
+def _is_data(value):
+    return not isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type))
+
+
+def _get_shared_state():
+    state = []
+    for module_name, var_names in _shared_modules:
+        module = importlib.import_module(module_name)
+        if var_names is None:
+            var_names = [name for name in vars(module) if not name.startswith('_')]
+        values = dict()
+        for name in var_names:
+            value = getattr(module, name)
+            if not _is_data(value):
+                continue
+            try:
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                continue
+            values[name] = value
+        state.append((module_name, values))
+    return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+
+def _set_shared_state(state):
+    global _worker_state
+    if state == _worker_state:
+        return
+    for module_name, values in pickle.loads(state):
+        module = importlib.import_module(module_name)
+        for name, value in values.items():
+            cur_value = getattr(module, name, None)
+            # update in place, since other modules may have imported the variable with 'from ... import'
+            if isinstance(cur_value, dict) and type(cur_value) == type(value):
+                cur_value.clear()
+                cur_value.update(value)
+            elif isinstance(cur_value, list) and isinstance(value, list):
+                cur_value[:] = value
+            else:
+                setattr(module, name, value)
+    _worker_state = state
+
+
+def _init_worker():
+    global _is_worker
+    _is_worker = True  # nested parallel runs are not allowed in daemonic processes, so they are run serially
+
+
+def is_worker():
+    """
+    Returns True in worker processes and in threads of the thread pool, parallel runs are serial there
+    """
+    return _is_worker or threading.current_thread() is not _main_thread
+
+
+def _get_cpu_time(with_children=True):
+    times = os.times()
+    return times[0] + times[1] + (times[2] + times[3] if with_children else 0)
+
+
+def _get_max_rss(who):
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # bytes on macOS, kilobytes on Linux
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the current process (Linux only), returns False if it is not possible
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs_f:
+            clear_refs_f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def get_resources(with_children=True):
+    """
+    Returns resources used by the current process (and by its finished children if with_children) since its start:
+    cpu_time (s), read_bytes and written_bytes (None if unknown, always with children), peak_rss (bytes,
+    since the last reset_peak_rss if it was possible) and children_peak_rss (bytes, the largest finished child)
+    """
+    resources = dict(cpu_time=_get_cpu_time(with_children), read_bytes=None, written_bytes=None,
+                     peak_rss=None, children_peak_rss=_get_max_rss(resource.RUSAGE_CHILDREN) if resource else None)
+    try:
+        with open('/proc/self/io') as io_f:
+            io_stats = dict(line.split(':') for line in io_f if ':' in line)
+        resources['read_bytes'], resources['written_bytes'] = int(io_stats['rchar']), int(io_stats['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    try:
+        with open('/proc/self/status') as status_f:
+            for line in status_f:
+                if line.startswith('VmHWM:'):
+                    resources['peak_rss'] = int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    if resources['peak_rss'] is None:
+        resources['peak_rss'] = _get_max_rss(resource.RUSAGE_SELF) if resource else None
+    return resources
+
+
+def get_resources_delta(start_resources, end_resources):
+    """
+    Returns resources used between two calls of get_resources. Peak RSS of children is known only
+    if it exceeded the peak of the children finished before (otherwise it is None)
+    """
+    delta = dict(peak_rss=end_resources['peak_rss'])
+    for name in ['cpu_time', 'read_bytes', 'written_bytes']:
+        if start_resources[name] is not None and end_resources[name] is not None:
+            delta[name] = end_resources[name] - start_resources[name]
+        else:
+            delta[name] = None
+    children_peak_rss = end_resources['children_peak_rss']
+    delta['children_peak_rss'] = children_peak_rss if children_peak_rss and \
+                                                      children_peak_rss > (start_resources['children_peak_rss'] or 0) else None
+    return delta
+
+
+def _run_task(fn, args, state=None, measure=False):
+    """
+    Returns (is_ok, result or (exception, traceback), resources used by the task or None)
+    """
+    start_resources = None
+    if measure:
+        reset_peak_rss()
+        start_resources = get_resources()
+    try:
+        if state is not None:
+            _set_shared_state(state)
+        result = True, fn(*args)
+    except (Exception, SystemExit) as e:
+        result = False, (e, traceback.format_exc())
+    return result + (get_resources_delta(start_resources, get_resources()) if measure else None,)
+
+
+def _create_process_pool(n_jobs):
+    try:
+        context = multiprocessing.get_context('fork')  # workers inherit loggers and loaded modules
+    except (AttributeError, ValueError):  # python 2 or fork is not available on the platform
+        context = multiprocessing
+    return context.Pool(n_jobs, initializer=_init_worker)
+
+
+def _get_process_pool(n_jobs):
+    global _process_pool, _process_pool_size
+    if _process_pool is None or _process_pool_size < n_jobs:
+        shutdown()
+        _process_pool_size = max(n_jobs, qconfig.max_threads or 1)
+        _process_pool = _create_process_pool(_process_pool_size)
+    return _process_pool
+
+
+def shutdown(terminate=False):
+    """
+    Stops worker processes of the reused pool. The pool is created again when needed
+    """
+    global _process_pool, _process_pool_size
+    if _process_pool is not None:
+        if terminate:
+            _process_pool.terminate()
+        else:
+            _process_pool.close()
+        _process_pool.join()
+        _process_pool = None
+        _process_pool_size = 0
+
+
+atexit.register(shutdown, terminate=True)
+
+
+def _set_threads(args, threads):
+    return tuple(threads if arg is AUTO_THREADS else arg for arg in args)
+
+
+def _get_threads_budget(n_jobs):
+    return max(qconfig.max_threads or 1, n_jobs)
+
+
+class _ThreadsScheduler(object):
+    """
+    Starts tasks in the order of decreasing sizes and splits free threads between the started task and
+    the tasks which will be started together with it proportionally to their sizes, so the threads
+    released by finished tasks are given to the queued ones
+    """
+    def __init__(self, n_tasks, n_jobs, task_sizes=None, uses_threads=True):
+        self.n_jobs = n_jobs
+        self.uses_threads = uses_threads
+        self.budget = _get_threads_budget(n_jobs) if uses_threads else n_jobs
+        self.weights = [max(1, size or 0) for size in task_sizes] if task_sizes else [1] * n_tasks
+        # sorting is stable, so tasks of the same size are started in the original order
+        self.queue = sorted(range(n_tasks), key=lambda task_id: -self.weights[task_id])
+        self.next_idx = 0
+        self.running = dict()  # task_id --> threads
+
+    def has_queued(self):
+        return self.next_idx < len(self.queue)
+
+    def can_start(self):
+        return self.has_queued() and len(self.running) < self.n_jobs and self.free_threads() > 0
+
+    def free_threads(self):
+        return self.budget - sum(self.running.values())
+
+    def start_next(self):
+        free_threads = self.free_threads()
+        n_sharing = min(self.n_jobs - len(self.running), len(self.queue) - self.next_idx, free_threads)
+        sharing_tasks = self.queue[self.next_idx:self.next_idx + n_sharing]
+        task_id = sharing_tasks[0]
+        total_weight = sum(self.weights[shared_id] for shared_id in sharing_tasks)
+        threads = free_threads * self.weights[task_id] // total_weight
+        threads = max(1, min(threads, free_threads - (n_sharing - 1))) if self.uses_threads else 1
+        self.running[task_id] = threads
+        self.next_idx += 1
+        return task_id, threads
+
+    def finish(self, task_id):
+        return self.running.pop(task_id)
+
+
+def _imap_pool(pool, fn, fn_args, n_jobs, state=None, task_sizes=None, usage=None, task_names=None, measure=False):
+    """
+    Yields results in the order of fn_args keeping at most n_jobs tasks in the pool at the same time.
+    AUTO_THREADS in the arguments is replaced with the number of threads given to the task by the scheduler.
+    If measure is True, resources used by tasks are measured in the workers and added to usage
+    """
+    uses_threads = any(arg is AUTO_THREADS for args in fn_args for arg in args)
+    scheduler = _ThreadsScheduler(len(fn_args), n_jobs, task_sizes, uses_threads)
+    finished = Queue()
+    ready_results = dict()
+    start_times = dict()
+    next_result = 0
+    while next_result < len(fn_args):
+        while scheduler.can_start():
+            task_id, threads = scheduler.start_next()
+            callbacks = dict(callback=lambda result, task_id=task_id: finished.put((task_id, result)))
+            if sys.version_info[0] >= 3:  # e.g. if the result cannot be pickled
+                callbacks['error_callback'] = lambda e, task_id=task_id: finished.put((task_id, (False, (e, str(e)), None)))
+            start_times[task_id] = time.time()
+            pool.apply_async(_run_task, (fn, _set_threads(fn_args[task_id], threads), state, measure), **callbacks)
+        task_id, (is_ok, result, resources) = finished.get()
+        threads = scheduler.finish(task_id)
+        if usage is not None:
+            usage.add_task(task_names[task_id] if task_names else None, threads,
+                           time.time() - start_times[task_id], resources)
+            if resources:
+                usage.cpu_time += resources['cpu_time']
+        if not is_ok:
+            exception, traceback_str = result
+            logger.debug('Parallel task failed:\n' + traceback_str)
+            raise exception
+        ready_results[task_id] = result
+        while next_result in ready_results:
+            yield ready_results.pop(next_result)
+            next_result += 1
+
+
+def imap(fn, fn_args, n_jobs, executor_type=PROCESS, task_sizes=None, stage_name=None, task_names=None):
+    """
+    Runs fn for each tuple of arguments in fn_args using n_jobs workers of the specified executor type
+    and yields results in the order of fn_args as soon as they are ready.
+    Tasks are started in the order of decreasing task_sizes (if specified), AUTO_THREADS in the arguments
+    is replaced with the number of threads given to the task. CPU usage of the run is added to stages_usage,
+    task_names (e.g. labels of assemblies) are used in the profile of the run
+    """
+    fn_args = list(fn_args)
+    if not fn_args:
+        return
+    is_serial = executor_type == SERIAL or n_jobs == 1 or is_worker()
+    usage = StageUsage(stage_name or fn.__name__, len(fn_args), 1 if is_serial else n_jobs,
+                       _get_threads_budget(1 if is_serial else n_jobs))
+    if not is_worker():
+        stages_usage.append(usage)
+    start_time = time.time()
+    # workers of the reused pool measure their resources themselves (with the external tools started by them),
+    # so only the time of the main process is added. Other workers are children of the main process
+    with_children = is_serial or executor_type != PROCESS
+    start_cpu_time = _get_cpu_time(with_children)
+    try:
+        if is_serial:
+            for i, args in enumerate(fn_args):
+                task_start_time = time.time()
+                result = fn(*_set_threads(args, usage.max_threads))
+                usage.add_task(task_names[i] if task_names else None, usage.max_threads, time.time() - task_start_time)
+                yield result
+        elif executor_type == PROCESS:
+            pool = _get_process_pool(n_jobs)
+            is_finished = False
+            try:
+                for result in _imap_pool(pool, fn, fn_args, n_jobs, _get_shared_state(), task_sizes, usage,
+                                         task_names, measure=True):
+                    yield result
+                is_finished = True
+            finally:
+                if not is_finished:  # do not leave tasks of the failed stage in the reused pool
+                    shutdown(terminate=True)
+        else:
+            if executor_type == THREAD:
+                pool = ThreadPool(n_jobs)
+            else:
+                pool = _create_process_pool(min(n_jobs, len(fn_args)))
+            try:
+                for result in _imap_pool(pool, fn, fn_args, n_jobs, task_sizes=task_sizes, usage=usage,
+                                         task_names=task_names):
+                    yield result
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        usage.wall_time = time.time() - start_time
+        usage.cpu_time += _get_cpu_time(with_children) - start_cpu_time
+
+
+def save_usage_report(report_fpath, first_stage=0):
+    """
+    Saves CPU utilization of the parallel stages run since first_stage and removes them from stages_usage
+    """
+    stages = stages_usage[first_stage:]
+    del stages_usage[first_stage:]
+    if not stages:
+        return None
+    with open(report_fpath, 'w') as out_f:
+        out_f.write('\t'.join(['Stage', 'Tasks', 'Jobs', 'Threads', 'Wall time (s)', 'CPU time (s)',
+                               'Threads busy (%)', 'CPU utilization (%)']) + '\n')
+        for usage in stages:
+            busy_threads = 100.0 * usage.thread_time / (usage.wall_time * usage.max_threads) if usage.wall_time else 0.0
+            out_f.write('\t'.join([usage.name, str(usage.n_tasks), str(usage.n_jobs), str(usage.max_threads),
+                                   '%.2f' % usage.wall_time, '%.2f' % usage.cpu_time,
+                                   '%.1f' % min(100.0, busy_threads), '%.1f' % usage.utilization()]) + '\n')
+    total_wall_time = sum(usage.wall_time for usage in stages)
+    total_cpu_time = sum(usage.cpu_time for usage in stages)
+    total_threads_time = sum(usage.wall_time * usage.max_threads for usage in stages)
+    logger.info('  CPU utilization of parallel stages: %.1f%% (%.1f s of CPU time in %.1f s), details are saved to %s' %
+                (100.0 * total_cpu_time / total_threads_time if total_threads_time else 0.0,
+                 total_cpu_time, total_wall_time, report_fpath))
+    return report_fpath
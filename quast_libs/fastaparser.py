@@ -6,7 +6,9 @@
 ############################################################################
 
 from __future__ import with_statement
+import mmap
 import os
+import re
 import sys
 import gzip
 import zipfile
@@ -23,14 +25,32 @@ except ImportError:
 if sys.version_info[0] == 3:
     import io
 from quast_libs import qconfig
+from quast_libs.intervals import IntervalSet
 # There is a pyfasta package -- http://pypi.python.org/pypi/pyfasta/
 # Use it!
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+FASTA_CHUNK_SIZE = 4 * 1024 * 1024
+_line_break_pattern = re.compile(b'\r\n?|\n')
+_inline_spaces = [b' ', b'\t', b'\x0b', b'\x0c']
+FASTA_INDEX_EXT = '.qfai'
+_fasta_indexes = dict()
 
-def _get_fasta_file_handler(fpath):
+
+def _is_plain_file(fpath):
+    _, ext = os.path.splitext(fpath)
+    return ext not in ['.gz', '.gzip', '.bz2', '.bzip2', '.zip']
+
+
+def _to_str(value):
+    if sys.version_info[0] == 3:
+        return value.decode()
+    return value
+
+
+def _get_fasta_file_handler(fpath, binary=False):
     fasta_file = None
 
     _, ext = os.path.splitext(fpath)
@@ -39,11 +59,12 @@ def _get_fasta_file_handler(fpath):
         logger.error('Permission denied accessing ' + fpath, to_stderr=True, exit_with_code=1)
 
     if ext in ['.gz', '.gzip']:
-        fasta_file = gzip.open(fpath, mode="rt")
+        fasta_file = gzip.open(fpath, mode="rb" if binary else "rt")
 
     elif ext in ['.bz2', '.bzip2']:
         fasta_file = bz2.BZ2File(fpath, mode="r")
-        fasta_file = _read_compressed_file(fasta_file)
+        if not binary:
+            fasta_file = _read_compressed_file(fasta_file)
 
     elif ext in ['.zip']:
         try:
@@ -61,12 +82,13 @@ def _get_fasta_file_handler(fpath):
 
             try:
                 fasta_file = zfile.open(names[0])
-                fasta_file = _read_compressed_file(fasta_file)
+                if not binary:
+                    fasta_file = _read_compressed_file(fasta_file)
             except AttributeError:
                 logger.error('Use python 2.6 or newer to work with contigs directly in zip.', exit_with_code=20)
     else:
         try:
-            fasta_file = open(fpath)
+            fasta_file = open(fpath, 'rb' if binary else 'r')
         except IOError:
             exc_type, exc_value, _ = sys.exc_info()
             logger.exception(exc_value, exit_code=1)
@@ -76,10 +98,115 @@ def _get_fasta_file_handler(fpath):
 
 def _read_compressed_file(compressed_file):
     if sys.version_info[0] == 3:
-        return io.TextIOWrapper(io.BytesIO(compressed_file.read()))  # return string instead of binary data
+        return io.TextIOWrapper(compressed_file)  # return string instead of binary data, decompressing on the fly
     return compressed_file
 
 
+def _read_chunks(fpath, chunk_size=FASTA_CHUNK_SIZE):
+    """
+        Generator that returns content of (possibly compressed) file in large binary chunks.
+        Plain files are memory-mapped, compressed files are decompressed on the fly
+    """
+    fasta_file = _get_fasta_file_handler(fpath, binary=True)
+    try:
+        if _is_plain_file(fpath) and os.path.getsize(fpath) > 0:
+            mapped_file = mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in range(0, len(mapped_file), chunk_size):
+                    yield mapped_file[offset:offset + chunk_size]
+            finally:
+                mapped_file.close()
+        else:
+            chunk = fasta_file.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = fasta_file.read(chunk_size)
+    finally:
+        fasta_file.close()
+
+
+def _join_seq_lines(seq_parts):
+    seq = b''.join(seq_parts)
+    if any(space in seq for space in _inline_spaces):
+        # rare case: spaces or tabs at the ends of lines should be stripped line by line
+        return b''.join(line.strip() for line in _line_break_pattern.split(seq))
+    return seq.translate(None, b'\r\n')
+
+
+def _is_line_start(data, pos, prev_char):
+    prev_char = data[pos - 1:pos] if pos > 0 else prev_char
+    return prev_char in (b'\n', b'\r')
+
+
+def _parse_fasta_entries(fpath):
+    """
+        Generator that returns FASTA entries in tuples (name, raw sequence parts, offset of the sequence)
+    """
+    name = None  # None means that no entry name was found yet
+    header_parts = []
+    seq_parts = []
+    seq_offset = 0
+    in_header = False
+    prev_char = b'\n'
+    data_offset = 0
+    for data in _read_chunks(fpath):
+        pos = 0
+        if prev_char == b'\r' and data[:1] == b'\n' and not seq_parts:
+            pos = 1  # \r\n line break of the entry name line was split between chunks
+            seq_offset += 1
+        while pos < len(data):
+            if in_header:
+                eol = _line_break_pattern.search(data, pos)
+                if not eol:
+                    header_parts.append(data[pos:])
+                    break
+                header_parts.append(data[pos:eol.start()])
+                name = __get_entry_name(_to_str(b''.join(header_parts)))
+                header_parts = []
+                in_header = False
+                pos = eol.end()
+                seq_offset = data_offset + pos
+            else:
+                entry_start = data.find(b'>', pos)
+                while entry_start != -1 and not _is_line_start(data, entry_start, prev_char):
+                    entry_start = data.find(b'>', entry_start + 1)
+                if entry_start == -1:
+                    seq_parts.append(data[pos:])
+                    break
+                seq_parts.append(data[pos:entry_start])
+                if name is not None:
+                    yield name, seq_parts, seq_offset
+                seq_parts = []
+                name = ''
+                in_header = True
+                pos = entry_start
+        prev_char = data[-1:]
+        data_offset += len(data)
+
+    if in_header:
+        name = __get_entry_name(_to_str(b''.join(header_parts)))
+    if name or any(seq_parts):
+        yield name or '', seq_parts, seq_offset
+
+
+def read_fasta_bytes(fpath, save_index=False):
+    """
+        Generator that returns FASTA entries in tuples (name, seq), where seq is bytes without line breaks.
+        Parses large binary chunks instead of separate lines.
+        If save_index is True, the index of the file (see get_fasta_index) is created during the same pass
+    """
+    entries = []
+    for name, seq_parts, seq_offset in _parse_fasta_entries(fpath):
+        if save_index:
+            entry, seq = _get_entry_info(fpath, name, seq_parts, seq_offset)
+            entries.append(entry)
+        else:
+            seq = _join_seq_lines(seq_parts)
+        yield name, seq
+    if save_index:
+        _save_fasta_index(fpath, entries)
+
+
 def __get_entry_name(line):
     """
         Extracts name from fasta entry line:
@@ -97,41 +224,155 @@ def get_chr_lengths_from_fastafile(fpath):
         Returns list of lengths of sequences in FASTA-file
     """
     chr_lengths = OrderedDict()
-    l = 0
-    chr_name = None
-    fasta_file = _get_fasta_file_handler(fpath)
-    for raw_line in fasta_file:
-        if raw_line.find('\r') != -1:
-            lines = raw_line.split('\r')
-        else:
-            lines = [raw_line]
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if l:  # not the first sequence in FASTA
-                    chr_lengths[chr_name] = l
-                    l = 0
-                chr_name = __get_entry_name(line)
-            else:
-                l += len(line.strip())
-
-    chr_lengths[chr_name] = l
-    fasta_file.close()
+    entries = get_fasta_index(fpath)
+    for i, entry in enumerate(entries):
+        if entry.length or i == len(entries) - 1:  # empty sequences are skipped (except the last one)
+            chr_lengths[entry.name] = entry.length
     return chr_lengths
 
 
+class FastaEntryInfo(object):
+    __slots__ = ('name', 'length', 'offset', 'line_bases', 'line_width', 'ns', 'gc')
+
+    def __init__(self, name, length, offset=0, line_bases=0, line_width=0, ns=0, gc=0):
+        self.name = name
+        self.length = length
+        self.offset = offset  # offset of the first base in the (uncompressed) file
+        self.line_bases = line_bases  # 0 if lines have different lengths and random access is not possible
+        self.line_width = line_width
+        self.ns = ns
+        self.gc = gc
+
+    def to_line(self):
+        return '\t'.join(str(value) for value in (self.name, self.length, self.offset, self.line_bases,
+                                                   self.line_width, self.ns, self.gc))
+
+    @classmethod
+    def from_line(cls, line):
+        fs = line.rstrip('\n').split('\t')
+        return FastaEntryInfo(fs[0], *[int(value) for value in fs[1:]])
+
+
+def __get_line_layout(raw_seq):
+    """
+        Returns number of bases per line and line width (as in .fai) if all lines but the last have the same length,
+        and (0, 0) otherwise
+    """
+    if not raw_seq or b'\r' in raw_seq:
+        return 0, 0
+    line_width = raw_seq.find(b'\n') + 1
+    if not line_width:
+        return len(raw_seq), len(raw_seq) + 1
+    full_lines = len(raw_seq) // line_width
+    # all line breaks should be at the ends of full lines, except the break after the last shorter line
+    last_line_break = 1 if len(raw_seq) % line_width and raw_seq.endswith(b'\n') else 0
+    if raw_seq[line_width - 1::line_width] != b'\n' * full_lines or \
+            raw_seq.count(b'\n') != full_lines + last_line_break:
+        return 0, 0
+    return line_width - 1, line_width
+
+
+def __index_key(fpath):
+    stat_info = os.stat(fpath)
+    return os.path.abspath(fpath), stat_info.st_size, stat_info.st_mtime
+
+
+def __index_header(key):
+    return '#' + '\t'.join(str(value) for value in key[1:])
+
+
+def __index_fpath(fpath):
+    if qconfig.output_dirpath and os.path.abspath(fpath).startswith(os.path.abspath(qconfig.output_dirpath) + os.sep):
+        return fpath + FASTA_INDEX_EXT
+    return None  # we do not create files outside of the output directory
+
+
+def _get_entry_info(fpath, name, seq_parts, seq_offset):
+    raw_seq = b''.join(seq_parts)
+    seq = _join_seq_lines([raw_seq])
+    line_bases, line_width = 0, 0
+    if _is_plain_file(fpath) and len(seq) + raw_seq.count(b'\n') == len(raw_seq):  # only line breaks were removed
+        line_bases, line_width = __get_line_layout(raw_seq)
+    entry = FastaEntryInfo(name, len(seq), seq_offset, line_bases, line_width,
+                           seq.count(b'N'), seq.count(b'G') + seq.count(b'C'))
+    return entry, seq
+
+
+def _save_fasta_index(fpath, entries):
+    key = __index_key(fpath)
+    _fasta_indexes[key] = entries
+    index_fpath = __index_fpath(fpath)
+    if index_fpath:
+        tmp_index_fpath = index_fpath + '.' + str(os.getpid())  # several processes may index the same file
+        try:
+            with open(tmp_index_fpath, 'w') as index_f:
+                index_f.write(__index_header(key) + '\n')
+                for entry in entries:
+                    index_f.write(entry.to_line() + '\n')
+            os.rename(tmp_index_fpath, index_fpath)
+        except (IOError, OSError):
+            pass
+
+
+def get_fasta_index(fpath):
+    """
+        Returns list of FastaEntryInfo (name, length, offset, line layout, number of Ns and GC bases) for all entries
+        of FASTA-file. The index is cached in memory and in fpath + '.qfai' (for files in the output directory)
+        and is reused until the file size or modification time changes
+    """
+    key = __index_key(fpath)
+    if key in _fasta_indexes:
+        return _fasta_indexes[key]
+    index_fpath = __index_fpath(fpath)
+    if index_fpath and os.path.isfile(index_fpath):
+        with open(index_fpath) as index_f:
+            if index_f.readline().rstrip('\n') == __index_header(key):
+                _fasta_indexes[key] = [FastaEntryInfo.from_line(line) for line in index_f]
+                return _fasta_indexes[key]
+    entries = [_get_entry_info(fpath, name, seq_parts, seq_offset)[0]
+               for name, seq_parts, seq_offset in _parse_fasta_entries(fpath)]
+    _save_fasta_index(fpath, entries)
+    return entries
+
+
+def read_fasta_entries(fpath, names):
+    """
+        Returns list of FASTA entries (in tuples: name, seq) with the specified names, in order of the file.
+        Sequences are fetched by random access if possible, otherwise the file is scanned
+    """
+    names = set(names)
+    entries = [entry for entry in get_fasta_index(fpath) if entry.name in names]
+    if not entries:
+        return []
+    if not _is_plain_file(fpath) or not all(entry.line_bases for entry in entries):
+        return [(name, seq) for name, seq in read_fasta(fpath) if name in names]
+    fasta = []
+    with open(fpath, 'rb') as fasta_file:
+        for entry in entries:
+            fasta_file.seek(entry.offset)
+            full_lines, last_line = divmod(entry.length, entry.line_bases)
+            raw_seq = fasta_file.read(full_lines * entry.line_width + last_line)
+            fasta.append((entry.name, _to_str(raw_seq.translate(None, b'\n'))))
+    return fasta
+
+
 def get_genome_stats(fasta_fpath, skip_ns=False):
+    """
+        Returns genome size, dict of chromosome lengths and dict of runs of Ns in chromosomes
+        (IntervalSet of 1-based positions)
+    """
     genome_size = 0
     reference_chromosomes = {}
     ns_by_chromosomes = {}
+    ns_pattern = re.compile('N+')
     for name, seq in read_fasta(fasta_fpath):
         chr_name = name.split()[0]
         chr_len = len(seq)
         genome_size += chr_len
-        ns_by_chromosomes[chr_name] = set(x + 1 for x, s in enumerate(seq) if s == 'N')
+        ns_by_chromosomes[chr_name] = IntervalSet.from_sorted((match.start() + 1, match.end())
+                                                              for match in ns_pattern.finditer(seq))
         if skip_ns:
-            genome_size -= len(ns_by_chromosomes[chr_name])
+            genome_size -= ns_by_chromosomes[chr_name].total_length()
         reference_chromosomes[chr_name] = chr_len
     return genome_size, reference_chromosomes, ns_by_chromosomes
 
@@ -196,31 +437,8 @@ def read_fasta(fpath):
     """
         Generator that returns FASTA entries in tuples (name, seq)
     """
-    first = True
-    seq = []
-    name = ''
-
-    fasta_file = _get_fasta_file_handler(fpath)
-
-    for raw_line in fasta_file:
-        lines = raw_line.split('\r')
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if not first:
-                    yield name, "".join(seq)
-
-                first = False
-                name = __get_entry_name(line)
-                seq = []
-            else:
-                seq.append(line.strip())
-
-    if name or seq:
-        yield name, "".join(seq)
-
-    fasta_file.close()
+    for name, seq in read_fasta_bytes(fpath):
+        yield name, _to_str(seq)
 
 
 def read_fasta_one_time(fpath):
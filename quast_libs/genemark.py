@@ -16,13 +16,13 @@ try:
 except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
-from quast_libs import reporting, qconfig, qutils
+from quast_libs import executors, reporting, qconfig, qutils
 from quast_libs.ca_utils.misc import open_gzipsafe
 from quast_libs.fastaparser import write_fasta, get_chr_lengths_from_fastafile
 from quast_libs.genes_parser import Gene
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import run_parallel
+from quast_libs.qutils import run_parallel, get_files_sizes
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -312,11 +312,12 @@ def do(fasta_fpaths, gene_lengths, out_dirpath, prokaryote, meta):
             os.mkdir(tmp_dirpath)
 
         n_jobs = min(len(fasta_fpaths), qconfig.max_threads)
-        num_threads = max(1, qconfig.max_threads // n_jobs)
         parallel_run_args = [(index, fasta_fpath, gene_lengths, out_dirpath, tool_dirpath, tmp_dirpath,
-                              gmhmm_p_function, prokaryote, num_threads)
+                              gmhmm_p_function, prokaryote, executors.AUTO_THREADS)
                              for index, fasta_fpath in enumerate(fasta_fpaths)]
-        genes_list, unique_count, full_genes, partial_genes = run_parallel(predict_genes, parallel_run_args, n_jobs)
+        genes_list, unique_count, full_genes, partial_genes = \
+            run_parallel(predict_genes, parallel_run_args, n_jobs, task_sizes=get_files_sizes(fasta_fpaths),
+                         task_names=[qutils.label_from_fpath(fasta_fpath) for fasta_fpath in fasta_fpaths])
         if not is_license_valid(out_dirpath, fasta_fpaths):
             return
 
@@ -11,6 +11,8 @@ import os
 from collections import defaultdict
 
 from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils
+from quast_libs.ca_utils.coords_store import open_coords_store, remove_coords
+from quast_libs.intervals import GenomeCoverage, IntervalIndex
 from quast_libs.log import get_logger
 from quast_libs.qutils import run_parallel
 
@@ -63,6 +65,29 @@ def chromosomes_names_dict(feature, regions, chr_names):
     return region_2_chr_name
 
 
+def iter_coords(coords_fpath, coords_store=None):
+    """
+        Yields (line index, s1, e1, s2, e2, chr_name, contig_name) for alignments in the coords file,
+        the columns of the binary store are used if it is available
+    """
+    if coords_store is not None:
+        s1s, e1s, s2s, e2s, contig_ids = coords_store.s1, coords_store.e1, coords_store.s2, coords_store.e2, coords_store.contig_ids
+        for ref_id, chr_name in enumerate(coords_store.refs):
+            for row in coords_store.ref_rows(ref_id):
+                yield row, s1s[row], e1s[row], s2s[row], e2s[row], chr_name, coords_store.contigs[contig_ids[row]]
+        return
+
+    # EXAMPLE:
+    #    [S1]     [E1]  |     [S2]     [E2]  |  [LEN 1]  [LEN 2]  |  [% IDY]  | [TAGS]
+    #=====================================================================================
+    #  338980   339138  |     2298     2134  |      159      165  |    79.76  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
+    #  374145   374355  |     2306     2097  |      211      210  |    85.45  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
+    with open(coords_fpath) as coordfile:
+        for line_idx, line in enumerate(coordfile):
+            fs = line.split()
+            yield line_idx, int(fs[0]), int(fs[1]), int(fs[3]), int(fs[4]), fs[11], fs[12]
+
+
 def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
                         reference_chromosomes, ns_by_chromosomes, containers):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
@@ -82,81 +107,54 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
             indent='  ')
         return None, None
 
-    # EXAMPLE:
-    #    [S1]     [E1]  |     [S2]     [E2]  |  [LEN 1]  [LEN 2]  |  [% IDY]  | [TAGS]
-    #=====================================================================================
-    #  338980   339138  |     2298     2134  |      159      165  |    79.76  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
-    #  374145   374355  |     2306     2097  |      211      210  |    85.45  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
-
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    genome_coverage = GenomeCoverage(reference_chromosomes)
 
-    contig_tuples = fastaparser.read_fasta(contigs_fpath)  # list of FASTA entries (in tuples: name, seq)
-    sorted_contig_tuples = sorted(enumerate(contig_tuples), key=lambda x: len(x[1][1]), reverse=True)
+    contig_entries = fastaparser.get_fasta_index(contigs_fpath)
+    sorted_contig_entries = sorted(enumerate(contig_entries), key=lambda x: x[1].length, reverse=True)
     sorted_contigs_names = []
     contigs_order = []
-    for idx, (name, _) in sorted_contig_tuples:
-        sorted_contigs_names.append(name)
+    for idx, entry in sorted_contig_entries:
+        sorted_contigs_names.append(entry.name)
         contigs_order.append(idx)
 
     features_in_contigs = [0] * len(sorted_contigs_names)  # for cumulative plots: i-th element is the number of genes in i-th contig
     operons_in_contigs = [0] * len(sorted_contigs_names)
-    aligned_blocks_by_contig_name = {} # for gene finding: contig_name --> list of AlignedBlock
+    aligned_blocks_by_chr_name = defaultdict(list)  # for gene finding: chr_name --> list of (start, end, (rank, AlignedBlock))
 
     gene_searching_enabled = len(containers)
     if qconfig.memory_efficient and gene_searching_enabled:
         logger.warning('Analysis of genes and/or operons files (provided with -g and -O) requires extensive RAM usage, consider running QUAST without them if memory consumption is critical.')
-    if gene_searching_enabled:
-        for name in sorted_contigs_names:
-            aligned_blocks_by_contig_name[name] = []
-    with open(coords_fpath) as coordfile:
-        for line in coordfile:
-            s1 = int(line.split('|')[0].split()[0])
-            e1 = int(line.split('|')[0].split()[1])
-            s2 = int(line.split('|')[1].split()[0])
-            e2 = int(line.split('|')[1].split()[1])
-            contig_name = line.split()[12].strip()
-            chr_name = line.split()[11].strip()
-
-            if chr_name not in genome_mapping:
-                logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
-                             "differ from the names in the reference. Try to remove the file and restart QUAST.")
-                return None
-
-            if gene_searching_enabled:
-                aligned_blocks_by_contig_name[contig_name].append(AlignedBlock(seqname=chr_name, start=s1, end=e1,
-                                                                               contig=contig_name, start_in_contig=s2, end_in_contig=e2))
-            for i in range(s1, e1 + 1):
-                genome_mapping[chr_name][i] = 1
-
-    for chr_name in genome_mapping.keys():
-        for i in ns_by_chromosomes[chr_name]:
-            genome_mapping[chr_name][i] = 0
-        ref_lengths[chr_name] = sum(genome_mapping[chr_name])
+    contig_ids = dict((name, contig_id) for contig_id, name in enumerate(sorted_contigs_names))
+    coords_store = open_coords_store(coords_fpath)
+    for line_idx, s1, e1, s2, e2, chr_name, contig_name in iter_coords(coords_fpath, coords_store):
+        if chr_name not in reference_chromosomes:
+            logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
+                         "differ from the names in the reference. Try to remove the file and restart QUAST.")
+            return None
+
+        if gene_searching_enabled:
+            # blocks are checked in the order of contigs (from the largest one) and then in the order of coords
+            rank = (contig_ids[contig_name], line_idx)
+            aligned_blocks_by_chr_name[chr_name].append((s1, e1, (rank, AlignedBlock(seqname=chr_name, start=s1, end=e1,
+                                                                  contig=contig_name, start_in_contig=s2, end_in_contig=e2))))
+        genome_coverage.add(chr_name, s1, e1)
+
+    for chr_name in reference_chromosomes:
+        ref_lengths[chr_name] = genome_coverage.covered_length(chr_name, ns_by_chromosomes[chr_name])
 
     if qconfig.space_efficient and coords_fpath.endswith('.filtered'):
-        os.remove(coords_fpath)
+        remove_coords(coords_fpath)
 
     # counting genome coverage and gaps number
     gaps_count = 0
     if qconfig.analyze_gaps:
         gaps_fpath = os.path.join(genome_stats_dirpath, corr_assembly_label + '_gaps.txt') if not qconfig.space_efficient else '/dev/null'
         with open(gaps_fpath, 'w') as gaps_file:
-            for chr_name, chr_len in reference_chromosomes.items():
+            for chr_name in reference_chromosomes:
                 gaps_file.write(chr_name + '\n')
-                cur_gap_size = 0
-                for i in range(1, chr_len + 1):
-                    if genome_mapping[chr_name][i] == 1 or i in ns_by_chromosomes[chr_name]:
-                        if cur_gap_size >= qconfig.min_gap_size:
-                            gaps_count += 1
-                            gaps_file.write(str(i - cur_gap_size) + ' ' + str(i - 1) + '\n')
-                        cur_gap_size = 0
-                    else:
-                        cur_gap_size += 1
-                if cur_gap_size >= qconfig.min_gap_size:
+                for gap_start, gap_end in genome_coverage.gaps(chr_name, ns_by_chromosomes[chr_name], qconfig.min_gap_size):
                     gaps_count += 1
-                    gaps_file.write(str(chr_len - cur_gap_size + 1) + ' ' + str(chr_len) + '\n')
+                    gaps_file.write(str(gap_start) + ' ' + str(gap_end) + '\n')
 
     results["gaps_count"] = gaps_count
     results[reporting.Fields.GENES + "_full"] = None
@@ -165,6 +163,8 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     results[reporting.Fields.OPERONS + "_partial"] = None
 
     # finding genes and operons
+    blocks_index_by_chr_name = dict((chr_name, IntervalIndex(blocks)) for chr_name, blocks in aligned_blocks_by_chr_name.items())
+    aligned_blocks_by_chr_name.clear()
     for container in containers:
         if not container.region_list:
             continue
@@ -176,48 +176,32 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
         found_file.write('%s\t\t%s\t%s\t%s\t%s\n' % ('ID or #', 'Start', 'End', 'Type', 'Contig'))
         found_file.write('=' * 50 + '\n')
 
-        # 0 - gene is not found,
-        # 1 - gene is found,
-        # 2 - part of gene is found
-        found_list = [0] * len(container.region_list)
-        for i, region in enumerate(container.region_list):
-            found_list[i] = 0
-            gene_blocks = []
+        for region in container.region_list:
             if region.id is None:
                 region.id = '# ' + str(region.number + 1)
-            for contig_id, name in enumerate(sorted_contigs_names):
-                cur_feature_is_found = False
-                for cur_block in aligned_blocks_by_contig_name[name]:
-                    if cur_block.seqname != region.seqname:
-                        continue
-                    if region.end <= cur_block.start or cur_block.end <= region.start:
-                        continue
-                    elif cur_block.start <= region.start and region.end <= cur_block.end:
-                        if found_list[i] == 2:  # already found as partial gene
-                            total_partial -= 1
-                        found_list[i] = 1
-                        total_full += 1
-                        contig_info = cur_block.format_gene_info(region)
-                        found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
-                        if container.kind == 'operon':
-                            operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
-                        else:
-                            features_in_contigs[contig_id] += 1
-
-                        cur_feature_is_found = True
-                        break
-                    elif min(region.end, cur_block.end) - max(region.start, cur_block.start) >= qconfig.min_gene_overlap:
-                        if found_list[i] == 0:
-                            found_list[i] = 2
-                            total_partial += 1
-                        gene_blocks.append(cur_block)
-                    if cur_feature_is_found:
-                        break
-                if cur_feature_is_found:
-                    break
+            if region.seqname not in blocks_index_by_chr_name:
+                continue
+            # blocks strictly overlapping the region, i.e. region.start < block.end and block.start < region.end
+            overlapping_blocks = blocks_index_by_chr_name[region.seqname].overlapping(region.start + 1, region.end - 1)
+            complete_blocks = [(rank, block) for rank, block in overlapping_blocks
+                               if block.start <= region.start and region.end <= block.end]
+            if complete_blocks:
+                (contig_id, _), cur_block = min(complete_blocks, key=lambda x: x[0])
+                total_full += 1
+                contig_info = cur_block.format_gene_info(region)
+                found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
+                if container.kind == 'operon':
+                    operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
+                else:
+                    features_in_contigs[contig_id] += 1
+                continue
+            gene_blocks = [(rank, block) for rank, block in overlapping_blocks
+                           if min(region.end, block.end) - max(region.start, block.start) >= qconfig.min_gene_overlap]
             # adding info about partially found genes/operons
-            if found_list[i] == 2:  # partial gene/operon
-                contig_info = ','.join([block.format_gene_info(region) for block in sorted(gene_blocks, key=lambda block: block.start)])
+            if gene_blocks:
+                total_partial += 1
+                contig_info = ','.join([block.format_gene_info(region) for rank, block in
+                                        sorted(gene_blocks, key=lambda x: (x[1].start, x[0]))])
                 found_file.write('%s\t\t%d\t%d\tpartial\t%s\n' % (region.id, region.start, region.end, contig_info))
 
         if container.kind == 'operon':
@@ -324,7 +308,8 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     parallel_run_args = [(contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
                           reference_chromosomes, ns_by_chromosomes, containers)
                         for index, contigs_fpath in enumerate(aligned_contigs_fpaths)]
-    ref_lengths, results_genes_operons_tuples = run_parallel(process_single_file, parallel_run_args, n_jobs, filter_results=True)
+    ref_lengths, results_genes_operons_tuples = run_parallel(process_single_file, parallel_run_args, n_jobs, filter_results=True,
+                                                             task_names=[qutils.label_from_fpath(fpath) for fpath in aligned_contigs_fpaths])
     num_nf_errors += len(aligned_contigs_fpaths) - len(ref_lengths)
     logger._num_nf_errors = num_nf_errors
     if not ref_lengths:
@@ -338,7 +323,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     for chr_name, chr_len in reference_chromosomes.items():
         aligned_len = max(ref_lengths_by_contigs[chr_name])
         res_file.write('\t' + chr_name + ' (total length: ' + str(chr_len) + ' bp, ' +
-                       'total length without N\'s: ' + str(chr_len - len(ns_by_chromosomes[chr_name])) +
+                       'total length without N\'s: ' + str(chr_len - ns_by_chromosomes[chr_name].total_length()) +
                        ' bp, maximal covered length: ' + str(aligned_len) + ' bp)\n')
     res_file.write('\n')
     res_file.write('total genome size: ' + str(genome_size) + '\n\n')
@@ -157,7 +157,8 @@ def do(contigs_fpaths, gene_lengths, out_dirpath):
     n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
     parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath)
                      for index, contigs_fpath in enumerate(contigs_fpaths)]
-    genes_list, unique, full_genes, partial_genes = run_parallel(predict_genes, parallel_args, n_jobs)
+    genes_list, unique, full_genes, partial_genes = run_parallel(predict_genes, parallel_args, n_jobs,
+                                                                 task_names=[qutils.label_from_fpath(fpath) for fpath in contigs_fpaths])
 
     genes_by_labels = dict()
     # saving results
@@ -31,6 +31,8 @@ THE SOFTWARE.
      */
     var genePrediction = false;
     var ContigData = function(chromosome) {
+        if (typeof icarus_tiles !== "undefined")
+            contig_data[chromosome] = getTilesContigData();
         return parseData(contig_data[chromosome]);
     };
 
@@ -134,6 +136,8 @@ THE SOFTWARE.
         drawCoverage = true;
     if (typeof gc_window_size != "undefined")
         gcFactor = gc_window_size;
+    if (typeof coverage_window_size != "undefined")
+        coverageFactor = coverage_window_size;
     var featuresMainHidden = featuresHidden || lanes.length > 3;
     var brush, brush_cov, brush_anno;
     var offsetX = 20;
@@ -489,7 +493,7 @@ THE SOFTWARE.
     getCoordsFromURL();
 
     function parseData (data) {
-        chart = { assemblies: {} };
+        var chart = { assemblies: {} };
 
         for (var assembly in data) {
             var alignments = data[assembly];
@@ -599,7 +603,11 @@ THE SOFTWARE.
             var nonOverlappingLaneId = 0;
             var blockSize = block.corr_end - block.corr_start;
             var minOverlap = Math.min(500, blockSize * 0.1);
-            if (!isContigSizePlot) {
+            if (!isContigSizePlot && typeof block.nol !== "undefined") {
+                // the lane was assigned on saving tiles of the data
+                block.nonOverlappingLane = block.nol;
+            }
+            else if (!isContigSizePlot) {
                 for (var nonOverlappingLaneId = 0; nonOverlappingLaneId < lastPosInLanes.length; nonOverlappingLaneId++){
                     if (lastPosInLanes[nonOverlappingLaneId] - block.corr_start < Math.min(minOverlap, lastBlockSizesInLanes[nonOverlappingLaneId] * 0.1))
                         break;
@@ -696,7 +704,7 @@ THE SOFTWARE.
             }
             for (var i = 0; i < laneItems.length; i++) {
                 item = laneItems[i];
-                if (!isContigSizePlot) {
+                if (!isContigSizePlot && typeof item.nol === "undefined") {
                     item.nonOverlappingLane = lastPosInLanes.length - item.nonOverlappingLane - 1;
                     if (item.triangles) {
                         for (var j = 0; j < item.triangles.length; j++) {
@@ -715,7 +723,7 @@ THE SOFTWARE.
             lanes.push({
                 id: laneId,
                 label: assemblyName,
-                maxLines: lastPosInLanes.length,
+                maxLines: typeof icarus_tiles !== "undefined" ? icarus_tiles.max_lines[assemblyName] : lastPosInLanes.length,
                 isExpanded: false,
             });
             laneId++;
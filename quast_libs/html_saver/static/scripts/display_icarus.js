@@ -11,6 +11,7 @@ function display() {
         visibleBreakpointLines = breakpointLines.filter(function (line) {
             if (line.pos < maxExtent) return line;
         });
+    loadVisibleTiles(minExtent, maxExtent);
     visItems = items.filter(function (block) {
         if (block.corr_start < maxExtent && block.corr_end > minExtent) {
             var drawLimit = 1;
@@ -1089,6 +1089,79 @@ function getNumberOfContigs(x) {
     }
 }
 
+// tiled data (--icarus-tiles): blocks are split by zoom levels and windows of the reference,
+// tiles are loaded as scripts (to work from the local files) when their region becomes visible
+var requestedTiles = {}, tilesBlocks = {}, numLoadingTiles = 0;
+
+function addTileData(tileId) {
+    requestedTiles[tileId] = true;
+    var tile = icarus_tile_data[tileId];
+    if (!tile) return;
+    for (var assembly in tile.items) {
+        if (!tilesBlocks[assembly]) tilesBlocks[assembly] = {};
+        var blocks = tile.items[assembly];
+        for (var i = 0; i < blocks.length; i++)
+            if (!tilesBlocks[assembly][blocks[i].n]) tilesBlocks[assembly][blocks[i].n] = blocks[i];
+    }
+    for (var assembly in tile.structures) {
+        for (var contig in tile.structures[assembly]) {
+            contig_structures[assembly][contig] = tile.structures[assembly][contig];
+            contig_lengths[assembly][contig] = tile.lengths[assembly][contig];
+        }
+    }
+    delete icarus_tile_data[tileId];
+}
+
+function getTilesContigData() {
+    for (var tileId in icarus_tile_data)
+        addTileData(tileId);
+    var data = {};
+    for (var i = 0; i < icarus_tiles.assemblies.length; i++) {
+        var assembly = icarus_tiles.assemblies[i];
+        var blocks = tilesBlocks[assembly] || {};
+        var nums = Object.keys(blocks).map(Number).sort(function (a, b) { return a - b; });
+        data[assembly] = nums.map(function (num) { return blocks[num]; });
+    }
+    return data;
+}
+
+function loadVisibleTiles(minExtent, maxExtent) {
+    if (typeof icarus_tiles === "undefined") return;
+    var minVisibleLen = (maxExtent - minExtent) / chartWidth;
+    for (var level = 0; level < icarus_tiles.windows.length; level++) {
+        // blocks of the level are shorter than the window of the previous level / resolution
+        if (level > 0 && icarus_tiles.windows[level - 1] / icarus_tiles.resolution <= minVisibleLen)
+            break;
+        var windowSize = icarus_tiles.windows[level];
+        for (var i = Math.floor(minExtent / windowSize); i <= Math.floor(maxExtent / windowSize); i++) {
+            var tileId = level + '_' + i;
+            if (icarus_tiles.tiles[tileId] && !requestedTiles[tileId])
+                loadTile(tileId);
+        }
+    }
+}
+
+function loadTile(tileId) {
+    requestedTiles[tileId] = true;
+    numLoadingTiles++;
+    var script = document.createElement('script');
+    script.type = 'text/javascript';
+    script.src = icarus_tiles.dir + '/' + tileId + '.js';
+    script.onload = script.onerror = function () {
+        addTileData(tileId);
+        numLoadingTiles--;
+        if (!numLoadingTiles) updateTilesItems();
+    };
+    document.body.appendChild(script);
+}
+
+function updateTilesItems() {
+    items = parseData(getTilesContigData()).items;
+    getMiniItems(items);  // sets classes of the new blocks
+    showMisassemblies();
+    display();
+}
+
 function getScrollBarWidth() {
     var $outer = $('<div>').css({visibility: 'hidden', width: 100, overflow: 'scroll'}).appendTo('body'),
         widthWithScroll = $('<div>').css({width: '100%'}).appendTo($outer).outerWidth();
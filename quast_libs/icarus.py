@@ -31,6 +31,7 @@ import quast_libs.html_saver.html_saver as html_saver
 
 from quast_libs import reporting
 from quast_libs.log import get_logger
+from quast_libs.reads_analyzer import COVERAGE_FACTOR
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 
@@ -161,9 +162,10 @@ def js_data_gen(assemblies, contigs_fpaths, chromosomes_length, output_dirpath,
 
     chr_full_names, contig_names_by_refs = group_references(chr_names, contig_names_by_refs, chromosomes_length, ref_fpath)
 
-    cov_data, max_depth = parse_cov_fpath(cov_fpath, chr_names, chr_full_names, contig_names_by_refs)
-    physical_cov_data, physical_max_depth = parse_cov_fpath(physical_cov_fpath, chr_names, chr_full_names, contig_names_by_refs)
-    gc_data, max_gc = parse_cov_fpath(gc_fpath, chr_names, chr_full_names, contig_names_by_refs)
+    cov_data, max_depth, cov_window_size = parse_cov_fpath(cov_fpath, chr_names, chr_full_names, contig_names_by_refs)
+    physical_cov_data, physical_max_depth, cov_window_size = parse_cov_fpath(physical_cov_fpath, chr_names, chr_full_names,
+                                                                             contig_names_by_refs, window_size=cov_window_size)
+    gc_data, max_gc, gc_window_size = parse_cov_fpath(gc_fpath, chr_names, chr_full_names, contig_names_by_refs)
 
     chr_sizes = {}
     num_contigs = {}
@@ -208,17 +210,24 @@ def js_data_gen(assemblies, contigs_fpaths, chromosomes_length, output_dirpath,
         cov_data_str = format_cov_data(chr, cov_data, 'coverage_data', max_depth, 'reads_max_depth') if cov_data else None
         physical_cov_data_str = format_cov_data(chr, physical_cov_data, 'physical_coverage_data', physical_max_depth, 'physical_max_depth') \
             if physical_cov_data else None
+        if cov_window_size and cov_window_size != COVERAGE_FACTOR:
+            for data in (cov_data_str, physical_cov_data_str):
+                if data:
+                    data.append('var coverage_window_size = ' + str(cov_window_size) + ';')
         gc_data_str = format_cov_data(chr, gc_data, 'gc_data', 100, 'max_gc') if gc_data else None
 
-        alignment_viewer_fpath, ref_data_str, contigs_structure_str, additional_assemblies_data, ms_selectors, num_misassemblies[chr], aligned_assemblies[chr] = \
+        alignment_viewer_fpath, ref_data_str, contigs_structure_str, additional_assemblies_data, ms_selectors, num_misassemblies[chr], \
+            aligned_assemblies[chr], tiles_scripts = \
             prepare_alignment_data_for_one_ref(chr, chr_full_names, chr_names_by_id, ref_contigs, data_str, chr_to_aligned_blocks, structures_by_labels,
                                                contigs_by_assemblies, ambiguity_alignments_by_labels=ambiguity_alignments_by_labels,
                                                cov_data_str=cov_data_str, physical_cov_data_str=physical_cov_data_str, gc_data_str=gc_data_str,
-                                               contig_names_by_refs=contig_names_by_refs, output_dir_path=output_all_files_dir_path)
+                                               contig_names_by_refs=contig_names_by_refs, output_dir_path=output_all_files_dir_path,
+                                               ref_len=chr_size)
         ref_name = qutils.name_from_fpath(ref_fpath)
         save_alignment_data_for_one_ref(chr, ref_contigs, ref_name, json_output_dir, alignment_viewer_fpath, ref_data_str, ms_selectors,
                                         ref_data=ref_data, features_data=features_data, assemblies_data=assemblies_data,
-                                        contigs_structure_str=contigs_structure_str, additional_assemblies_data=additional_assemblies_data)
+                                        contigs_structure_str=contigs_structure_str, additional_assemblies_data=additional_assemblies_data,
+                                        tiles_scripts=tiles_scripts)
 
     contigs_sizes_str, too_many_contigs = get_contigs_data(contigs_by_assemblies, nx_marks, assemblies_n50, structures_by_labels,
                                                            contig_names_by_refs, chr_names, chr_full_names)
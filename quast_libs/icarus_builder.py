@@ -6,6 +6,8 @@
 # All Rights Reserved
 # See file LICENSE for details.
 ############################################################################
+from __future__ import with_statement
+import os
 from os.path import join
 from collections import defaultdict
 try:
@@ -73,7 +75,8 @@ def add_contig_structure_data(data_str, structure, ref_contigs, chr_full_names,
 
 
 def get_contigs_structure(assemblies_contigs, chr_to_aligned_blocks, contigs_by_assemblies, ref_contigs, chr_full_names,
-                          contig_names_by_refs, structures_by_labels, used_chromosomes, links_to_chromosomes, chr_names_by_id):
+                          contig_names_by_refs, structures_by_labels, used_chromosomes, links_to_chromosomes, chr_names_by_id,
+                          tiles=None):
     contigs_data_str = []
     contigs_data_str.append('var contig_lengths = {};')
     contigs_data_str.append('var contig_structures = {};')
@@ -84,23 +87,124 @@ def get_contigs_structure(assemblies_contigs, chr_to_aligned_blocks, contigs_by_
         for contig in contigs_by_assemblies[assembly]:
             if contig.name not in used_contigs:
                 continue
-            contigs_data_str.append('contig_lengths["' + assembly + '"]["' + contig.name + '"] = ' + str(contig.size) + ';')
-            data_str = ['contig_structures["' + assembly + '"]["' + contig.name + '"] = [ ']
+            data_str = ['[ ']
             contig_structure = structures_by_labels[assembly][contig.name]
             data_str = add_contig_structure_data(data_str, contig_structure, ref_contigs, chr_full_names,
                                                  contig_names_by_refs, used_chromosomes, links_to_chromosomes, chr_names_by_id)
-            data_str.append('];')
-            contigs_data_str.extend(data_str)
+            data_str.append(']')
+            structure_str = '\n'.join(data_str)
+            if tiles:  # structures are saved into the tiles with blocks of the contig
+                tiles.add_contig(assembly, contig.name, contig.size, structure_str)
+                continue
+            contigs_data_str.append('contig_lengths["' + assembly + '"]["' + contig.name + '"] = ' + str(contig.size) + ';')
+            contigs_data_str.append('contig_structures["' + assembly + '"]["' + contig.name + '"] = ' + structure_str + ';')
     contigs_data_str = '\n'.join(contigs_data_str)
     return contigs_data_str
 
 
+class AlignmentTiles(object):
+    """
+    Data of the contig alignment viewer split into tiles, which are loaded by the viewer on demand.
+    A block is put into the coarsest zoom level where it is visible (longer than window / resolution)
+    and into the tiles of the windows of this level it overlaps. Each tile is written into a separate JS file
+    """
+    def __init__(self, output_dir_path, html_name, ref_len):
+        self.dirname = html_name + '_tiles'
+        self.dirpath = join(output_dir_path, self.dirname)
+        self.resolution = qconfig.icarus_tile_resolution
+        self.windows = [ref_len + 1]
+        while self.windows[-1] > qconfig.icarus_tile_min_window:
+            self.windows.append((self.windows[-1] + 1) // 2)
+        self.blocks = OrderedDict()  # assembly --> list of (start, end, lane, contig name, block_str)
+        self.lanes_ends = dict()  # assembly --> list of (end, size) of the last blocks in the lanes
+        self.contigs = defaultdict(dict)  # assembly --> contig name --> (size, structure_str)
+
+    def add_assembly(self, assembly):
+        self.blocks[assembly] = []
+        self.lanes_ends[assembly] = []
+
+    def add_block(self, assembly, name, start, end, block_str):
+        # blocks are distributed into non-overlapping lanes in the same way as in the viewer (see collapseLanes),
+        # so the layout does not change when new tiles are loaded
+        lanes_ends = self.lanes_ends[assembly]
+        block_size = end - start
+        min_overlap = min(500, block_size * 0.1)
+        lane = len(lanes_ends)
+        for i, (lane_end, lane_block_size) in enumerate(lanes_ends):
+            if lane_end - start < min(min_overlap, lane_block_size * 0.1):
+                lane = i
+                break
+        if lane == len(lanes_ends):
+            lanes_ends.append((end, block_size))
+        elif end > lanes_ends[lane][0]:
+            lanes_ends[lane] = (end, block_size)
+        self.blocks[assembly].append((start, end, lane, name, block_str))
+
+    def add_contig(self, assembly, name, size, structure_str):
+        self.contigs[assembly][name] = (size, structure_str)
+
+    def get_level(self, block_len):
+        for level, window in enumerate(self.windows):
+            if block_len * self.resolution >= window:
+                return level
+        return len(self.windows) - 1
+
+    def get_tile_id(self, level, window_idx):
+        return str(level) + '_' + str(window_idx)
+
+    def save(self):
+        """
+        Writes the tiles and returns the index of tiles for the viewer and scripts loading the tiles of the first level
+        """
+        tiles_blocks = OrderedDict()  # tile id --> assembly --> numbers of blocks
+        for assembly, blocks in self.blocks.items():
+            for num, (start, end, lane, name, block_str) in enumerate(blocks):
+                level = self.get_level(end - start)
+                window = self.windows[level]
+                for window_idx in range(start // window, end // window + 1):
+                    tile_id = self.get_tile_id(level, window_idx)
+                    tiles_blocks.setdefault(tile_id, OrderedDict()).setdefault(assembly, []).append(num)
+
+        if not os.path.isdir(self.dirpath):
+            os.makedirs(self.dirpath)
+        for tile_id, blocks_by_assemblies in tiles_blocks.items():
+            items_str, structures_str, lengths_str = [], [], []
+            for assembly, nums in blocks_by_assemblies.items():
+                blocks = self.blocks[assembly]
+                max_lines = len(self.lanes_ends[assembly])
+                items_str.append('"' + assembly + '": [ \n' + ',\n'.join(
+                    '{n:' + str(num) + ',nol:' + str(max_lines - blocks[num][2] - 1) + ',' + blocks[num][4][1:]
+                    for num in nums) + ']')
+                contig_names = OrderedDict((blocks[num][3], True) for num in nums)
+                contigs = self.contigs[assembly]
+                structures_str.append('"' + assembly + '": {' + ',\n'.join(
+                    '"' + name + '": ' + contigs[name][1] for name in contig_names if name in contigs) + '}')
+                lengths_str.append('"' + assembly + '": {' + ','.join(
+                    '"' + name + '": ' + str(contigs[name][0]) for name in contig_names if name in contigs) + '}')
+            with open(join(self.dirpath, tile_id + '.js'), 'w') as out_f:
+                out_f.write('icarus_tile_data["' + tile_id + '"] = {items: {' + ',\n'.join(items_str) + '},\n' +
+                            'structures: {' + ',\n'.join(structures_str) + '},\n' +
+                            'lengths: {' + ',\n'.join(lengths_str) + '}};\n')
+
+        index_str = 'var icarus_tile_data = {};\n'
+        index_str += 'var icarus_tiles = {dir: "' + self.dirname + '", resolution: ' + str(self.resolution) + \
+                     ', windows: [' + ','.join(str(window) for window in self.windows) + ']' + \
+                     ', assemblies: [' + ','.join('"' + assembly + '"' for assembly in self.blocks) + ']' + \
+                     ', max_lines: {' + ','.join('"' + assembly + '": ' + str(len(lanes_ends))
+                                                 for assembly, lanes_ends in self.lanes_ends.items()) + '}' + \
+                     ', tiles: {' + ','.join('"' + tile_id + '": 1' for tile_id in tiles_blocks) + '}};\n'
+        first_level_scripts = ''.join('<script type="text/javascript" src="' + self.dirname + '/' + tile_id + '.js"></script>\n'
+                                      for tile_id in tiles_blocks if tile_id.startswith('0_'))
+        return index_str, first_level_scripts
+
+
 def prepare_alignment_data_for_one_ref(chr, chr_full_names, chr_names_by_id, ref_contigs, data_str, chr_to_aligned_blocks,
                                        structures_by_labels, contigs_by_assemblies, ambiguity_alignments_by_labels=None,
                                        contig_names_by_refs=None, output_dir_path=None,
-                                       cov_data_str=None, physical_cov_data_str=None, gc_data_str=None):
+                                       cov_data_str=None, physical_cov_data_str=None, gc_data_str=None, ref_len=None):
     html_name = get_html_name(chr, chr_full_names)
     alignment_viewer_fpath = join(output_dir_path, html_name + '.html')
+    tiles = AlignmentTiles(output_dir_path, html_name, ref_len) if qconfig.icarus_tiles else None
 
     additional_assemblies_data = ''
     data_str.append('var links_to_chromosomes;')
@@ -120,7 +224,10 @@ def prepare_alignment_data_for_one_ref(chr, chr_full_names, chr_names_by_id, ref
     assemblies_contigs = defaultdict(set)
     ms_types = dict()
     for assembly in chr_to_aligned_blocks.keys():
-        data_str.append('contig_data["' + chr + '"]["' + assembly + '"] = [ ')
+        if tiles:
+            tiles.add_assembly(assembly)
+        else:
+            data_str.append('contig_data["' + chr + '"]["' + assembly + '"] = [ ')
         ms_types[assembly] = defaultdict(int)
         contigs = dict((contig.name, contig) for contig in contigs_by_assemblies[assembly])
         for num_contig, ref_contig in enumerate(ref_contigs):
@@ -179,34 +286,40 @@ def prepare_alignment_data_for_one_ref(chr, chr_full_names, chr_names_by_id, ref
                             gene_info = '{start:' + str(gene.start) + ',end:' + str(gene.end) + ',corr_start:' + \
                                         str(corr_start) + ',corr_end:' + str(corr_end) + '}'
                             genes.append(gene_info)
-                    data_str.append('{name:"' + alignment.name + '",corr_start:' + str(alignment.start) + ',corr_end:' +
-                                    str(alignment.end) + ',start:' + str(alignment.unshifted_start) + ',end:' +
-                                    str(alignment.unshifted_end) + ',misassemblies:"' + alignment.misassemblies + '",mis_ends:"' + misassembled_ends + '"')
+                    block_str = ['{name:"' + alignment.name + '",corr_start:' + str(alignment.start) + ',corr_end:' +
+                                 str(alignment.end) + ',start:' + str(alignment.unshifted_start) + ',end:' +
+                                 str(alignment.unshifted_end) + ',misassemblies:"' + alignment.misassemblies + '",mis_ends:"' + misassembled_ends + '"']
                     if alignment.similar:
-                        data_str[-1] += ',similar:"True"'
+                        block_str[-1] += ',similar:"True"'
                     if alignment.ambiguous:
-                        data_str[-1] += ',ambiguous:"True"'
+                        block_str[-1] += ',ambiguous:"True"'
                     if alignment.is_best_set:
-                        data_str[-1] += ',is_best:"True"'
+                        block_str[-1] += ',is_best:"True"'
                     if contig_more_unaligned:
-                        data_str[-1] += ',more_unaligned:"True"'
+                        block_str[-1] += ',more_unaligned:"True"'
 
                     aligned_assemblies.add(alignment.label)
                     if overlapped_contigs[alignment]:
-                        data_str.append(',overlaps:[ ')
-                        data_str.append(','.join(overlapped_contigs[alignment]))
-                        data_str.append(']')
+                        block_str.append(',overlaps:[ ')
+                        block_str.append(','.join(overlapped_contigs[alignment]))
+                        block_str.append(']')
                     if qconfig.gene_finding:
-                        data_str.append(',genes:[' + ','.join(genes) + ']')
+                        block_str.append(',genes:[' + ','.join(genes) + ']')
                     if ambiguity_alignments_by_labels and qconfig.ambiguity_usage == 'all':
-                        data_str.append(',ambiguous_alignments:[ ')
-                        data_str = add_contig_structure_data(data_str, ambiguity_alignments_by_labels[alignment.label][alignment.name],
-                                                             ref_contigs, chr_full_names, contig_names_by_refs,
-                                                             used_chromosomes, links_to_chromosomes, chr_names_by_id)
-                        data_str[-1] = data_str[-1][:-1] + '],'
-                    data_str[-1] = data_str[-1] + '},'
-
-        data_str[-1] = data_str[-1][:-1] + '];'
+                        block_str.append(',ambiguous_alignments:[ ')
+                        block_str = add_contig_structure_data(block_str, ambiguity_alignments_by_labels[alignment.label][alignment.name],
+                                                              ref_contigs, chr_full_names, contig_names_by_refs,
+                                                              used_chromosomes, links_to_chromosomes, chr_names_by_id)
+                        block_str[-1] = block_str[-1][:-1] + '],'
+                    block_str[-1] = block_str[-1] + '}'
+                    if tiles:
+                        tiles.add_block(assembly, alignment.name, alignment.start, alignment.end, '\n'.join(block_str))
+                    else:
+                        block_str[-1] += ','
+                        data_str.extend(block_str)
+
+        if not tiles:
+            data_str[-1] = data_str[-1][:-1] + '];'
         assembly_len = assemblies_len[assembly]
         assembly_contigs = len(assemblies_contigs[assembly])
         local_misassemblies = ms_types[assembly]['local'] // 2
@@ -244,12 +357,18 @@ def prepare_alignment_data_for_one_ref(chr, chr_full_names, chr_names_by_id, ref
         ms_selectors.append((ms_type, ms_name, str(ms_count)))
 
     contigs_structure_str = get_contigs_structure(assemblies_contigs, chr_to_aligned_blocks, contigs_by_assemblies, ref_contigs, chr_full_names,
-                                                   contig_names_by_refs, structures_by_labels, used_chromosomes, links_to_chromosomes, chr_names_by_id)
+                                                   contig_names_by_refs, structures_by_labels, used_chromosomes, links_to_chromosomes, chr_names_by_id,
+                                                   tiles=tiles)
+    tiles_scripts = ''
+    if tiles:
+        tiles_index_str, tiles_scripts = tiles.save()
+        data_str.append(tiles_index_str)
 
     if contig_names_by_refs:
         data_str.append(''.join(links_to_chromosomes))
     data_str = '\n'.join(data_str)
-    return alignment_viewer_fpath, data_str, contigs_structure_str, additional_assemblies_data, ms_selectors, num_misassemblies, aligned_assemblies
+    return alignment_viewer_fpath, data_str, contigs_structure_str, additional_assemblies_data, ms_selectors, num_misassemblies, \
+           aligned_assemblies, tiles_scripts
 
 
 def add_contig(cum_length, contig, not_used_nx, assemblies_n50, assembly, contigs, contig_size_lines, num, structures_by_labels,
@@ -351,7 +470,8 @@ def get_contigs_data(contigs_by_assemblies, nx_marks, assemblies_n50, structures
 
 
 def save_alignment_data_for_one_ref(chr_name, ref_contigs, ref_name, json_output_dir, alignment_viewer_fpath, data_str, ms_selectors,
-                                    ref_data='', features_data='', assemblies_data='', contigs_structure_str='', additional_assemblies_data=''):
+                                    ref_data='', features_data='', assemblies_data='', contigs_structure_str='', additional_assemblies_data='',
+                                    tiles_scripts=''):
     alignment_viewer_template_fpath = html_saver.get_real_path(qconfig.icarus_viewers_template_fname)
     data_dict = dict()
     chr_data = 'chromosome = "' + chr_name + '";\n'
@@ -364,7 +484,7 @@ def save_alignment_data_for_one_ref(chr_name, ref_contigs, ref_name, json_output
     all_data = ref_data + assemblies_data + additional_assemblies_data + chr_data + features_data + data_str + contigs_structure_str
     data_dict['title'] = 'Contig alignment viewer'
     data_dict['reference'] = chr_name
-    data_dict['data'] = '<script type="text/javascript">' + all_data + '</script>'
+    data_dict['data'] = '<script type="text/javascript">' + all_data + '</script>' + tiles_scripts
     data_dict['misassemblies_checkboxes'] = []
     for (ms_type, ms_name, ms_count) in ms_selectors:
         checkbox = {'ms_type': ms_type, 'ms_name': ms_name, 'ms_count': ms_count}
@@ -13,6 +13,7 @@ from collections import defaultdict
 
 from quast_libs import fastaparser, qconfig, qutils
 from quast_libs.icarus_utils import Alignment, Contig
+from quast_libs.tracks import open_track, GC
 
 
 def parse_aligner_contig_report(report_fpath, ref_names, cumulative_ref_lengths):
@@ -80,46 +81,63 @@ def parse_aligner_contig_report(report_fpath, ref_names, cumulative_ref_lengths)
 
 def parse_contigs_fpath(contigs_fpath):
     contigs = []
-    for name, seq in fastaparser.read_fasta(contigs_fpath):
-        contig = Contig(name=name, size=len(seq))
+    for entry in fastaparser.get_fasta_index(contigs_fpath):
+        contig = Contig(name=entry.name, size=entry.length)
         contigs.append(contig)
     return contigs
 
 
-def parse_cov_fpath(cov_fpath, chr_names, chr_full_names, contig_names_by_refs):
+def get_cov_window_size(track, contigs):
+    window_size = track.bin_size
+    total_len = sum(track.get_length(contig) for contig in contigs if contig in track)
+    while total_len // window_size > qconfig.icarus_max_coverage_points:
+        window_size *= track.zoom_factor
+    return window_size
+
+
+def parse_cov_fpath(cov_fpath, chr_names, chr_full_names, contig_names_by_refs, window_size=None):
     if not cov_fpath:
-        return None, None
+        return None, None, window_size
     cov_data = defaultdict(list)
     max_depth = defaultdict(int)
     chr_contigs = []
-    with open(cov_fpath, 'r') as coverage:
-        contig_to_chr = dict()
-        for chr in chr_full_names:
-            if contig_names_by_refs:
-                contigs = [contig for contig in chr_names if contig_names_by_refs[contig] == chr]
-            elif len(chr_full_names) == 1:
-                contigs = chr_names
-            else:
-                contigs = [chr]
-            for contig in contigs:
-                contig_to_chr[contig] = chr
-            chr_contigs.extend(contigs)
-        data_by_contig = [[] for x in range(len(chr_contigs))]
-        chrom_index = None
-        for index, line in enumerate(coverage):
-            fs = line.split()
-            if line.startswith('#'):
-                chr_name = fs[0][1:]
-                chrom_index = chr_contigs.index(chr_name) if chr_name in chr_contigs else None
-            elif chrom_index is not None:
-                depth = int(float(fs[1]))
-                data_by_contig[chrom_index].append(depth)
-        for i, contig in enumerate(chr_contigs):
-            chrom = contig_to_chr[contig]
-            cov_data[chrom].extend(data_by_contig[i])
-        for chrom, depths in cov_data.items():
-            max_depth[chrom] = max(depths)
-    return cov_data, max_depth
+    contig_to_chr = dict()
+    for chr in chr_full_names:
+        if contig_names_by_refs:
+            contigs = [contig for contig in chr_names if contig_names_by_refs[contig] == chr]
+        elif len(chr_full_names) == 1:
+            contigs = chr_names
+        else:
+            contigs = [chr]
+        for contig in contigs:
+            contig_to_chr[contig] = chr
+        chr_contigs.extend(contigs)
+    data_by_contig = dict((contig, []) for contig in chr_contigs)
+    track = open_track(cov_fpath)
+    if track is not None:  # values of windows are taken from the multi-resolution track
+        if track.kind == GC:
+            window_size = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size
+        elif not window_size:
+            window_size = get_cov_window_size(track, chr_contigs)
+        for contig in chr_contigs:
+            if contig in track:
+                data_by_contig[contig] = track.get_values(contig, window_size, only_full=track.kind != GC)[1]
+    else:
+        with open(cov_fpath, 'r') as coverage:
+            contig_data = None
+            for index, line in enumerate(coverage):
+                fs = line.split()
+                if line.startswith('#'):
+                    contig_data = data_by_contig.get(fs[0][1:])
+                elif contig_data is not None:
+                    depth = int(float(fs[1]))
+                    contig_data.append(depth)
+    for contig in chr_contigs:
+        chrom = contig_to_chr[contig]
+        cov_data[chrom].extend(data_by_contig[contig])
+    for chrom, depths in cov_data.items():
+        max_depth[chrom] = max(depths)
+    return cov_data, max_depth, window_size
 
 
 def parse_features_data(features, cumulative_ref_lengths, ref_names):
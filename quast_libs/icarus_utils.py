@@ -10,6 +10,8 @@
 from __future__ import with_statement
 
 import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 
 from quast_libs import qconfig, qutils
 from quast_libs.html_saver.html_saver import trim_ref_name
@@ -72,6 +74,7 @@ class Assembly:
         self.alignments = []
         self.misassembled_contig_ids = []
         self.contigs_by_ids = {}
+        self._starts_index = None
 
         i = 0
         for block in aligned_blocks:
@@ -91,18 +94,39 @@ class Assembly:
             self.alignments.append(block)
             self.contigs_by_ids[c_id].alignments.append(len(self.alignments) - 1)
 
+    def _get_starts_index(self):
+        """
+        Index for the search of similar alignments: reference --> (sorted starts of alignments, their indexes)
+        """
+        if self._starts_index is None:
+            rows_by_ref = defaultdict(list)
+            for i, alignment in enumerate(self.alignments):
+                rows_by_ref[alignment.ref_name].append((alignment.start, i))
+            self._starts_index = {}
+            for ref_name, rows in rows_by_ref.items():
+                rows.sort()
+                self._starts_index[ref_name] = ([start for start, i in rows], [i for start, i in rows])
+        return self._starts_index
+
     def find(self, alignment):
+        """
+        Returns the first alignment similar to the passed one (see Alignment.compare_inexact) or -1,
+        only alignments with starts in the allowed range are checked
+        """
         if alignment.length() < qconfig.min_similar_contig_size:
             return -1
 
-        i = 0
-        while i < len(self.alignments) and not alignment.compare_inexact(self.alignments[i]):
-            i += 1
-
-        if i == len(self.alignments):
+        starts_index = self._get_starts_index()
+        if alignment.ref_name not in starts_index:
             return -1
-        else:
-            return i
+        starts, ids = starts_index[alignment.ref_name]
+        # the range is extended by 1 to avoid rounding issues, the candidates are checked by compare_inexact anyway
+        max_delta = qconfig.contig_len_delta * abs(alignment.end - alignment.start) + 1
+        found_id = -1
+        for i in ids[bisect_left(starts, alignment.start - max_delta):bisect_right(starts, alignment.start + max_delta)]:
+            if (found_id == -1 or i < found_id) and alignment.compare_inexact(self.alignments[i]):
+                found_id = i
+        return found_id
 
     def apply_color(self, settings):
         for block in self.alignments:
@@ -0,0 +1,209 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+from __future__ import with_statement
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+
+
+class IntervalSet(object):
+    """
+    Sorted list of disjoint closed intervals [start, end] in 1-based coordinates (as in coords files).
+    Intervals are kept in two compact arrays, so memory depends on the number of intervals,
+    not on the number of covered positions.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, intervals=None):
+        self.starts = array('l')
+        self.ends = array('l')
+        if intervals:
+            self._merge_sorted(sorted(intervals))
+
+    def _merge_sorted(self, intervals):
+        starts, ends = self.starts, self.ends
+        for start, end in intervals:
+            if start > end:
+                continue
+            if ends and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+
+    @classmethod
+    def from_sorted(cls, intervals):
+        """
+            Takes iterable of intervals sorted by start, merges overlapping and adjacent ones
+        """
+        interval_set = cls()
+        interval_set._merge_sorted(intervals)
+        return interval_set
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __contains__(self, pos):
+        idx = bisect_right(self.starts, pos) - 1
+        return idx >= 0 and pos <= self.ends[idx]
+
+    def __getstate__(self):
+        return self.starts, self.ends
+
+    def __setstate__(self, state):
+        self.starts, self.ends = state
+
+    def total_length(self):
+        return sum(self.ends) - sum(self.starts) + len(self.starts)
+
+    def union(self, other):
+        return IntervalSet(list(self) + list(other))
+
+    def subtract(self, other):
+        """
+            Returns intervals of self with all positions from other removed
+        """
+        result = IntervalSet()
+        other_starts, other_ends = other.starts, other.ends
+        idx = 0
+        for start, end in self:
+            while idx < len(other_starts) and other_ends[idx] < start:
+                idx += 1
+            cur_start = start
+            i = idx
+            while i < len(other_starts) and other_starts[i] <= end:
+                if other_starts[i] > cur_start:
+                    result.starts.append(cur_start)
+                    result.ends.append(other_starts[i] - 1)
+                cur_start = max(cur_start, other_ends[i] + 1)
+                i += 1
+            if cur_start <= end:
+                result.starts.append(cur_start)
+                result.ends.append(end)
+        return result
+
+    def complement(self, start, end):
+        """
+            Returns intervals within [start, end] not covered by self
+        """
+        return IntervalSet([(start, end)]).subtract(self)
+
+
+class GenomeCoverage(object):
+    """
+    Collects aligned blocks per chromosome and computes covered bases and gaps
+    by merging sorted intervals instead of marking every base of the reference.
+    Memory scales with the number of alignments rather than with the genome length.
+    """
+    def __init__(self, chr_lengths):
+        self.chr_lengths = chr_lengths
+        self.blocks = defaultdict(list)
+
+    def add(self, chr_name, start, end, cyclic=False):
+        """
+            Adds block [start, end]. If cyclic is True, a block with start > end
+            is treated as going through the end of the chromosome to its beginning
+        """
+        chr_len = self.chr_lengths[chr_name]
+        if cyclic and start > end:
+            self.blocks[chr_name].append((start, chr_len))
+            self.blocks[chr_name].append((1, end))
+        else:
+            self.blocks[chr_name].append((start, min(end, chr_len)))
+
+    def covered(self, chr_name, ns=None):
+        covered = IntervalSet(self.blocks.get(chr_name))
+        if ns:
+            covered = covered.subtract(ns)
+        return covered
+
+    def covered_length(self, chr_name, ns=None):
+        return self.covered(chr_name, ns).total_length()
+
+    def total_covered_length(self, ns_by_chromosomes=None):
+        return sum(self.covered_length(chr_name, ns_by_chromosomes[chr_name] if ns_by_chromosomes else None)
+                   for chr_name in self.blocks)
+
+    def gaps(self, chr_name, ns=None, min_gap_size=1):
+        covered = self.covered(chr_name)
+        if ns:
+            covered = covered.union(ns)
+        return [(start, end) for start, end in covered.complement(1, self.chr_lengths[chr_name])
+                if end - start + 1 >= min_gap_size]
+
+
+class IntervalIndex(object):
+    """
+    Static index of closed intervals [start, end] with attached values for overlap queries.
+    It is an implicit interval tree over the intervals sorted by start: the node i of level k
+    covers intervals i - 2^k + 1 .. i + 2^k - 1 and keeps the max end of its subtree.
+    """
+    __slots__ = ('starts', 'ends', 'values', 'max_ends', 'suffix_max_ends', 'max_level')
+
+    def __init__(self, intervals):
+        """
+            Takes iterable of (start, end, value), intervals with equal starts keep their order
+        """
+        intervals = sorted(intervals, key=lambda x: x[0])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.values = [value for _, _, value in intervals]
+        n = len(self.starts)
+        self.suffix_max_ends = [float('-inf')] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            self.suffix_max_ends[i] = max(self.ends[i], self.suffix_max_ends[i + 1])
+        self.max_ends = list(self.ends)
+        self.max_level = 0
+        while (1 << (self.max_level + 1)) <= n:
+            self.max_level += 1
+        for level in range(1, self.max_level + 1):
+            half = 1 << (level - 1)
+            for i in range((1 << level) - 1, n, 1 << (level + 1)):
+                self.max_ends[i] = max(self.ends[i], self.max_ends[i - half], self._subtree_max_end(i + half, level - 1))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _subtree_max_end(self, node, level):
+        if node < len(self.max_ends):
+            return self.max_ends[node]
+        # the node is beyond the last interval, only the beginning of its subtree exists
+        return self.suffix_max_ends[min(node - (1 << level) + 1, len(self.starts))]
+
+    def overlapping(self, start, end):
+        """
+            Returns values of intervals overlapping [start, end] in the order of interval starts
+        """
+        n = len(self.starts)
+        if not n:
+            return []
+        found = []
+        stack = [((1 << self.max_level) - 1, self.max_level)]
+        while stack:
+            node, level = stack.pop()
+            if level <= 2:  # small subtree, just check all its intervals
+                for i in range(node - (1 << level) + 1, min(node + (1 << level), n)):
+                    if self.starts[i] > end:
+                        break
+                    if self.ends[i] >= start:
+                        found.append(i)
+                continue
+            half = 1 << (level - 1)
+            if self._subtree_max_end(node - half, level - 1) >= start:
+                stack.append((node - half, level - 1))
+            if node < n and self.starts[node] > end:  # the node and its right subtree start after the query
+                continue
+            if node < n and self.ends[node] >= start:
+                found.append(node)
+            if self._subtree_max_end(node + half, level - 1) >= start:
+                stack.append((node + half, level - 1))
+        return [self.values[i] for i in sorted(found)]
@@ -13,7 +13,7 @@ from os.path import join, abspath, isfile, isdir
 
 import sys
 
-from quast_libs import qconfig, qutils
+from quast_libs import executors, qconfig, qutils
 from quast_libs.qutils import assert_file_exists, set_up_output_dir, check_dirpath, is_non_empty_file
 from quast_libs.qconfig import get_mode
 
@@ -433,6 +433,22 @@ def parse_options(logger, quast_args):
              dest='alignments_for_reuse_dirpath',
              type='string')
          ),
+        (['--fast-checksums'], dict(
+             dest='fast_checksums',
+             action='store_true')
+         ),
+        (['--checksums-cache'], dict(
+             dest='checksums_cache_fpath',
+             type='string')
+         ),
+        (['--aligner-index-dir'], dict(
+             dest='aligner_index_dirpath',
+             type='string')
+         ),
+        (['--profile-stages'], dict(
+             dest='profile_stages',
+             action='store_true')
+         ),
         (['-l', '--labels'], dict(
              dest='labels',
              type='string')
@@ -665,6 +681,10 @@ def parse_options(logger, quast_args):
              dest='create_icarus_html',
              action='store_false')
          ),
+        (['--icarus-tiles'], dict(
+             dest='icarus_tiles',
+             action='store_true')
+         ),
         (['--no-gc'], dict(
              dest='no_gc',
              action='store_true')
@@ -677,6 +697,14 @@ def parse_options(logger, quast_args):
              dest='memory_efficient',
              action='store_true')
          ),
+        (['--executor'], dict(
+             dest='executor_type',
+             type='string',
+             action='callback',
+             callback=check_str_arg_value,
+             callback_args=(logger,),
+             callback_kwargs={'available_values': executors.EXECUTOR_TYPES})
+         ),
         (['--space-efficient'], dict(
              dest='space_efficient',
              action='callback',
@@ -41,8 +41,9 @@ logarithmic_x_scale = False  # for cumulative plots only
 import math
 import sys
 
-from quast_libs import fastaparser, qconfig, reporting
+from quast_libs import executors, fastaparser, qconfig, reporting
 from quast_libs.log import get_logger, get_main_logger
+from quast_libs.N50 import NxCurve
 from quast_libs.qutils import label_from_fpath, parse_str_to_num, run_parallel
 from quast_libs.plotter_data import get_color_and_ls, colors
 
@@ -230,7 +231,7 @@ def create_plot(plot_fpath, title, plots, legend_list=None, x_label=None, y_labe
         plt.title(title)
     plot_fpath += '.' + qconfig.plot_extension
     if qconfig.is_combined_ref:  # matplotlib needs to be run in parallel for combined reference to prevent fail in parallel runs per reference
-        run_parallel(save_plot, [(plot_fpath,)], 2)
+        run_parallel(save_plot, [(plot_fpath,)], 2, executor_type=executors.FORK)  # needs the current figure
     else:
         save_plot(plot_fpath)
 
@@ -250,9 +251,7 @@ def cumulative_plot(reference, contigs_fpaths, lists_of_lengths, plot_fpath, tit
     max_x = 0
 
     for (contigs_fpath, lengths) in zip(contigs_fpaths, lists_of_lengths):
-        y_vals = [0]
-        for l in sorted(lengths, reverse=True):
-            y_vals.append(y_vals[-1] + l)
+        y_vals = [0] + NxCurve(lengths).cumulative_lengths
         x_vals = list(range(0, len(y_vals)))
         if x_vals:
             max_x = max(x_vals[-1], max_x)
@@ -260,9 +259,7 @@ def cumulative_plot(reference, contigs_fpaths, lists_of_lengths, plot_fpath, tit
         plots.append(Plot(x_vals, y_vals, color, ls))
 
     if reference:
-        y_vals = [0]
-        for l in sorted(fastaparser.get_chr_lengths_from_fastafile(reference).values(), reverse=True):
-            y_vals.append(y_vals[-1] + l)
+        y_vals = [0] + NxCurve(fastaparser.get_chr_lengths_from_fastafile(reference).values()).cumulative_lengths
         x_vals = list(range(0, len(y_vals)))
         # extend reference curve to the max X-axis point
         reference_length = y_vals[-1]
@@ -361,36 +358,26 @@ def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_lengths, plot_f
             json_vals_y.append([])
             continue
         lengths.sort(reverse=True)
-        vals_x = [0.0]
-        vals_y = [lengths[0]]
-        # calculate values for the plot
-        vals_Nx = [0.0]
-        vals_l = [lengths[0]]
-        lcur = 0
+        nx_curve = NxCurve(lengths, is_sorted=True)
         # if Nx-plot then we just use sum of contigs lengths, else use reference_length
-        lsum = sum(lengths)
+        lsum = nx_curve.total_length
         if reference_lengths:
             lsum = reference_lengths[id]
         min_difference = 0
         if reduce_points:
             min_difference = qconfig.min_difference
-        for l in lengths:
-            lcur += l
-            x = lcur * 100.0 / lsum
-            if can_draw_plots:
+        vals_x, vals_y = nx_curve.get_plot_points(lsum, min_difference)
+        json_vals_x.append(vals_x)
+        json_vals_y.append(vals_y)
+        if can_draw_plots:
+            # calculate values for the plot
+            vals_Nx = [0.0]
+            vals_l = [lengths[0]]
+            for l, x in zip(lengths, nx_curve.get_x_values(lsum)):
                 vals_Nx.append(vals_Nx[-1] + 1e-10) # eps
                 vals_l.append(l)
                 vals_Nx.append(x)
                 vals_l.append(l)
-            if vals_y[-1] - l > min_difference or len(vals_x) == 1:
-                vals_x.append(vals_x[-1] + 1e-10) # eps
-                vals_y.append(l)
-                vals_x.append(x)
-                vals_y.append(l)
-            # add to plot
-        json_vals_x.append(vals_x)
-        json_vals_y.append(vals_y)
-        if can_draw_plots:
             vals_Nx.append(vals_Nx[-1] + 1e-10) # eps
             vals_l.append(0.0)
             vals_x.append(vals_x[-1] + 1e-10) # eps
@@ -866,7 +853,7 @@ def fill_all_pdf_file(all_pdf_fpath):
         pdf_tables_figures = [pdf_tables_figures[-1]] + pdf_tables_figures[:-1]
 
     if qconfig.is_combined_ref:
-        run_parallel(save_to_pdf, [(all_pdf_fpath,)], 2)
+        run_parallel(save_to_pdf, [(all_pdf_fpath,)], 2, executor_type=executors.FORK)
     else:
         save_to_pdf(all_pdf_fpath)
     pdf_tables_figures = []
@@ -0,0 +1,128 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Profile of a QUAST run: wall time, CPU time, peak RSS and I/O of the main stages
+# and of the tasks of their parallel runs (e.g. per assembly).
+# It is saved to quast_profile.json and quast_profile.tsv in the output directory.
+#
+############################################################################
+
+from __future__ import with_statement
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from quast_libs import executors, qconfig
+from quast_libs.log import get_logger
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+MB = 1024 * 1024
+RESOURCES_NAMES = ['cpu_time', 'peak_rss', 'children_peak_rss', 'read_bytes', 'written_bytes']
+
+stages = []
+_run_start = None  # (time, resources of the main process, number of parallel runs before the start)
+
+
+def _add_resources(total, resources):
+    for name in ['cpu_time', 'read_bytes', 'written_bytes']:
+        if resources.get(name) is not None:
+            total[name] = (total[name] or 0) + resources[name]
+    for name in ['peak_rss', 'children_peak_rss']:
+        if resources.get(name) is not None:
+            total[name] = max(total[name] or 0, resources[name])
+
+
+def _collect(name, start_time, start_resources, first_parallel_run):
+    """
+    Returns the profile record of resources used since the start: by the main process and its finished children,
+    and by tasks run in the workers of the reused pool (they are listed in the record too)
+    """
+    record = dict(stage=name, wall_time=time.time() - start_time)
+    record.update(executors.get_resources_delta(start_resources, executors.get_resources()))
+    record['tasks'] = []
+    for usage in executors.stages_usage[first_parallel_run:]:
+        for i, (task_name, threads, wall_time, resources) in enumerate(usage.tasks):
+            task = dict(parallel_run=usage.name, task=task_name or str(i + 1), threads=threads, wall_time=wall_time)
+            task.update(resources or dict((resources_name, None) for resources_name in RESOURCES_NAMES))
+            record['tasks'].append(task)
+            if resources:  # the task was run in a worker, the main process does not include its resources
+                _add_resources(record, resources)
+    return record
+
+
+def start():
+    """
+    Starts the profile of a new run
+    """
+    global _run_start
+    del stages[:]
+    executors.reset_peak_rss()
+    _run_start = (time.time(), executors.get_resources(), len(executors.stages_usage))
+
+
+@contextmanager
+def stage(name):
+    """
+    Measures resources used by the code of the with-block and adds them to the profile under the name.
+    If qconfig.profile_stages is set, the cProfile dump of the main process is saved too
+    """
+    profiler = None
+    if qconfig.profile_stages:
+        import cProfile
+        profiler = cProfile.Profile()
+    executors.reset_peak_rss()
+    start_time, start_resources, first_parallel_run = time.time(), executors.get_resources(), len(executors.stages_usage)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profile_dirpath = os.path.join(qconfig.output_dirpath, qconfig.profile_dirname)
+            if not os.path.isdir(profile_dirpath):
+                os.makedirs(profile_dirpath)
+            profiler.dump_stats(os.path.join(profile_dirpath, '%02d_%s.prof' % (len(stages) + 1, name)))
+        stages.append(_collect(name, start_time, start_resources, first_parallel_run))
+
+
+def _format_values(record):
+    values = ['%.2f' % record['wall_time']]
+    for name, scale in [('cpu_time', 1), ('peak_rss', MB), ('children_peak_rss', MB),
+                        ('read_bytes', MB), ('written_bytes', MB)]:
+        values.append('-' if record.get(name) is None else '%.2f' % (float(record[name]) / scale))
+    return values
+
+
+def save(output_dirpath):
+    """
+    Saves the profile of the run into quast_profile.json and quast_profile.tsv
+    """
+    if _run_start is None:
+        return None
+    total = _collect('total', *_run_start)
+    # the peak RSS of the main process was reset by the stages, so the total peak is the maximal peak of the stages
+    for record in stages:
+        _add_resources(total, dict(peak_rss=record['peak_rss'], children_peak_rss=record['children_peak_rss']))
+    del total['tasks']
+    profile = dict(version=qconfig.quast_version(), max_threads=qconfig.max_threads, total=total, stages=stages)
+
+    json_fpath = os.path.join(output_dirpath, qconfig.profile_fname + '.json')
+    with open(json_fpath, 'w') as out_f:
+        json.dump(profile, out_f, indent=2)
+    tsv_fpath = os.path.join(output_dirpath, qconfig.profile_fname + '.tsv')
+    with open(tsv_fpath, 'w') as out_f:
+        out_f.write('\t'.join(['Stage', 'Task', 'Threads', 'Wall time (s)', 'CPU time (s)', 'Peak RSS (MB)',
+                               'Peak RSS of tools (MB)', 'Read (MB)', 'Written (MB)']) + '\n')
+        for record in stages + [total]:
+            out_f.write('\t'.join([record['stage'], '', str(qconfig.max_threads)] + _format_values(record)) + '\n')
+            for task in record.get('tasks', []):
+                out_f.write('\t'.join([record['stage'], task['parallel_run'] + ': ' + task['task'], str(task['threads'])] +
+                                      _format_values(task)) + '\n')
+    logger.info('  Profile of the run (time, memory and I/O of the stages) is saved to ' + tsv_fpath)
+    return json_fpath, tsv_fpath
@@ -47,6 +47,7 @@ ambiguity_score = 0.99
 meta_ambiguity_score = 0.9
 reuse_combined_alignments = False
 alignments_for_reuse_dirpath = None
+aligner_index_dirpath = None  # cache of minimap2 reference indexes, default: the aligner output dir
 use_all_alignments = False
 max_threads = None
 min_alignment = None
@@ -113,6 +114,9 @@ default_json_dirname = "json"
 # names of reports, log, etc.
 corrected_dirname = "quast_corrected_input"
 plots_fname = "report.pdf"
+cpu_usage_fname = "cpu_usage.tsv"
+profile_fname = "quast_profile"  # .json and .tsv
+profile_dirname = "profile"  # cProfile dumps of stages
 report_prefix = "report"
 transposed_report_prefix = "transposed_report"
 html_aux_dir = "report_html_aux"
@@ -170,6 +174,10 @@ max_contigs_num_for_size_viewer = 1000
 min_contig_for_size_viewer = 10000
 contig_len_delta = 0.05
 min_similar_contig_size = 10000
+icarus_tiles = False  # data of contig alignment viewers is split into tiles loaded on demand
+icarus_tile_resolution = 2000  # a block is put into the coarsest zoom level where it is longer than window / resolution
+icarus_tile_min_window = 100000
+icarus_max_coverage_points = 10 ** 7  # coverage of longer references is averaged over windows of coarser levels of the track
 
 # other settings (mostly constants). Can't be changed by command-line options
 
@@ -205,6 +213,16 @@ DEFAULT_MAX_THREADS = 4  # this value is used if QUAST fails to determine number
 assemblies_num = 1
 memory_efficient = False
 space_efficient = False
+executor_type = 'process'  # see executors.EXECUTOR_TYPES
+
+# checksums used for reusing results of previous runs
+fast_checksums = False
+checksums_cache_fpath = None  # default: output_dirpath/checksums_cache_fname
+checksums_cache_fname = '.checksums.tsv'
+MAX_CACHED_CHECKSUMS = 10000
+
+# profiling (quast_profile.json and .tsv are always saved)
+profile_stages = False  # save cProfile dumps of stages (only the main process is profiled)
 
 # genome analyzer
 analyze_gaps = True
@@ -515,6 +533,8 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
         stream.write("    --no-plots                        Do not draw plots\n")
         stream.write("    --no-html                         Do not build html reports and Icarus viewers\n")
         stream.write("    --no-icarus                       Do not build Icarus viewers\n")
+        stream.write("    --icarus-tiles                    Save data of Icarus contig alignment viewers into tiles loaded on demand\n"
+                     "                                      (recommended for large genomes)\n")
         stream.write("    --no-snps                         Do not report SNPs (may significantly reduce memory consumption on large genomes)\n")
         stream.write("    --no-gc                           Do not compute GC% and GC-distribution\n")
         stream.write("    --no-sv                           Do not run structural variation detection (make sense only if reads are specified)\n")
@@ -529,6 +549,15 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
             stream.write("Hidden options:\n")
             stream.write("-d  --debug                 Run in a debug mode\n")
             stream.write("--no-portable-html          Do not embed CSS and JS files in HTML report\n")
+            stream.write("--executor <type>           How to run parallel tasks: process (reused pool of processes, default),\n"
+                         "                            fork (new processes for each stage), thread, or serial\n")
+            stream.write("--aligner-index-dir <dirname>  Directory for caching minimap2 indexes of the references,\n"
+                         "                            it can be shared between QUAST runs\n")
+            stream.write("--fast-checksums            Check whether previous results can be reused by checksums of parts of\n"
+                         "                            the input files instead of whole files\n")
+            stream.write("--checksums-cache <path>    File for caching checksums of the input files, it can be shared between\n"
+                         "                            QUAST runs [default: in the output directory]\n")
+            stream.write("--profile-stages            Save cProfile dumps of QUAST stages into %s/\n" % profile_dirname)
             stream.write("-j  --save-json             Save the output also in the JSON format\n")
             stream.write("-J  --save-json-to <path>   Save the JSON output to a particular path\n")
             if meta:
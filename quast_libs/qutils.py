@@ -25,7 +25,7 @@ except:
     from urllib.request import urlopen
     import urllib.request as urllib
 
-from quast_libs import fastaparser, qconfig, plotter_data
+from quast_libs import executors, fastaparser, qconfig, plotter_data
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -132,6 +132,9 @@ def correct_fasta(original_fpath, min_contig, corrected_fpath=None, is_reference
         return False
     if corrected_fpath:
         fastaparser.write_fasta(corrected_fpath, modified_fasta_entries)
+        transform = 'corrected by QUAST %s: min contig %d, reference %s, no check %s' % \
+                    (qconfig.quast_version(), min_contig, is_reference, qconfig.no_check)
+        save_copy_checksum(original_fpath, corrected_fpath, transform)
     return True
 
 
@@ -456,6 +459,7 @@ def process_labels(contigs_fpaths, labels=None, all_labels_from_dirs=False):
 
 
 def cleanup(corrected_dirpath):
+    executors.shutdown()
     # removing correcting input contig files
     if not qconfig.debug and not qconfig.is_combined_ref:
         shutil.rmtree(corrected_dirpath)
@@ -609,9 +613,7 @@ def label_from_fpath_for_fname(fpath):
     return slugify(qconfig.assembly_labels_by_fpath[fpath])
 
 
-def call_subprocess(args, stdin=None, stdout=None, stderr=None,
-                    indent='',
-                    only_if_debug=True, env=None, logger=logger):
+def _print_subprocess_command_line(args, stdin, stdout, stderr, indent, only_if_debug, logger):
     printed_args = args[:]
     if stdin:
         printed_args += ['<', stdin.name]
@@ -626,6 +628,12 @@ def call_subprocess(args, stdin=None, stdout=None, stderr=None,
 
     logger.print_command_line(printed_args, indent, only_if_debug=only_if_debug)
 
+
+def call_subprocess(args, stdin=None, stdout=None, stderr=None,
+                    indent='',
+                    only_if_debug=True, env=None, logger=logger):
+    _print_subprocess_command_line(args, stdin, stdout, stderr, indent, only_if_debug, logger)
+
     return_code = subprocess.call(args, stdin=stdin, stdout=stdout, stderr=stderr, env=env)
 
     if return_code != 0:
@@ -636,6 +644,28 @@ def call_subprocess(args, stdin=None, stdout=None, stderr=None,
     return return_code
 
 
+def open_subprocess_pipe(args, stdin=None, stderr=None,
+                         indent='',
+                         only_if_debug=True, env=None, logger=logger):
+    """
+        Starts the tool with stdout available for reading line by line as text,
+        the caller should read it till the end and then call wait_subprocess_pipe
+    """
+    _print_subprocess_command_line(args, stdin, None, stderr, indent, only_if_debug, logger)
+    return subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE, stderr=stderr, env=env, universal_newlines=True)
+
+
+def wait_subprocess_pipe(proc, stderr=None, indent='', logger=logger):
+    proc.stdout.close()
+    return_code = proc.wait()
+
+    if return_code != 0:
+        logger.debug(' ' * len(indent) + 'The tool returned non-zero.' +
+                     (' See ' + relpath(stderr.name) + ' for stderr.' if stderr else ''))
+
+    return return_code
+
+
 def get_free_memory():
     total_mem, free_mem = 2, 2
     if qconfig.platform_name == 'linux_64':
@@ -1040,30 +1070,31 @@ def download_external_tool(fname, dirpath, tool, platform_specific=False, is_exe
     return downloaded_fpath
 
 
-def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False):
+def imap_parallel(_fn, fn_args, n_jobs=None, executor_type=None, memory_per_task=None, task_sizes=None,
+                  task_names=None):
+    """
+    Runs _fn for each tuple of arguments in fn_args in parallel and yields results in the order of fn_args
+    as soon as they are ready. executor_type is one of executors.EXECUTOR_TYPES (qconfig.executor_type by default),
+    memory_per_task (in Gb) limits the number of simultaneously running tasks by the available memory.
+    Larger tasks (by task_sizes) are started first, executors.AUTO_THREADS in fn_args is replaced with the number
+    of threads given to the task from qconfig.max_threads. task_names (e.g. assembly labels) are used in the profile
+    """
+    n_jobs = n_jobs or qconfig.max_threads
+    if memory_per_task:
+        n_jobs = max(1, min(n_jobs, int(get_free_memory() // memory_per_task)))
     if qconfig.memory_efficient:
-        results_tuples = [_fn(*args) for args in fn_args]
-    else:
-        n_jobs = n_jobs or qconfig.max_threads
-        parallel_args = {'n_jobs': n_jobs}
-        try:
-            import joblib
-            from joblib import Parallel, delayed
-            try:
-                # starting from joblib 0.10 the default backend has changed to 'loky' which causes QUAST crashes,
-                # since it uses default values in qconfig module. So, we explicitly require 'multiprocessing' here.
-                # Note that Parallel doesn't have 'require' argument in joblib 0.9 and earlier.
-                new_style_parallel_args = {'backend': 'multiprocessing'}
-                Parallel(**new_style_parallel_args)
-                parallel_args.update(new_style_parallel_args)
-            except TypeError:
-                pass
-        except ImportError:
-            if is_python2():
-                from joblib2 import Parallel, delayed
-            else:
-                from joblib3 import Parallel, delayed
-        results_tuples = Parallel(**parallel_args)(delayed(_fn)(*args) for args in fn_args)
+        executor_type = executors.SERIAL
+    return executors.imap(_fn, fn_args, n_jobs, executor_type or qconfig.executor_type, task_sizes,
+                          task_names=task_names)
+
+
+def get_files_sizes(fpaths):
+    return [os.path.getsize(fpath) if fpath and os.path.isfile(fpath) else 0 for fpath in fpaths]
+
+
+def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False, executor_type=None, memory_per_task=None,
+                 task_sizes=None, task_names=None):
+    results_tuples = list(imap_parallel(_fn, fn_args, n_jobs, executor_type, memory_per_task, task_sizes, task_names))
     results = []
     if results_tuples:
         if isinstance(results_tuples[0], list) or isinstance(results_tuples[0], tuple):
@@ -1100,6 +1131,131 @@ def md5(fpath):
     return hash_md5.hexdigest()
 
 
+def partial_md5(fpath, chunk_size=1024 * 1024, n_chunks=16):
+    """
+        Fast checksum of a large file: md5 of its size and of evenly spaced chunks including the first and the last ones
+    """
+    file_size = os.path.getsize(fpath)
+    if file_size <= chunk_size * n_chunks:
+        return md5(fpath)
+    hash_md5 = hashlib.md5(str(file_size).encode('utf-8'))
+    with open(fpath, 'rb') as f:
+        for i in range(n_chunks):
+            f.seek((file_size - chunk_size) * i // (n_chunks - 1))
+            hash_md5.update(f.read(chunk_size))
+    return 'partial_' + hash_md5.hexdigest()
+
+
+_checksums = {}  # file key --> checksum, see file_checksum
+_pruned_checksums_caches = set()
+
+
+def _get_file_key(fpath):
+    file_stat = os.stat(fpath)
+    mtime = file_stat.st_mtime_ns if hasattr(file_stat, 'st_mtime_ns') else repr(file_stat.st_mtime)
+    return '\t'.join(['partial' if qconfig.fast_checksums else 'md5', os.path.realpath(fpath),
+                      str(file_stat.st_size), str(mtime), str(file_stat.st_ino)])
+
+
+def _is_actual_key(file_key):
+    # the key starts with the key of the file (see _get_file_key) which should not have been changed since
+    fs = file_key.split('\t')
+    try:
+        return len(fs) >= 5 and _get_file_key(fs[1]) == '\t'.join(fs[:5])
+    except OSError:
+        return False
+
+
+def get_checksums_cache_fpath():
+    """
+        Returns the file for sharing checksums between processes and runs with the same output directory
+        (or set by --checksums-cache), None if there is no output directory yet
+    """
+    if qconfig.checksums_cache_fpath:
+        return qconfig.checksums_cache_fpath
+    if qconfig.output_dirpath:
+        return join(qconfig.output_dirpath, qconfig.checksums_cache_fname)
+    return None
+
+
+def _load_checksums_cache(cache_fpath):
+    if not cache_fpath or not isfile(cache_fpath):
+        return
+    try:
+        with open(cache_fpath) as f:
+            lines = f.readlines()
+    except IOError:
+        return
+    for line in lines:
+        fs = line.rstrip('\n').rsplit('\t', 1)
+        if len(fs) == 2:
+            _checksums[fs[0]] = fs[1]
+    if cache_fpath not in _pruned_checksums_caches or len(lines) > qconfig.MAX_CACHED_CHECKSUMS:
+        # entries of changed and removed files are dropped once per process, the oldest ones if there are too many
+        _pruned_checksums_caches.add(cache_fpath)
+        actual_lines = [line for line in lines if _is_actual_key(line.rsplit('\t', 1)[0])]
+        actual_lines = actual_lines[-qconfig.MAX_CACHED_CHECKSUMS // 2:] \
+            if len(actual_lines) > qconfig.MAX_CACHED_CHECKSUMS else actual_lines
+        if len(actual_lines) < len(lines):
+            try:
+                tmp_cache_fpath = cache_fpath + '.' + str(os.getpid())
+                with open(tmp_cache_fpath, 'w') as f:
+                    f.writelines(actual_lines)
+                os.rename(tmp_cache_fpath, cache_fpath)
+            except (IOError, OSError):
+                pass
+
+
+def _save_checksum(cache_fpath, file_key, checksum):
+    if not cache_fpath:
+        return
+    try:
+        cache_dirpath = os.path.dirname(cache_fpath)
+        if not isdir(cache_dirpath):
+            os.makedirs(cache_dirpath)
+        with open(cache_fpath, 'a') as f:  # short appends from parallel runs do not interleave
+            f.write(file_key + '\t' + checksum + '\n')
+    except (IOError, OSError):
+        pass
+
+
+def file_checksum(fpath):
+    """
+        Returns md5 checksum of the file (or partial_md5 with qconfig.fast_checksums). Checksums are cached
+        in memory and in the output directory by path, size, modification time and inode, so an unchanged file
+        is not read by later checks in this or other processes and runs
+    """
+    file_key = _get_file_key(fpath)
+    cache_fpath = get_checksums_cache_fpath()
+    if file_key not in _checksums:
+        _load_checksums_cache(cache_fpath)  # it could have been computed by another process
+    if file_key not in _checksums:
+        checksum = partial_md5(fpath) if qconfig.fast_checksums else md5(fpath)
+        _checksums[file_key] = checksum
+        _save_checksum(cache_fpath, file_key, checksum)
+    return _checksums[file_key]
+
+
+def save_copy_checksum(original_fpath, copy_fpath, transform):
+    """
+        Caches the checksum of copy_fpath made from original_fpath by the transform (a string of its parameters)
+        by the key of the original file. Corrected copies of the input files are rewritten by each run, so their
+        checksums are taken from the previous runs while the original files are not changed
+    """
+    source_key = _get_file_key(original_fpath) + '\t' + transform
+    cache_fpath = get_checksums_cache_fpath()
+    if source_key not in _checksums:
+        _load_checksums_cache(cache_fpath)
+    if source_key not in _checksums:
+        checksum = file_checksum(copy_fpath)
+        _checksums[source_key] = checksum
+        _save_checksum(cache_fpath, source_key, checksum)
+    else:
+        file_key = _get_file_key(copy_fpath)
+        _checksums[file_key] = _checksums[source_key]
+        _save_checksum(cache_fpath, file_key, _checksums[source_key])
+
+
 def verify_md5(fpath, md5_fpath=None):
     if md5_fpath is None:
         md5_fpath = fpath + '.md5'
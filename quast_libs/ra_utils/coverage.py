@@ -0,0 +1,214 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Depth of coverage of reference sequences by alignments sorted by coordinates, without bedtools.
+# Starts and ends of alignment intervals of the current sequence are added to a difference array,
+# depths are its prefix sums. They are calculated by blocks when the stream switches to the next sequence,
+# so only one sequence is kept in memory. From one sweep the counter gives the histogram of depths,
+# bins of depths along the sequences and uncovered regions.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import re
+from array import array
+
+from quast_libs import qconfig
+
+# numpy is optional: coverage is calculated by bedtools if it is not available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INTERVALS_CHUNK = 1000000  # starts and ends of intervals are added to the difference array by chunks
+DEPTH_BLOCK_BINS = 10 ** 6  # depths are calculated by blocks of this number of bins
+
+FLAG_PROPER_PAIR, FLAG_UNMAPPED, FLAG_SECONDARY, FLAG_DUPLICATE, FLAG_SUPPLEMENTARY = 0x2, 0x4, 0x100, 0x400, 0x800
+cigar_ref_pattern = re.compile(r'(\d+)[MDN=X]')  # operations consuming the reference
+
+
+def can_count_coverage():
+    return numpy is not None
+
+
+def get_ref_span(cigar):
+    return sum(int(length) for length in cigar_ref_pattern.findall(cigar))
+
+
+def get_seq_lengths_list(headers):
+    seq_lengths = []
+    for line in headers:
+        if line.startswith('@SQ') and 'SN:' in line and 'LN:' in line:
+            seq_name = line.split('\tSN:')[1].split('\t')[0]
+            seq_length = int(line.split('\tLN:')[1].split('\t')[0])
+            seq_lengths.append((seq_name, seq_length))
+    return seq_lengths
+
+
+class CoverageCounter(object):
+    """
+    Analyzer of the stream of sorted alignments (see reads_analyzer.process_alignments).
+    Reads coverage counts every mapped alignment from its start to its end on the reference (as bedtools genomecov),
+    physical coverage counts fragments between the leftmost and the rightmost bases of properly paired reads.
+    Results are passed to bins_writer (start_chrom(name), add_bins(totals, mins, maxs) for full bins of bin_size bases,
+    add_bin(total, length, min, max) for the last incomplete bin and close()),
+    written into uncovered_fpath and summed into the histogram (numbers of bases by depth)
+    """
+    def __init__(self, physical=False, bin_size=None, bins_writer=None, uncovered_fpath=None, correct_chr_names=None,
+                 need_histogram=False):
+        self.physical = physical
+        self.bin_size = bin_size or 1
+        self.bins_writer = bins_writer
+        self.uncovered_fpath = uncovered_fpath
+        self.uncovered_f = None
+        self.correct_chr_names = correct_chr_names
+        self.histogram = numpy.zeros(1, dtype=numpy.int64) if need_histogram else None
+        self.seq_lengths = []
+        self.next_seq_idx = 0
+        self.cur_seq = None
+        self.diff = None
+        self.starts, self.ends = array('l'), array('l')
+
+    def start(self, headers):
+        self.seq_lengths = get_seq_lengths_list(headers)
+        if self.uncovered_fpath:
+            self.uncovered_f = open(self.uncovered_fpath, 'w')
+
+    def process(self, mapping, line):
+        if mapping.ref == '*':
+            return
+        flag = int(mapping.flag)
+        if flag & FLAG_UNMAPPED:
+            return
+        start = mapping.start - 1
+        if self.physical:
+            if not flag & FLAG_PROPER_PAIR or flag & (FLAG_SECONDARY | FLAG_DUPLICATE | FLAG_SUPPLEMENTARY):
+                return
+            fragment_len = int(mapping.tlen)
+            if fragment_len <= 0 or fragment_len >= qconfig.MAX_PE_IS:  # the fragment is counted by its leftmost read
+                return
+            end = start + fragment_len
+        else:
+            end = start + get_ref_span(mapping.cigar)
+        if self.cur_seq is None or mapping.ref != self.cur_seq[0]:
+            self._switch_seq(mapping.ref)
+        self.starts.append(start)
+        self.ends.append(end)
+        if len(self.starts) >= INTERVALS_CHUNK:
+            self._add_intervals()
+
+    def finish(self):
+        self._switch_seq(None)
+        if self.uncovered_f:
+            self.uncovered_f.close()
+        if self.bins_writer:
+            self.bins_writer.close()
+
+    def _switch_seq(self, seq_name):
+        if self.cur_seq is not None:
+            self._add_intervals()
+            self._count_depths()
+            self.cur_seq = None
+        # sequences without alignments are reported too, in the order of the header
+        while self.next_seq_idx < len(self.seq_lengths):
+            name, length = self.seq_lengths[self.next_seq_idx]
+            self.next_seq_idx += 1
+            if name == seq_name:
+                self.cur_seq = (name, length)
+                self.diff = numpy.zeros(length + 1, dtype=numpy.int32)
+                return
+            self.diff = None
+            self.cur_seq = (name, length)
+            self._count_depths()
+            self.cur_seq = None
+        if seq_name is not None:
+            raise ValueError('Alignments are not sorted by coordinates or reference ' + seq_name + ' is missing in the header')
+
+    def _add_intervals(self):
+        if not self.starts:
+            return
+        length = self.cur_seq[1]
+        for positions, sign in ((self.starts, 1), (self.ends, -1)):
+            positions = numpy.minimum(numpy.frombuffer(positions, dtype=numpy.dtype(positions.typecode)), length)
+            uniq_positions, counts = numpy.unique(positions, return_counts=True)
+            self.diff[uniq_positions] += sign * counts.astype(numpy.int32)
+        self.starts, self.ends = array('l'), array('l')
+
+    def _count_depths(self):
+        name, length = self.cur_seq
+        if self.correct_chr_names:
+            name = self.correct_chr_names.get(name, name)
+        if self.bins_writer:
+            self.bins_writer.start_chrom(name)
+        block_size = self.bin_size * DEPTH_BLOCK_BINS
+        depth_before = 0
+        uncovered_start = None
+        for block_start in range(0, length, block_size):
+            block_end = min(block_start + block_size, length)
+            if self.diff is None:
+                depths = numpy.zeros(block_end - block_start, dtype=numpy.int64)
+            else:
+                depths = numpy.cumsum(self.diff[block_start:block_end], dtype=numpy.int64) + depth_before
+                depth_before = int(depths[-1])
+            if self.histogram is not None:
+                self._add_to_histogram(depths)
+            if self.bins_writer:
+                self._write_bins(depths)
+            if self.uncovered_f:
+                uncovered_start = self._write_uncovered(name, depths, block_start, uncovered_start)
+        if self.uncovered_f and uncovered_start is not None:
+            self.uncovered_f.write('\t'.join([name, str(uncovered_start), str(length)]) + '\n')
+        self.diff = None
+
+    def _add_to_histogram(self, depths):
+        counts = numpy.bincount(depths)
+        if len(counts) > len(self.histogram):
+            counts[:len(self.histogram)] += self.histogram
+            self.histogram = counts
+        else:
+            self.histogram[:len(counts)] += counts
+
+    def _write_bins(self, depths):
+        full_len = len(depths) - len(depths) % self.bin_size
+        bins = depths[:full_len].reshape(-1, self.bin_size)
+        if len(bins):
+            self.bins_writer.add_bins(bins.sum(axis=1), bins.min(axis=1), bins.max(axis=1))
+        if full_len < len(depths):  # the last bin of the sequence
+            last_bin = depths[full_len:]
+            self.bins_writer.add_bin(int(last_bin.sum()), len(last_bin), int(last_bin.min()), int(last_bin.max()))
+
+    def _write_uncovered(self, name, depths, offset, uncovered_start):
+        """
+            Writes zero-covered regions of the block, returns the start of the region continued in the next block
+        """
+        is_uncovered = numpy.concatenate(([0], (depths == 0).view(numpy.int8), [0]))
+        boundaries = numpy.flatnonzero(numpy.diff(is_uncovered)) + offset
+        starts, ends = boundaries[::2].tolist(), boundaries[1::2].tolist()
+        if starts and uncovered_start is not None and starts[0] == offset:
+            starts[0] = uncovered_start
+        elif uncovered_start is not None:
+            self.uncovered_f.write('\t'.join([name, str(uncovered_start), str(offset)]) + '\n')
+        uncovered_start = None
+        if ends and ends[-1] == offset + len(depths):
+            uncovered_start = starts.pop()
+            ends.pop()
+        for start, end in zip(starts, ends):
+            self.uncovered_f.write('\t'.join([name, str(start), str(end)]) + '\n')
+        return uncovered_start
+
+    def get_stats(self, thresholds):
+        """
+            Returns the mean depth and fractions of bases covered at least by each of the thresholds
+        """
+        total_len = int(self.histogram.sum()) if self.histogram is not None else 0
+        if not total_len:
+            return 0, [0 for threshold in thresholds]
+        avg_depth = float(numpy.dot(numpy.arange(len(self.histogram)), self.histogram)) / total_len
+        coverage_for_thresholds = [float(self.histogram[threshold:].sum()) / total_len for threshold in thresholds]
+        return avg_depth, coverage_for_thresholds
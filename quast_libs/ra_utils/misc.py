@@ -242,10 +242,10 @@ def get_correct_names_for_chroms(output_dirpath, fasta_fpath, alignment_fpath, e
     return correct_chr_names
 
 
-def all_read_names_correct(sam_fpath):
+def all_read_names_correct(sam_fpath, max_lines=1000000):
     with open(sam_fpath) as sam_in:
         for i, l in enumerate(sam_in):
-            if i > 1000000:
+            if max_lines is not None and i > max_lines:
                 return True
             if not l:
                 continue
@@ -274,7 +274,10 @@ def clean_read_names(sam_fpath, correct_sam_fpath):
 def sort_bam(bam_fpath, sorted_bam_fpath, err_path, logger, threads=None, sort_rule=None):
     if not threads:
         threads = qconfig.max_threads
-    mem = '%dGB' % min(100, max(2, get_free_memory()))
+    free_mem = get_free_memory()
+    if qconfig.max_threads and threads < qconfig.max_threads:  # parallel sorts share the memory as the threads
+        free_mem = free_mem * threads // qconfig.max_threads
+    mem = '%dGB' % min(100, max(2, free_mem))
     cmd = [sambamba_fpath('sambamba'), 'sort', '-t', str(threads), '--tmpdir', dirname(sorted_bam_fpath), '-m', mem,
            '-o', sorted_bam_fpath, bam_fpath]
     if sort_rule:
@@ -385,13 +388,38 @@ def calculate_genome_cov(in_fpath, out_fpath, chr_len_fpath, err_fpath, logger,
     qutils.call_subprocess(cmd, stdout=open(out_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
 
 
-def sambamba_view(in_fpath, out_fpath, max_threads, err_fpath, logger, filter_rule=None):
+def get_sambamba_view_cmd(in_fpath, max_threads, filter_rule=None, out_bam=False):
     cmd = [sambamba_fpath('sambamba'), 'view', '-t', str(max_threads), '-h']
     if in_fpath.endswith('.sam'):
         cmd += ['-S']
-    if out_fpath.endswith('.bam'):
+    if out_bam:
         cmd += ['-f', 'bam']
     if filter_rule:
         cmd += ['-F', filter_rule]
     cmd.append(in_fpath)
+    return cmd
+
+
+def sambamba_view(in_fpath, out_fpath, max_threads, err_fpath, logger, filter_rule=None):
+    cmd = get_sambamba_view_cmd(in_fpath, max_threads, filter_rule, out_bam=out_fpath.endswith('.bam'))
     qutils.call_subprocess(cmd, stdout=open(out_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
+
+
+def iter_sam_lines(in_fpath, max_threads, err_fpath, logger, filter_rule=None):
+    """
+        Yields lines of the SAM file or of the BAM file converted to SAM on the fly (header lines first),
+        so the alignments can be analyzed without saving them as SAM
+    """
+    if in_fpath.endswith('.sam') and not filter_rule:
+        with open(in_fpath) as sam_file:
+            for line in sam_file:
+                yield line
+        return
+    cmd = get_sambamba_view_cmd(in_fpath, max_threads, filter_rule)
+    with open(err_fpath, 'a') as err_f:
+        proc = qutils.open_subprocess_pipe(cmd, stderr=err_f, logger=logger)
+        try:
+            for line in proc.stdout:
+                yield line
+        finally:
+            qutils.wait_subprocess_pipe(proc, stderr=err_f, logger=logger)
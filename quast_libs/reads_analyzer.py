@@ -15,19 +15,21 @@ from collections import defaultdict
 from math import sqrt
 from os.path import isfile, join, basename, abspath, isdir, dirname, exists
 
-from quast_libs import qconfig, qutils
+from quast_libs import executors, qconfig, qutils
 from quast_libs.ca_utils.misc import minimap_fpath, ref_labels_by_chromosomes
 from quast_libs.fastaparser import create_fai_file
 from quast_libs.ra_utils.misc import compile_reads_analyzer_tools, sambamba_fpath, bwa_fpath, bedtools_fpath, \
     bwa_dirpath, download_gridss, get_gridss_fpath, get_gridss_memory, \
     paired_reads_names_are_equal, sort_bam, bwa_index, reformat_bedpe, get_correct_names_for_chroms, \
     all_read_names_correct, clean_read_names, check_cov_file, bam_to_bed, get_safe_fpath, sambamba_view, \
-    calculate_genome_cov
-from quast_libs.qutils import is_non_empty_file, add_suffix, get_chr_len_fpath, run_parallel, \
+    calculate_genome_cov, iter_sam_lines
+from quast_libs.ra_utils.coverage import CoverageCounter, can_count_coverage, numpy
+from quast_libs.qutils import is_non_empty_file, add_suffix, get_chr_len_fpath, run_parallel, get_files_sizes, \
     get_path_to_program, check_java_version, percentile, calc_median
 
 from quast_libs.log import get_logger
 from quast_libs.reporting import save_reads
+from quast_libs.tracks import TrackWriter, get_track_fpath, COVERAGE, NO_VALUE
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 ref_sam_fpaths = {}
@@ -40,16 +42,17 @@ class Mapping(object):
     def __init__(self, fields):
         self.ref, self.start, self.mapq, self.ref_next, self.len = \
             fields[2], int(fields[3]), int(fields[4]), fields[6], len(fields[9])
+        self.flag, self.cigar, self.tlen = fields[1], fields[5], fields[8]
         self.end = self.start + self.len - 1  # actually not always true because of indels
 
     @staticmethod
     def parse(line):
         if line.startswith('@'):  # comment
             return None
-        if len(line.split('\t')) < 11:  # not valid line
+        fields = line.split('\t')
+        if len(fields) < 11:  # not valid line
             return None
-        mapping = Mapping(line.split('\t'))
-        return mapping
+        return Mapping(fields)
 
 
 class QuastDeletion(object):
@@ -173,9 +176,9 @@ def search_sv_with_gridss(main_ref_fpath, bam_fpath, meta_ref_fpaths, output_dir
 
     if meta_ref_fpaths:
         n_jobs = min(len(meta_ref_fpaths), qconfig.max_threads)
-        threads_per_job = max(1, qconfig.max_threads // n_jobs)
-        parallel_args = [(cur_ref_fpath, output_dirpath, err_fpath, threads_per_job) for cur_ref_fpath in meta_ref_fpaths]
-        bed_fpaths = run_parallel(process_one_ref, parallel_args, n_jobs, filter_results=True)
+        parallel_args = [(cur_ref_fpath, output_dirpath, err_fpath, executors.AUTO_THREADS) for cur_ref_fpath in meta_ref_fpaths]
+        bed_fpaths = run_parallel(process_one_ref, parallel_args, n_jobs, filter_results=True,
+                                  task_sizes=get_files_sizes(meta_ref_fpaths))
         if bed_fpaths:
             qutils.cat_files(bed_fpaths, final_bed_fpath)
     else:
@@ -184,83 +187,181 @@ def search_sv_with_gridss(main_ref_fpath, bam_fpath, meta_ref_fpaths, output_dir
     return final_bed_fpath
 
 
-def search_trivial_deletions(temp_output_dir, sam_sorted_fpath, ref_files, ref_labels, seq_lengths, need_ref_splitting):
-    deletions = []
-    trivial_deletions_fpath = join(temp_output_dir, qconfig.trivial_deletions_fname)
-    logger.info('  Looking for trivial deletions (long zero-covered fragments)...')
-    need_trivial_deletions = True
-    if isfile(trivial_deletions_fpath):
-        need_trivial_deletions = False
-        logger.info('    Using existing file: ' + trivial_deletions_fpath)
-    if need_trivial_deletions or need_ref_splitting:
-        with open(sam_sorted_fpath) as sam_file:
-            cur_deletion = None
-            for line in sam_file:
-                mapping = Mapping.parse(line)
-                if mapping:
-                    if mapping.ref == '*':
-                        continue
-                    # common case: continue current deletion (potential) on the same reference
-                    if cur_deletion and cur_deletion.ref == mapping.ref:
-                        if cur_deletion.next_bad is None:  # previous mapping was in region BEFORE 0-covered fragment
-                            # just passed 0-covered fragment
-                            if mapping.start - cur_deletion.prev_bad > QuastDeletion.MIN_GAP:
-                                cur_deletion.set_next_bad(mapping)
-                                if mapping.mapq >= Mapping.MIN_MAP_QUALITY:
-                                    cur_deletion.set_next_good(mapping)
-                                    if cur_deletion.is_valid():
-                                        deletions.append(cur_deletion)
-                                    cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-                            # continue region BEFORE 0-covered fragment
-                            elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
-                                cur_deletion.set_prev_good(mapping)
-                            else:
-                                cur_deletion.set_prev_bad(mapping)
-                        else:  # previous mapping was in region AFTER 0-covered fragment
-                            # just passed another 0-cov fragment between end of cur_deletion BAD region and this mapping
-                            if mapping.start - cur_deletion.next_bad_end > QuastDeletion.MIN_GAP:
-                                if cur_deletion.is_valid():  # add previous fragment's deletion if needed
-                                    deletions.append(cur_deletion)
-                                cur_deletion = QuastDeletion(mapping.ref).set_prev_bad(position=cur_deletion.next_bad_end)
-                            # continue region AFTER 0-covered fragment (old one or new/another one -- see "if" above)
-                            elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
-                                cur_deletion.set_next_good(mapping)
-                                if cur_deletion.is_valid():
-                                    deletions.append(cur_deletion)
-                                cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-                            else:
-                                cur_deletion.set_next_bad_end(mapping)
-                    # special case: just started or just switched to the next reference
-                    else:
-                        if cur_deletion and cur_deletion.ref in seq_lengths:  # switched to the next ref
-                            cur_deletion.set_next_good(position=seq_lengths[cur_deletion.ref])
-                            if cur_deletion.is_valid():
-                                deletions.append(cur_deletion)
+class TrivialDeletionsFinder(object):
+    """
+    Looks for long zero-covered fragments of references in the stream of alignments sorted by coordinates
+    """
+    def __init__(self):
+        self.deletions = []
+        self.seq_lengths = {}
+        self.cur_deletion = None
+
+    def start(self, headers):
+        self.seq_lengths = get_seq_lengths(headers)
+
+    def process(self, mapping, line):
+        if mapping.ref == '*':
+            return
+        cur_deletion = self.cur_deletion
+        # common case: continue current deletion (potential) on the same reference
+        if cur_deletion and cur_deletion.ref == mapping.ref:
+            if cur_deletion.next_bad is None:  # previous mapping was in region BEFORE 0-covered fragment
+                # just passed 0-covered fragment
+                if mapping.start - cur_deletion.prev_bad > QuastDeletion.MIN_GAP:
+                    cur_deletion.set_next_bad(mapping)
+                    if mapping.mapq >= Mapping.MIN_MAP_QUALITY:
+                        cur_deletion.set_next_good(mapping)
+                        if cur_deletion.is_valid():
+                            self.deletions.append(cur_deletion)
                         cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
-
-                    if need_ref_splitting:
-                        cur_ref = ref_labels[mapping.ref]
-                        if mapping.ref_next.strip() == '=' or cur_ref == ref_labels[mapping.ref_next]:
-                            if ref_files[cur_ref] is not None:
-                                ref_files[cur_ref].write(line)
-            if cur_deletion and cur_deletion.ref in seq_lengths:  # switched to the next ref
-                cur_deletion.set_next_good(position=seq_lengths[cur_deletion.ref])
-                if cur_deletion.is_valid():
-                    deletions.append(cur_deletion)
-    if need_ref_splitting:
-        for ref_handler in ref_files.values():
-            if ref_handler is not None:
-                ref_handler.close()
-    if need_trivial_deletions:
-        logger.info('  Trivial deletions: %d found' % len(deletions))
-        logger.info('    Saving to: ' + trivial_deletions_fpath)
-        with open(trivial_deletions_fpath, 'w') as f:
-            for deletion in deletions:
-                f.write(str(deletion) + '\n')
+                # continue region BEFORE 0-covered fragment
+                elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
+                    cur_deletion.set_prev_good(mapping)
+                else:
+                    cur_deletion.set_prev_bad(mapping)
+            else:  # previous mapping was in region AFTER 0-covered fragment
+                # just passed another 0-cov fragment between end of cur_deletion BAD region and this mapping
+                if mapping.start - cur_deletion.next_bad_end > QuastDeletion.MIN_GAP:
+                    if cur_deletion.is_valid():  # add previous fragment's deletion if needed
+                        self.deletions.append(cur_deletion)
+                    cur_deletion = QuastDeletion(mapping.ref).set_prev_bad(position=cur_deletion.next_bad_end)
+                # continue region AFTER 0-covered fragment (old one or new/another one -- see "if" above)
+                elif mapping.mapq >= Mapping.MIN_MAP_QUALITY:
+                    cur_deletion.set_next_good(mapping)
+                    if cur_deletion.is_valid():
+                        self.deletions.append(cur_deletion)
+                    cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
+                else:
+                    cur_deletion.set_next_bad_end(mapping)
+        # special case: just started or just switched to the next reference
+        else:
+            self._finish_ref()
+            cur_deletion = QuastDeletion(mapping.ref).set_prev_good(mapping)
+        self.cur_deletion = cur_deletion
+
+    def _finish_ref(self):
+        cur_deletion = self.cur_deletion
+        if cur_deletion and cur_deletion.ref in self.seq_lengths:  # switched to the next ref
+            cur_deletion.set_next_good(position=self.seq_lengths[cur_deletion.ref])
+            if cur_deletion.is_valid():
+                self.deletions.append(cur_deletion)
+
+    def finish(self):
+        self._finish_ref()
+        self.cur_deletion = None
+
+
+class RefSplitter(object):
+    """
+    Writes alignments of pairs of reads mapped to the same reference (of MetaQUAST) into the SAM file of the reference
+    """
+    def __init__(self, ref_sam_fpaths_by_names, ref_labels):
+        self.ref_sam_fpaths_by_names = ref_sam_fpaths_by_names
+        self.ref_labels = ref_labels
+        self.ref_files = {}
+
+    def start(self, headers):
+        for cur_ref_name, ref_sam_fpath in self.ref_sam_fpaths_by_names.items():
+            ref_sam_file = open(ref_sam_fpath, 'w')
+            if not headers[0].startswith('@SQ'):
+                ref_sam_file.write(headers[0] + '\n')
+            for h in (h for h in headers if h.startswith('@SQ') and 'SN:' in h):
+                seq_name = h.split('\tSN:')[1].split('\t')[0]
+                if seq_name in self.ref_labels and self.ref_labels[seq_name] == cur_ref_name:
+                    ref_sam_file.write(h + '\n')
+            ref_sam_file.write(headers[-1] + '\n')
+            self.ref_files[cur_ref_name] = ref_sam_file
+
+    def process(self, mapping, line):
+        if mapping.ref == '*':
+            return
+        cur_ref = self.ref_labels[mapping.ref]
+        if mapping.ref_next.strip() == '=' or cur_ref == self.ref_labels[mapping.ref_next]:
+            if cur_ref in self.ref_files:
+                self.ref_files[cur_ref].write(line)
+
+    def finish(self):
+        for ref_file in self.ref_files.values():
+            ref_file.close()
+
+
+class InsertSizeSampler(object):
+    """
+    Collects insert sizes of properly oriented pairs from the first max_lines lines of SAM
+    """
+    MAPPED_FLAGS = ['99', '147', '83', '163']  # reads mapped in correct orientation and within insert size
+
+    def __init__(self, max_lines=1000000):
+        self.max_lines = max_lines
+        self.lines = 0
+        self.insert_sizes = []
+
+    def start(self, headers):
+        self.lines = len(headers)
+
+    def process(self, mapping, line):
+        if self.lines > self.max_lines:
+            return True
+        self.lines += 1
+        if mapping.flag in InsertSizeSampler.MAPPED_FLAGS:
+            self.insert_sizes.append(abs(int(mapping.tlen)))
+
+    def finish(self):
+        pass
+
+
+def process_alignments(sam_lines, analyzers):
+    """
+    Parses the stream of SAM lines once and passes every alignment to all analyzers. An analyzer has
+    start(headers), process(mapping, line) returning True when it needs no more alignments, and finish()
+    """
+    headers = []
+    active_analyzers = None
+    for line in sam_lines:
+        if active_analyzers is None:
+            if line.startswith('@'):
+                headers.append(line.strip())
+                continue
+            for analyzer in analyzers:
+                analyzer.start(headers)
+            active_analyzers = list(analyzers)
+        mapping = Mapping.parse(line)
+        if mapping is None:
+            continue
+        finished_analyzers = [analyzer for analyzer in active_analyzers if analyzer.process(mapping, line)]
+        if finished_analyzers:
+            active_analyzers = [analyzer for analyzer in active_analyzers if analyzer not in finished_analyzers]
+            if not active_analyzers:
+                break
+    if active_analyzers is None:
+        for analyzer in analyzers:
+            analyzer.start(headers)
+    for analyzer in analyzers:
+        analyzer.finish()
+
+
+def get_seq_lengths(headers):
+    seq_lengths = {}
+    for line in headers:
+        if line.startswith('@SQ') and 'SN:' in line and 'LN:' in line:
+            seq_name = line.split('\tSN:')[1].split('\t')[0]
+            seq_length = int(line.split('\tLN:')[1].split('\t')[0])
+            seq_lengths[seq_name] = seq_length
+    return seq_lengths
+
+
+def save_trivial_deletions(deletions, trivial_deletions_fpath):
+    logger.info('  Trivial deletions: %d found' % len(deletions))
+    logger.info('    Saving to: ' + trivial_deletions_fpath)
+    with open(trivial_deletions_fpath, 'w') as f:
+        for deletion in deletions:
+            f.write(str(deletion) + '\n')
     return trivial_deletions_fpath
 
 
-def align_reference(ref_fpath, output_dir, using_reads='all', calculate_coverage=False):
+def align_reference(ref_fpath, output_dir, using_reads='all', calculate_coverage=False, max_threads=None):
+    if not max_threads:
+        max_threads = qconfig.max_threads
     required_files = []
     ref_name = qutils.name_from_fpath(ref_fpath)
     cov_fpath = qconfig.cov_fpath or join(output_dir, ref_name + '.cov')
@@ -281,7 +382,7 @@ def align_reference(ref_fpath, output_dir, using_reads='all', calculate_coverage
     log_path = join(output_dir, 'reads_stats.log')
     err_fpath = join(output_dir, 'reads_stats.err')
     correct_chr_names, sam_fpath, bam_fpath = align_single_file(ref_fpath, output_dir, temp_output_dir, log_path, err_fpath,
-                                                                qconfig.max_threads, sam_fpath=qconfig.reference_sam,
+                                                                max_threads, sam_fpath=qconfig.reference_sam,
                                                                 bam_fpath=qconfig.reference_bam, required_files=required_files,
                                                                 is_reference=True, alignment_only=True, using_reads=using_reads)
     if not qconfig.optimal_assembly_insert_size or qconfig.optimal_assembly_insert_size == 'auto':
@@ -312,11 +413,11 @@ def align_reference(ref_fpath, output_dir, using_reads='all', calculate_coverage
         if is_non_empty_file(bam_sorted_fpath):
             logger.info('  Using existing sorted BAM-file: ' + bam_sorted_fpath)
         else:
-            sambamba_view(bam_fpath, bam_mapped_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped')
-            sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger)
+            sambamba_view(bam_fpath, bam_mapped_fpath, max_threads, err_fpath, logger,  filter_rule='not unmapped')
+            sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger, threads=max_threads)
         if not is_non_empty_file(uncovered_fpath) and calculate_coverage:
             get_coverage(temp_output_dir, ref_fpath, ref_name, bam_fpath, bam_sorted_fpath, log_path, err_fpath,
-                         correct_chr_names, cov_fpath, uncovered_fpath=uncovered_fpath, create_cov_files=False)
+                         correct_chr_names, cov_fpath, max_threads, uncovered_fpath=uncovered_fpath, create_cov_files=False)
     return sam_fpath, bam_fpath, uncovered_fpath
 
 
@@ -359,21 +460,23 @@ def run_processing_reads(contigs_fpaths, main_ref_fpath, meta_ref_fpaths, ref_la
 
     if not qconfig.no_read_stats:
         n_jobs = min(qconfig.max_threads, len(contigs_fpaths) + 1)
-        max_threads_per_job = max(1, qconfig.max_threads // n_jobs)
         sam_fpaths = qconfig.sam_fpaths or [None] * len(contigs_fpaths)
         bam_fpaths = qconfig.bam_fpaths or [None] * len(contigs_fpaths)
-        parallel_align_args = [(contigs_fpath, output_dir, temp_output_dir, log_path, err_fpath, max_threads_per_job,
+        parallel_align_args = [(contigs_fpath, output_dir, temp_output_dir, log_path, err_fpath, executors.AUTO_THREADS,
                                 sam_fpaths[index], bam_fpaths[index], index) for index, contigs_fpath in enumerate(contigs_fpaths)]
     else:
         n_jobs = 1
-        max_threads_per_job = qconfig.max_threads
         parallel_align_args = []
 
     if main_ref_fpath:
         parallel_align_args.append((main_ref_fpath, output_dir, temp_output_dir, log_path, err_fpath,
-                                    max_threads_per_job, qconfig.reference_sam, qconfig.reference_bam, None, required_files, True))
+                                    executors.AUTO_THREADS, qconfig.reference_sam, qconfig.reference_bam, None, required_files, True))
     if parallel_align_args:
-        correct_chr_names, sam_fpaths, bam_fpaths = run_parallel(align_single_file, parallel_align_args, n_jobs)
+        # threads are shared by the assemblies and the reference proportionally to their sizes
+        align_sizes = get_files_sizes([args[0] for args in parallel_align_args])
+        align_names = [qconfig.assembly_labels_by_fpath.get(args[0], 'reference') for args in parallel_align_args]
+        correct_chr_names, sam_fpaths, bam_fpaths = run_parallel(align_single_file, parallel_align_args, n_jobs,
+                                                                 task_sizes=align_sizes, task_names=align_names)
         if not qconfig.no_read_stats:
             qconfig.sam_fpaths = sam_fpaths[:len(contigs_fpaths)]
             qconfig.bam_fpaths = bam_fpaths[:len(contigs_fpaths)]
@@ -398,53 +501,46 @@ def run_processing_reads(contigs_fpaths, main_ref_fpath, meta_ref_fpaths, ref_la
 
     if is_non_empty_file(sam_sorted_fpath):
         logger.info('  Using existing sorted SAM-file: ' + sam_sorted_fpath)
-    else:
-        if not is_non_empty_file(bam_sorted_fpath):
-            sambamba_view(bam_fpath, bam_mapped_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped')
-            sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger)
-        sambamba_view(bam_sorted_fpath, sam_sorted_fpath, qconfig.max_threads, err_fpath, logger)
+    elif not is_non_empty_file(bam_sorted_fpath):
+        sambamba_view(bam_fpath, bam_mapped_fpath, qconfig.max_threads, err_fpath, logger,  filter_rule='not unmapped')
+        sort_bam(bam_mapped_fpath, bam_sorted_fpath, err_fpath, logger)
+    # sorted alignments are read once by all analyzers, they are streamed from the BAM file without saving them as SAM
+    analyzers = []
     if qconfig.create_icarus_html and (not is_non_empty_file(cov_fpath) or not is_non_empty_file(physical_cov_fpath)):
         cov_fpath, physical_cov_fpath = get_coverage(temp_output_dir, main_ref_fpath, ref_name, bam_fpath, bam_sorted_fpath,
-                                                     log_path, err_fpath, correct_chr_names, cov_fpath, physical_cov_fpath)
-    if not is_non_empty_file(bed_fpath) and not qconfig.no_sv:
-        if meta_ref_fpaths:
+                                                     log_path, err_fpath, correct_chr_names, cov_fpath, qconfig.max_threads,
+                                                     physical_cov_fpath, analyzers=analyzers)
+    need_sv = not is_non_empty_file(bed_fpath) and not qconfig.no_sv
+    deletions_finder = None
+    if need_sv:
+        trivial_deletions_fpath = join(temp_output_dir, qconfig.trivial_deletions_fname)
+        logger.info('  Looking for trivial deletions (long zero-covered fragments)...')
+        if isfile(trivial_deletions_fpath):
+            logger.info('    Using existing file: ' + trivial_deletions_fpath)
+        else:
+            deletions_finder = TrivialDeletionsFinder()
+            analyzers.append(deletions_finder)
+        has_gridss = get_gridss_fpath() and isfile(get_gridss_fpath())
+        if meta_ref_fpaths and has_gridss:  # SAM files of references are used by GRIDSS only
             logger.info('  Splitting SAM-file by references...')
-        headers = []
-        seq_lengths = {}
-        with open(sam_fpath) as sam_file:
-            for line in sam_file:
-                if not line.startswith('@'):
-                    break
-                if line.startswith('@SQ') and 'SN:' in line and 'LN:' in line:
-                    seq_name = line.split('\tSN:')[1].split('\t')[0]
-                    seq_length = int(line.split('\tLN:')[1].split('\t')[0])
-                    seq_lengths[seq_name] = seq_length
-                headers.append(line.strip())
-        need_ref_splitting = False
-        ref_files = {}
-        if meta_ref_fpaths:
             global ref_sam_fpaths
+            ref_sam_fpaths_by_names = {}
             for cur_ref_fpath in meta_ref_fpaths:
                 cur_ref_name = qutils.name_from_fpath(cur_ref_fpath)
                 ref_sam_fpath = join(temp_output_dir, cur_ref_name + '.sam')
                 ref_sam_fpaths[cur_ref_fpath] = ref_sam_fpath
                 if is_non_empty_file(ref_sam_fpath):
                     logger.info('    Using existing split SAM-file for %s: %s' % (cur_ref_name, ref_sam_fpath))
-                    ref_files[cur_ref_name] = None
                 else:
-                    ref_sam_file = open(ref_sam_fpath, 'w')
-                    if not headers[0].startswith('@SQ'):
-                        ref_sam_file.write(headers[0] + '\n')
-                    for h in (h for h in headers if h.startswith('@SQ') and 'SN:' in h):
-                        seq_name = h.split('\tSN:')[1].split('\t')[0]
-                        if seq_name in ref_labels and ref_labels[seq_name] == cur_ref_name:
-                            ref_sam_file.write(h + '\n')
-                    ref_sam_file.write(headers[-1] + '\n')
-                    ref_files[cur_ref_name] = ref_sam_file
-                    need_ref_splitting = True
-
-        trivial_deletions_fpath = \
-            search_trivial_deletions(temp_output_dir, sam_sorted_fpath, ref_files, ref_labels, seq_lengths, need_ref_splitting)
+                    ref_sam_fpaths_by_names[cur_ref_name] = ref_sam_fpath
+            if ref_sam_fpaths_by_names:
+                analyzers.append(RefSplitter(ref_sam_fpaths_by_names, ref_labels))
+    if analyzers:
+        sorted_alignments_fpath = sam_sorted_fpath if is_non_empty_file(sam_sorted_fpath) else bam_sorted_fpath
+        process_alignments(iter_sam_lines(sorted_alignments_fpath, qconfig.max_threads, err_fpath, logger), analyzers)
+    if deletions_finder:
+        save_trivial_deletions(deletions_finder.deletions, trivial_deletions_fpath)
+    if need_sv:
         if get_gridss_fpath() and isfile(get_gridss_fpath()):
             try:
                 gridss_sv_fpath = search_sv_with_gridss(main_ref_fpath, bam_mapped_fpath, meta_ref_fpaths, temp_output_dir, err_fpath)
@@ -503,7 +599,8 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
             elif isfile(bam_fpath):
                 qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(max_threads), bam_fpath],
                                        stdout=open(stats_fpath, 'w'), stderr=open(err_fpath, 'a'))
-                analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger)
+                analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger,
+                                 max_threads)
         if isfile(stats_fpath) or alignment_only:
             return correct_chr_names, sam_fpath, bam_fpath
 
@@ -553,6 +650,8 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
 
     if can_reuse and is_non_empty_file(bam_fpath) and all_read_names_correct(sam_fpath):
         logger.info('  ' + index_str + 'Using existing BAM-file: ' + bam_fpath)
+    elif all_read_names_correct(sam_fpath, max_lines=None):  # the SAM file is converted without rewriting it
+        sambamba_view(sam_fpath, bam_fpath, max_threads, err_fpath, logger, filter_rule=None)
     else:
         correct_sam_fpath = join(output_dirpath, filename + '.' + using_reads + '.correct.sam')  # write in output dir
         sam_fpath = clean_read_names(sam_fpath, correct_sam_fpath)
@@ -565,7 +664,8 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
         elif isfile(bam_fpath):
             qutils.call_subprocess([sambamba_fpath('sambamba'), 'flagstat', '-t', str(max_threads), bam_fpath],
                                     stdout=open(stats_fpath, 'w'), stderr=open(err_fpath, 'a'))
-            analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger)
+            analyse_coverage(output_dirpath, fpath, correct_chr_names, bam_fpath, stats_fpath, err_fpath, logger,
+                             max_threads)
         if is_reference:
             logger.info('  Analysis for reference is finished.')
         else:
@@ -747,24 +847,34 @@ def add_statistics_to_report(output_dir, contigs_fpaths, ref_fpath):
             report.add_field(reporting.Fields.COVERAGE_1X_THRESHOLD, reads_stats['coverage_thresholds'][0])
 
 
-def analyse_coverage(output_dirpath, fpath, chr_names, bam_fpath, stats_fpath, err_fpath, logger):
+def analyse_coverage(output_dirpath, fpath, chr_names, bam_fpath, stats_fpath, err_fpath, logger, max_threads):
     filename = qutils.name_from_fpath(fpath)
-    bed_fpath = bam_to_bed(output_dirpath, filename, bam_fpath, err_fpath, logger)
-    chr_len_fpath = get_chr_len_fpath(fpath, chr_names)
-    cov_fpath = join(output_dirpath, filename + '.genomecov')
-    calculate_genome_cov(bed_fpath, cov_fpath, chr_len_fpath, err_fpath, logger, print_all_positions=False)
-
-    avg_depth = 0
-    coverage_for_thresholds = [0 for threshold in qconfig.coverage_thresholds]
-    with open(cov_fpath) as f:
-        for line in f:
-            l = line.split()  # genome; depth; number of bases; size of genome; fraction of bases with depth
-            depth, genome_fraction = int(l[1]), float(l[4])
-            if l[0] == 'genome':
-                avg_depth += depth * genome_fraction
-                for i, threshold in enumerate(qconfig.coverage_thresholds):
-                    if depth >= threshold:
-                        coverage_for_thresholds[i] += genome_fraction
+    if can_count_coverage():  # the histogram of depths is counted from sorted alignments
+        bam_sorted_fpath = join(output_dirpath, filename + '.sorted.bam')
+        if not is_non_empty_file(bam_sorted_fpath):
+            sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger, threads=max_threads)
+        coverage_counter = CoverageCounter(need_histogram=True)
+        process_alignments(iter_sam_lines(bam_sorted_fpath, max_threads, err_fpath, logger), [coverage_counter])
+        avg_depth, coverage_for_thresholds = coverage_counter.get_stats(qconfig.coverage_thresholds)
+        if not qconfig.debug:  # the sorted copy of the BAM file is needed only for the histogram
+            os.remove(bam_sorted_fpath)
+    else:
+        bed_fpath = bam_to_bed(output_dirpath, filename, bam_fpath, err_fpath, logger)
+        chr_len_fpath = get_chr_len_fpath(fpath, chr_names)
+        cov_fpath = join(output_dirpath, filename + '.genomecov')
+        calculate_genome_cov(bed_fpath, cov_fpath, chr_len_fpath, err_fpath, logger, print_all_positions=False)
+
+        avg_depth = 0
+        coverage_for_thresholds = [0 for threshold in qconfig.coverage_thresholds]
+        with open(cov_fpath) as f:
+            for line in f:
+                l = line.split()  # genome; depth; number of bases; size of genome; fraction of bases with depth
+                depth, genome_fraction = int(l[1]), float(l[4])
+                if l[0] == 'genome':
+                    avg_depth += depth * genome_fraction
+                    for i, threshold in enumerate(qconfig.coverage_thresholds):
+                        if depth >= threshold:
+                            coverage_for_thresholds[i] += genome_fraction
 
     with open(stats_fpath, 'a') as out_f:
         out_f.write('%s depth\n' % int(avg_depth))
@@ -772,33 +882,60 @@ def analyse_coverage(output_dirpath, fpath, chr_names, bam_fpath, stats_fpath, e
             out_f.write('%.2f coverage >= %sx\n' % (coverage_for_thresholds[i] * 100, threshold))
 
 
-def get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath, cov_fpath, chr_len_fpath):
+def get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath, cov_fpath, chr_len_fpath, max_threads):
     raw_cov_fpath = add_suffix(cov_fpath, 'raw')
     if not is_non_empty_file(raw_cov_fpath):
         logger.info('  Calculating physical coverage...')
         ## keep properly mapped, unique, non-duplicate paired-end reads only
         bam_filtered_fpath = join(output_dirpath, ref_name + '.physical.bam')
-        sambamba_view(bam_fpath, bam_filtered_fpath, qconfig.max_threads, err_fpath, logger,
+        sambamba_view(bam_fpath, bam_filtered_fpath, max_threads, err_fpath, logger,
                       filter_rule='proper_pair and not supplementary and not duplicate '
                                   'and template_length > %d and template_length < %d' %
                                   (-qconfig.MAX_PE_IS, qconfig.MAX_PE_IS))
         ## sort by read names
         bam_filtered_sorted_fpath = join(output_dirpath, ref_name + '.physical.sorted.bam')
-        sort_bam(bam_filtered_fpath, bam_filtered_sorted_fpath, err_fpath, logger, sort_rule='-n')
+        sort_bam(bam_filtered_fpath, bam_filtered_sorted_fpath, err_fpath, logger, threads=max_threads, sort_rule='-n')
         bed_fpath = bam_to_bed(output_dirpath, ref_name + '.physical', bam_filtered_sorted_fpath, err_fpath, logger, bedpe=True)
         calculate_genome_cov(bed_fpath, raw_cov_fpath, chr_len_fpath, err_fpath, logger)
     return raw_cov_fpath
 
 
+def get_coverage_counters(correct_chr_names, cov_fpath, physical_cov_fpath=None, uncovered_fpath=None, create_cov_files=True):
+    counters = []
+    if not is_non_empty_file(cov_fpath) and (create_cov_files or uncovered_fpath):
+        logger.info('  Calculating reads coverage...')
+        counters.append(CoverageCounter(bin_size=COVERAGE_FACTOR, bins_writer=CovFileWriter(cov_fpath) if create_cov_files else None,
+                                        uncovered_fpath=uncovered_fpath, correct_chr_names=correct_chr_names))
+    if physical_cov_fpath and not is_non_empty_file(physical_cov_fpath) and create_cov_files:
+        logger.info('  Calculating physical coverage...')
+        counters.append(CoverageCounter(physical=True, bin_size=COVERAGE_FACTOR, bins_writer=CovFileWriter(physical_cov_fpath),
+                                        correct_chr_names=correct_chr_names))
+    return counters
+
+
 def get_coverage(output_dirpath, ref_fpath, ref_name, bam_fpath, bam_sorted_fpath, log_path, err_fpath, correct_chr_names,
-                 cov_fpath, physical_cov_fpath=None, uncovered_fpath=None, create_cov_files=True):
+                 cov_fpath, max_threads, physical_cov_fpath=None, uncovered_fpath=None, create_cov_files=True, analyzers=None):
+    """
+    Calculates reads and physical coverage in process from the sorted BAM file if numpy is available
+    (the counters are appended to analyzers if the caller reads the sorted alignments anyway), by bedtools otherwise
+    """
+    if can_count_coverage():
+        counters = get_coverage_counters(correct_chr_names, cov_fpath, physical_cov_fpath, uncovered_fpath, create_cov_files)
+        if analyzers is not None:
+            analyzers.extend(counters)
+        elif counters:
+            if not is_non_empty_file(bam_sorted_fpath):
+                sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger, threads=max_threads)
+            process_alignments(iter_sam_lines(bam_sorted_fpath, max_threads, err_fpath, logger), counters)
+        return cov_fpath, physical_cov_fpath
+
     raw_cov_fpath = cov_fpath + '_raw'
     chr_len_fpath = get_chr_len_fpath(ref_fpath, correct_chr_names)
     if not is_non_empty_file(cov_fpath):
         logger.info('  Calculating reads coverage...')
         if not is_non_empty_file(raw_cov_fpath):
             if not is_non_empty_file(bam_sorted_fpath):
-                sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger)
+                sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger, threads=max_threads)
             calculate_genome_cov(bam_sorted_fpath, raw_cov_fpath, chr_len_fpath, err_fpath, logger)
             qutils.assert_file_exists(raw_cov_fpath, 'coverage file')
         if uncovered_fpath:
@@ -807,39 +944,77 @@ def get_coverage(output_dirpath, ref_fpath, ref_name, bam_fpath, bam_sorted_fpat
             proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names)
     if not is_non_empty_file(physical_cov_fpath) and create_cov_files:
         raw_cov_fpath = get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath,
-                                              physical_cov_fpath, chr_len_fpath)
+                                              physical_cov_fpath, chr_len_fpath, max_threads)
         proceed_cov_file(raw_cov_fpath, physical_cov_fpath, correct_chr_names)
     return cov_fpath, physical_cov_fpath
 
 
+class CovFileWriter(object):
+    """
+    Saves depth of coverage averaged over windows of COVERAGE_FACTOR bases into the text file (for Icarus and --cov)
+    and into the multi-resolution track (it also keeps the last incomplete window of each chromosome)
+    """
+    def __init__(self, cov_fpath):
+        self.out_f = open(cov_fpath, 'w')
+        self.track_writer = TrackWriter(get_track_fpath(cov_fpath), COVERAGE, COVERAGE_FACTOR, text_fpath=cov_fpath)
+        self.chr_index = 0
+        self.chr_index_str = None
+
+    def start_chrom(self, name):
+        self.chr_index += 1
+        self.chr_index_str = str(self.chr_index)
+        self.out_f.write('#' + name + ' ' + self.chr_index_str + '\n')
+        self.track_writer.start_chrom(name)
+
+    def add_bin(self, total, length, min_depth, max_depth):
+        if length == COVERAGE_FACTOR:
+            self.out_f.write(self.chr_index_str + ' ' + str(total // COVERAGE_FACTOR) + '\n')
+        self.track_writer.add_bin(total, length, min_depth, max_depth, length=length)
+
+    def add_bins(self, totals, min_depths, max_depths):
+        """
+            Adds full windows given as numpy arrays
+        """
+        prefix = self.chr_index_str + ' '
+        self.out_f.write(''.join(prefix + str(depth) + '\n' for depth in (totals // COVERAGE_FACTOR).tolist()))
+        self.track_writer.add_bins(totals, numpy.full(len(totals), COVERAGE_FACTOR), min_depths, max_depths)
+
+    def close(self):
+        self.out_f.close()
+        self.track_writer.close()
+
+
 def proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names):
-    chr_depth = defaultdict(list)
-    used_chromosomes = dict()
-    chr_index = 0
+    used_chromosomes = set()
+    cov_writer = CovFileWriter(cov_fpath)
+    bin_depth, bin_len, bin_min, bin_max = 0, 0, NO_VALUE, NO_VALUE
     with open(raw_cov_fpath, 'r') as in_coverage:
-        with open(cov_fpath, 'w') as out_coverage:
-            for line in in_coverage:
-                fs = list(line.split())
-                name = fs[0]
-                depth = int(float(fs[-1]))
-                if name not in used_chromosomes:
-                    chr_index += 1
-                    used_chromosomes[name] = str(chr_index)
-                    correct_name = correct_chr_names[name] if correct_chr_names else name
-                    out_coverage.write('#' + correct_name + ' ' + used_chromosomes[name] + '\n')
-                if len(fs) > 3:
-                    start, end = int(fs[1]), int(fs[2])
-                    chr_depth[name].extend([depth] * (end - start))
-                else:
-                    chr_depth[name].append(depth)
-                if len(chr_depth[name]) >= COVERAGE_FACTOR:
-                    max_index = len(chr_depth[name]) - (len(chr_depth[name]) % COVERAGE_FACTOR)
-                    for index in range(0, max_index, COVERAGE_FACTOR):
-                        cur_depth = sum(chr_depth[name][index: index + COVERAGE_FACTOR]) // COVERAGE_FACTOR
-                        out_coverage.write(' '.join([used_chromosomes[name], str(cur_depth) + '\n']))
-                    chr_depth[name] = chr_depth[name][index + COVERAGE_FACTOR:]
-            if not qconfig.debug:
-                os.remove(raw_cov_fpath)
+        for line in in_coverage:
+            fs = list(line.split())
+            name = fs[0]
+            depth = int(float(fs[-1]))
+            if name not in used_chromosomes:
+                if bin_len:
+                    cov_writer.add_bin(bin_depth, bin_len, bin_min, bin_max)
+                bin_depth, bin_len, bin_min, bin_max = 0, 0, NO_VALUE, NO_VALUE
+                used_chromosomes.add(name)
+                cov_writer.start_chrom(correct_chr_names[name] if correct_chr_names else name)
+            positions = int(fs[2]) - int(fs[1]) if len(fs) > 3 else 1
+            while positions:
+                added_len = min(positions, COVERAGE_FACTOR - bin_len)
+                bin_depth += depth * added_len
+                bin_len += added_len
+                bin_min = depth if bin_min == NO_VALUE else min(bin_min, depth)
+                bin_max = max(bin_max, depth)
+                positions -= added_len
+                if bin_len == COVERAGE_FACTOR:
+                    cov_writer.add_bin(bin_depth, bin_len, bin_min, bin_max)
+                    bin_depth, bin_len, bin_min, bin_max = 0, 0, NO_VALUE, NO_VALUE
+    if bin_len:
+        cov_writer.add_bin(bin_depth, bin_len, bin_min, bin_max)
+    cov_writer.close()
+    if not qconfig.debug:
+        os.remove(raw_cov_fpath)
 
 
 def get_max_min_is(insert_sizes):
@@ -860,21 +1035,13 @@ def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
                 return insert_size, min_insert_size, max_insert_size
         except:
             pass
-    insert_sizes = []
-    mapped_flags = ['99', '147', '83', '163']  # reads mapped in correct orientation and within insert size
-    with open(sam_fpath) as sam_in:
-        for i, l in enumerate(sam_in):
-            if i > 1000000:
-                break
-            if l.startswith('@'):
-                continue
-            fs = l.split('\t')
-            flag = fs[1]
-            if flag not in mapped_flags:
-                continue
-            insert_size = abs(int(fs[8]))
-            insert_sizes.append(insert_size)
+    insert_size_sampler = InsertSizeSampler()
+    process_alignments(iter_sam_lines(sam_fpath, qconfig.max_threads, join(output_dir, 'reads_stats.err'), logger),
+                       [insert_size_sampler])
+    return save_insert_size(insert_size_sampler.insert_sizes, insert_size_fpath)
+
 
+def save_insert_size(insert_sizes, insert_size_fpath):
     if insert_sizes:
         insert_sizes.sort()
         median_is = calc_median(insert_sizes)
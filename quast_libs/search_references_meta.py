@@ -16,11 +16,11 @@ from collections import defaultdict
 
 from os.path import isdir, isfile, join
 
-from quast_libs import qconfig, qutils
+from quast_libs import executors, qconfig, qutils
 from quast_libs.fastaparser import _get_fasta_file_handler
 from quast_libs.log import get_logger
 from quast_libs.qutils import is_non_empty_file, slugify, correct_name, get_dir_for_download, show_progress, \
-    download_blast_binaries, get_blast_fpath, md5, run_parallel, add_suffix
+    download_blast_binaries, get_blast_fpath, file_checksum, run_parallel, add_suffix, get_files_sizes
 
 logger = get_logger(qconfig.LOGGER_META_NAME)
 try:
@@ -307,7 +307,7 @@ def parallel_blast(contigs_fpath, label, corrected_dirpath, err_fpath, blast_res
     qutils.call_subprocess(shlex.split(cmd), stdout=open(res_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
     logger.info('  ' + 'BLAST results for %s are saved to %s...' % (label, res_fpath))
     with open(check_fpath, 'w') as check_file:
-        check_file.writelines('Assembly: %s md5 checksum: %s\n' % (contigs_fpath, md5(contigs_fpath)))
+        check_file.writelines('Assembly: %s md5 checksum: %s\n' % (contigs_fpath, file_checksum(contigs_fpath)))
 
 
 def get_blast_output_fpath(blast_output_fpath, label):
@@ -349,7 +349,7 @@ def do(assemblies, labels, downloaded_dirpath, corrected_dirpath, ref_txt_fpath=
     err_fpath = os.path.join(downloaded_dirpath, 'blast.err')
     blast_check_fpath = os.path.join(downloaded_dirpath, 'blast.check')
     blast_res_fpath = os.path.join(downloaded_dirpath, 'blast.res')
-    files_md5 = dict((assembly.fpath, md5(assembly.fpath)) for assembly in assemblies)
+    files_md5 = dict((assembly.fpath, file_checksum(assembly.fpath)) for assembly in assemblies)
     assemblies_fpaths = dict((assembly.fpath, assembly) for assembly in assemblies)
     blast_assemblies, downloaded_organisms, not_founded_organisms = \
         check_blast(blast_check_fpath, blast_res_fpath, files_md5, assemblies_fpaths, assemblies, labels)
@@ -445,11 +445,11 @@ def process_blast(blast_assemblies, downloaded_dirpath, corrected_dirpath, label
     if len(blast_assemblies) > 0:
         logger.main_info('Running BlastN..')
         n_jobs = min(qconfig.max_threads, len(blast_assemblies))
-        blast_threads = max(1, qconfig.max_threads // n_jobs)
         parallel_run_args = [(assembly.fpath, assembly.label, corrected_dirpath,
-                              err_fpath, blast_res_fpath, blast_check_fpath, blast_threads)
+                              err_fpath, blast_res_fpath, blast_check_fpath, executors.AUTO_THREADS)
                              for assembly in blast_assemblies]
-        run_parallel(parallel_blast, parallel_run_args, n_jobs, filter_results=True)
+        run_parallel(parallel_blast, parallel_run_args, n_jobs, filter_results=True,
+                     task_sizes=get_files_sizes([assembly.fpath for assembly in blast_assemblies]))
 
     logger.main_info()
     species_scores = []
@@ -603,7 +603,7 @@ def search_references(organisms, assemblies, labels, max_ref_fragments, download
                 text = check_file.read()
                 text = text[:text.find('\n')]
         else:
-            text = 'Assembly: %s md5 checksum: %s\n' % (assembly.fpath, md5(assembly.fpath))
+            text = 'Assembly: %s md5 checksum: %s\n' % (assembly.fpath, file_checksum(assembly.fpath))
         with open(check_fpath, 'w') as check_file:
             check_file.writelines(text)
             check_file.writelines('\n---\n')
@@ -0,0 +1,312 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Multi-resolution tracks of values along reference sequences (read coverage and GC content),
+# they are read by Icarus and Circos with the window size each of them needs.
+#
+# A track is built in one pass over the values: the first level consists of bins of bin_size bases,
+# each next level merges ZOOM_FACTOR bins of the previous one. A bin keeps the sum of values, their weight
+# (e.g. the number of bases), the minimum and the maximum, so the mean over windows made of whole bins is exact.
+#
+# Layout: magic, rows of bins (sum, weight, min, max as int64 in the native byte order) of all levels of
+# the first chromosome, then of the second one, etc., the JSON footer with names and lengths of chromosomes and
+# positions of their levels, and the footer length (uint32). The footer is written last, so the bins of the first
+# level are saved while they are calculated.
+#
+############################################################################
+
+from __future__ import with_statement
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from quast_libs import qconfig
+
+# numpy is optional: it is used to add many bins at once
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TRACK_EXT = '.track'
+MAGIC = b'QTRACK\x01\x00'
+ZOOM_FACTOR = 10
+ROW_SIZE = 4  # sum, weight, min, max
+FLUSH_BINS = 100000  # bins of the first level are written by chunks
+
+COVERAGE = 'coverage'  # values are read depths of bases
+GC = 'gc'  # sum is the number of G and C bases, weight is the number of ACGT bases, min and max are GC % of bins
+NO_VALUE = -1  # min and max of bins without values (e.g. GC % of bins consisting of Ns)
+MIN_GC_WINDOW_SIZE = qconfig.GC_window_size // 2
+
+try:
+    array('q')
+    INT_TYPECODE = 'q'
+except ValueError:  # python 2
+    INT_TYPECODE = 'l'
+
+
+def get_track_fpath(text_fpath):
+    return text_fpath + TRACK_EXT
+
+
+def _to_bytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _extend_from_bytes(values, data):
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+
+def _merge(acc, total, weight, min_value, max_value):
+    acc[0] += total
+    acc[1] += weight
+    if min_value != NO_VALUE:
+        acc[2] = min_value if acc[2] == NO_VALUE else min(acc[2], min_value)
+        acc[3] = max(acc[3], max_value)
+    acc[4] += 1
+
+
+def get_GC_percent_by_counts(length, GC_len, ACGT_len):
+    """
+        GC % of a window by its counts, the same as basic_stats.get_GC_percent of its sequence
+        (None if the window is too short or has less than half of ACGT letters)
+    """
+    if length < MIN_GC_WINDOW_SIZE or ACGT_len < length // 2 or not ACGT_len:
+        return None
+    return 100 * GC_len // ACGT_len
+
+
+class TrackWriter(object):
+    """
+    Writes a track: bins of the first level are added in the order of positions,
+    bins of the next levels are merged from them on the fly
+    """
+    def __init__(self, track_fpath, kind, bin_size, text_fpath=None):
+        self.track_fpath = track_fpath
+        self.text_fpath = text_fpath
+        self.kind = kind
+        self.bin_size = bin_size
+        self.out_f = open(track_fpath + '.tmp', 'wb')
+        self.out_f.write(MAGIC)
+        self.chroms = []
+        self.chrom = None
+
+    def start_chrom(self, name):
+        self._end_chrom()
+        self.chrom = {'name': name, 'length': 0, 'levels': []}
+        self.levels = []  # bins of the current chromosome, the first level is flushed by chunks
+        self.accumulators = []  # the next bin of the level + 1: sum, weight, min, max, number of merged bins
+        self.first_level_offset = self.out_f.tell()
+        self.flushed_bins = 0
+
+    def add_bin(self, total, weight, min_value, max_value, length=None):
+        self.chrom['length'] += self.bin_size if length is None else length
+        self._add(0, total, weight, min_value, max_value)
+
+    def add_bins(self, totals, weights, min_values, max_values):
+        """
+            Adds full bins (of bin_size bases) given as numpy arrays, bins of the next levels are merged by groups
+        """
+        self.chrom['length'] += self.bin_size * len(totals)
+        rows = numpy.column_stack((totals, weights, min_values, max_values)).astype(numpy.dtype(INT_TYPECODE))
+        self._add_rows(0, rows)
+
+    def _add_rows(self, level, rows):
+        first_row = 0
+        # the incomplete bin of the next level is completed one by one
+        while first_row < len(rows) and (level == len(self.levels) or self.accumulators[level] is not None):
+            self._add(level, *rows[first_row].tolist())
+            first_row += 1
+        rows = rows[first_row:]
+        if not len(rows):
+            return
+        _extend_from_bytes(self.levels[level], rows.tobytes())
+        if level == 0 and len(self.levels[0]) >= FLUSH_BINS * ROW_SIZE:
+            self._flush_first_level()
+        groups_num = len(rows) // ZOOM_FACTOR
+        if groups_num:
+            groups = rows[:groups_num * ZOOM_FACTOR].reshape(groups_num, ZOOM_FACTOR, ROW_SIZE)
+            min_values = groups[:, :, 2]
+            has_values = min_values != NO_VALUE
+            merged_min = numpy.where(has_values, min_values, numpy.iinfo(rows.dtype).max).min(axis=1)
+            merged_min[~has_values.any(axis=1)] = NO_VALUE
+            merged = numpy.column_stack((groups[:, :, 0].sum(axis=1), groups[:, :, 1].sum(axis=1),
+                                         merged_min, groups[:, :, 3].max(axis=1))).astype(rows.dtype)
+            self._add_rows(level + 1, merged)
+        rest = rows[groups_num * ZOOM_FACTOR:]
+        if len(rest):
+            acc = self.accumulators[level] = [0, 0, NO_VALUE, NO_VALUE, 0]
+            for row in rest.tolist():
+                _merge(acc, *row)
+
+    def _add(self, level, total, weight, min_value, max_value):
+        if level == len(self.levels):
+            self.levels.append(array(INT_TYPECODE))
+            self.accumulators.append(None)
+        self.levels[level].extend([total, weight, min_value, max_value])
+        if level == 0 and len(self.levels[0]) >= FLUSH_BINS * ROW_SIZE:
+            self._flush_first_level()
+        if self.accumulators[level] is None:
+            self.accumulators[level] = [0, 0, NO_VALUE, NO_VALUE, 0]
+        acc = self.accumulators[level]
+        _merge(acc, total, weight, min_value, max_value)
+        if acc[4] == ZOOM_FACTOR:
+            self.accumulators[level] = None
+            self._add(level + 1, *acc[:ROW_SIZE])
+
+    def _get_bins_num(self, level):
+        return len(self.levels[level]) // ROW_SIZE + (self.flushed_bins if level == 0 else 0)
+
+    def _flush_first_level(self):
+        self.out_f.write(_to_bytes(self.levels[0]))
+        self.flushed_bins += len(self.levels[0]) // ROW_SIZE
+        self.levels[0] = array(INT_TYPECODE)
+
+    def _end_chrom(self):
+        if self.chrom is None:
+            return
+        level = 0
+        while level < len(self.levels):
+            # the last (incomplete) bins are merged too, until the level consists of a single bin
+            if self.accumulators[level] is not None and self._get_bins_num(level) > 1:
+                acc, self.accumulators[level] = self.accumulators[level], None
+                self._add(level + 1, *acc[:ROW_SIZE])
+            level += 1
+        if self.levels:
+            self._flush_first_level()
+            self.chrom['levels'].append([self.first_level_offset, self.flushed_bins])
+            for bins in self.levels[1:]:
+                self.chrom['levels'].append([self.out_f.tell(), len(bins) // ROW_SIZE])
+                self.out_f.write(_to_bytes(bins))
+        self.chroms.append(self.chrom)
+        self.chrom = None
+
+    def close(self):
+        self._end_chrom()
+        footer = {'kind': self.kind, 'bin_size': self.bin_size, 'zoom_factor': ZOOM_FACTOR,
+                  'typecode': INT_TYPECODE, 'itemsize': array(INT_TYPECODE).itemsize, 'byteorder': sys.byteorder,
+                  'text_size': os.path.getsize(self.text_fpath) if self.text_fpath else None, 'chroms': self.chroms}
+        footer_bytes = json.dumps(footer).encode('utf-8')
+        self.out_f.write(footer_bytes)
+        self.out_f.write(struct.pack('<I', len(footer_bytes)))
+        self.out_f.close()
+        os.rename(self.track_fpath + '.tmp', self.track_fpath)
+
+
+class Track(object):
+    """
+    Read-only view of a saved track, bins are memory-mapped
+    """
+    def __init__(self, track_fpath):
+        with open(track_fpath, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Not a track: ' + track_fpath)
+            f.seek(-4, os.SEEK_END)
+            footer_len = struct.unpack('<I', f.read(4))[0]
+            f.seek(-4 - footer_len, os.SEEK_END)
+            footer = json.loads(f.read(footer_len).decode('utf-8'))
+            if footer['byteorder'] != sys.byteorder or footer['itemsize'] != array(INT_TYPECODE).itemsize:
+                raise ValueError('Track was created on a platform with a different byte order or integer size')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.footer = footer
+        self.kind = footer['kind']
+        self.bin_size = footer['bin_size']
+        self.zoom_factor = footer['zoom_factor']
+        self.chrom_names = [chrom['name'] for chrom in footer['chroms']]
+        self._chroms = dict((chrom['name'], chrom) for chrom in footer['chroms'])
+
+    def __contains__(self, name):
+        return name in self._chroms
+
+    def get_length(self, name):
+        return self._chroms[name]['length']
+
+    def get_level_bin_size(self, level):
+        return self.bin_size * self.zoom_factor ** level
+
+    def get_bins(self, name, level):
+        """
+            Returns the flat sequence of rows (sum, weight, min, max) of bins of the level
+        """
+        offset, n_bins = self._chroms[name]['levels'][level]
+        size = n_bins * ROW_SIZE * self.footer['itemsize']
+        if hasattr(memoryview, 'cast'):
+            return memoryview(self._mmap)[offset:offset + size].cast(str(self.footer['typecode']))
+        values = array(INT_TYPECODE)
+        values.fromstring(self._mmap[offset:offset + size])
+        return values
+
+    def iter_windows(self, name, window_size):
+        """
+            Yields start, length, sum, weight, min and max of consecutive windows of the chromosome.
+            window_size should be a multiple of bin_size, windows are merged from the coarsest level that fits them
+        """
+        chrom = self._chroms.get(name)
+        if not chrom or not chrom['levels']:
+            return
+        level = 0
+        while level + 1 < len(chrom['levels']) and window_size % self.get_level_bin_size(level + 1) == 0:
+            level += 1
+        bins = self.get_bins(name, level)
+        n_bins = len(bins) // ROW_SIZE
+        bins_per_window = window_size // self.get_level_bin_size(level)
+        for first_bin in range(0, n_bins, bins_per_window):
+            last_bin = min(first_bin + bins_per_window, n_bins)
+            if bins_per_window == 1:
+                row = bins[first_bin * ROW_SIZE:(first_bin + 1) * ROW_SIZE]
+                acc = [row[0], row[1], row[2], row[3]]
+            else:
+                acc = [0, 0, NO_VALUE, NO_VALUE, 0]
+                for i in range(first_bin * ROW_SIZE, last_bin * ROW_SIZE, ROW_SIZE):
+                    _merge(acc, bins[i], bins[i + 1], bins[i + 2], bins[i + 3])
+            start = first_bin * window_size // bins_per_window
+            yield start, min(window_size, chrom['length'] - start), acc[0], acc[1], acc[2], acc[3]
+
+    def get_values(self, name, window_size, only_full=False):
+        """
+            Returns starts and values of windows: integer mean depth of coverage or GC %
+            (windows with too many Ns are skipped as in basic_stats.get_windows_GC)
+        """
+        starts, values = [], []
+        for start, length, total, weight, min_value, max_value in self.iter_windows(name, window_size):
+            if only_full and length < window_size:
+                continue
+            if self.kind == GC:
+                value = get_GC_percent_by_counts(length, total, weight)
+                if value is None:
+                    continue
+            else:
+                value = total // weight if weight else 0
+            starts.append(start)
+            values.append(value)
+        return starts, values
+
+
+def open_track(fpath):
+    """
+        Returns the track saved into fpath or together with the text file fpath,
+        None if it is missing or out of date (then the text file should be parsed)
+    """
+    if not fpath:
+        return None
+    track_fpath = fpath if fpath.endswith(TRACK_EXT) else get_track_fpath(fpath)
+    if not os.path.isfile(track_fpath):
+        return None
+    try:
+        track = Track(track_fpath)
+    except (ValueError, KeyError, IOError, OSError, struct.error):
+        return None
+    if track_fpath != fpath and (not os.path.isfile(fpath) or track.footer['text_size'] != os.path.getsize(fpath)):
+        return None
+    return track
@@ -16,7 +16,7 @@ from os.path import join, abspath, exists, basename, isdir
 from quast_libs import qconfig, reporting, qutils
 from quast_libs.ca_utils.misc import compile_minimap, minimap_fpath
 from quast_libs.fastaparser import read_fasta
-from quast_libs.qutils import get_free_memory, md5, download_external_tool, \
+from quast_libs.qutils import get_free_memory, file_checksum, download_external_tool, \
     get_dir_for_download
 from quast_libs.reporting import save_kmers
 
@@ -39,8 +39,8 @@ def create_kmc_stats_file(output_dir, contigs_fpath, ref_fpath, completeness,
     kmc_check_fpath = join(output_dir, label + '.sf')
     kmc_stats_fpath = join(output_dir, label + '.stat')
     with open(kmc_check_fpath, 'w') as check_f:
-        check_f.write("Assembly md5 checksum: %s\n" % md5(contigs_fpath))
-        check_f.write("Reference md5 checksum: %s\n" % md5(ref_fpath))
+        check_f.write("Assembly md5 checksum: %s\n" % file_checksum(contigs_fpath))
+        check_f.write("Reference md5 checksum: %s\n" % file_checksum(ref_fpath))
     with open(kmc_stats_fpath, 'w') as stats_f:
         stats_f.write("Completeness: %s\n" % completeness)
         if corr_len or mis_len:
@@ -60,9 +60,9 @@ def check_kmc_successful_check(output_dir, contigs_fpath, contigs_fpaths, ref_fp
     successful_check_content = open(kmc_check_fpath).read().split('\n')
     if len(successful_check_content) < 2:
         return False
-    if successful_check_content[0].strip().split()[-1] != str(md5(contigs_fpath)):
+    if successful_check_content[0].strip().split()[-1] != str(file_checksum(contigs_fpath)):
         return False
-    if successful_check_content[1].strip().split()[-1] != str(md5(ref_fpath)):
+    if successful_check_content[1].strip().split()[-1] != str(file_checksum(ref_fpath)):
         return False
     return True
 
@@ -247,7 +247,6 @@ The tool accepts multiple assemblies, thus is suitable for comparison.''',
     zip_safe=False,
     scripts=['quast.py', 'metaquast.py', 'icarus.py', 'quast-lg.py'],
     install_requires=[
-        'joblib',
         'simplejson',
     ],
     classifiers=[
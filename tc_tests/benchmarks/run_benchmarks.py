@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Benchmarks of QUAST hot paths on synthetic data (see synthetic_data.py), external aligners are not used:
+# the alignments of the assembly are generated together with it.
+# Wall time, CPU time and peak RSS of each benchmark are measured like the stages of a QUAST run
+# (see quast_libs/profiling.py). They can be saved as a baseline and compared with it, e.g. in CI:
+#
+#   ./run_benchmarks.py --scale medium --save-baseline baseline_medium.json
+#   ./run_benchmarks.py --scale medium --baseline baseline_medium.json
+#
+# The exit code is non-zero if any benchmark is slower or uses more memory than the baseline plus the tolerance.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from optparse import OptionParser
+
+import synthetic_data
+from quast_libs import qconfig
+# defaults which are set by options_parser in QUAST runs, some modules use them on import
+qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE
+qconfig.min_contig = qconfig.DEFAULT_MIN_CONTIG
+qconfig.min_alignment = qconfig.DEFAULT_MIN_ALIGNMENT
+qconfig.min_IDY = qconfig.DEFAULT_MIN_IDY
+qconfig.max_threads = 1
+
+from quast_libs import executors, fastaparser, genes_parser, genome_analyzer, icarus, N50, profiling, reporting
+from quast_libs.reads_analyzer import get_coverage_counters, process_alignments
+from quast_libs.basic_stats import GC_content
+from quast_libs.ca_utils.analyze_contigs import analyze_contigs
+from quast_libs.ca_utils.best_set_selection import get_best_aligns_sets, score_single_align
+from quast_libs.ca_utils.coords_store import CoordsWriter, read_mappings_by_contig
+from quast_libs.ca_utils.misc import close_handlers
+from quast_libs.contigs_analyzer import CAOutput, analyze_coverage
+from quast_libs.icarus_parser import parse_aligner_contig_report
+from quast_libs.icarus_utils import check_misassembled_blocks, get_assemblies
+
+MB = 1024 * 1024
+# differences smaller than these are noise even if they are larger than the tolerance
+MIN_TIME_DIFF = 0.1
+MIN_MEMORY_DIFF = 16 * MB
+METRICS = ['wall_time', 'cpu_time', 'peak_rss']
+READ_LEN = 100
+READS_DEPTH = 10
+
+
+class BenchmarkData(object):
+    """
+    Input files of the benchmarks and the results of the previous benchmarks used by the next ones
+    """
+    def __init__(self, data_dirpath, output_dirpath, threads):
+        self.ref_fpath = os.path.join(data_dirpath, synthetic_data.reference_fname)
+        self.contigs_fpath = os.path.join(data_dirpath, synthetic_data.contigs_fname)
+        self.coords_fpath = os.path.join(data_dirpath, synthetic_data.coords_fname)
+        self.genes_fpath = os.path.join(data_dirpath, synthetic_data.genes_fname)
+        self.output_dirpath = output_dirpath
+        self.threads = threads
+        self.label = qconfig.assembly_labels_by_fpath.setdefault(self.contigs_fpath, 'assembly')
+        self.reference_chromosomes = None
+        self.ns_by_chromosomes = None
+        self.aligns = None
+        self.ref_aligns = None
+        self.containers = []
+
+
+def bench_read_fasta(data):
+    for fpath in [data.ref_fpath, data.contigs_fpath]:
+        for name, seq in fastaparser.read_fasta(fpath):
+            pass
+
+
+def bench_genome_stats(data):
+    genome_size, data.reference_chromosomes, data.ns_by_chromosomes = fastaparser.get_genome_stats(data.ref_fpath)
+
+
+def bench_GC_content(data):
+    GC_content(data.contigs_fpath)
+
+
+def bench_N50(data):
+    lengths = sorted((entry.length for entry in fastaparser.get_fasta_index(data.contigs_fpath)), reverse=True)
+    reference_length = sum(data.reference_chromosomes.values())
+    nx_curve = N50.NxCurve(lengths, is_sorted=True)
+    (n50, l50), (nx, lx) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx])
+    (ng50, lg50), (ngx, lgx) = nx_curve.get_values([50.0, qconfig.x_for_additional_Nx], reference_length)
+    # the fields are used by Icarus
+    report = reporting.get(data.contigs_fpath)
+    for field, value in [(reporting.Fields.N50, n50), (reporting.Fields.L50, l50), (reporting.Fields.NG50, ng50),
+                         (reporting.Fields.LG50, lg50), (reporting.Fields.Nx, nx), (reporting.Fields.NGx, ngx),
+                         (reporting.Fields.CONTIGS, len(lengths)), (reporting.Fields.TOTALLEN, nx_curve.total_length)]:
+        report.add_field(field, value)
+
+
+def bench_read_coords(data):
+    data.aligns = read_mappings_by_contig(data.coords_fpath)
+
+
+def get_contigs_for_bss(data):
+    """
+    Contigs that are analyzed by get_best_aligns_sets in analyze_contigs: no alignment captures most of the contig
+    """
+    contigs = []
+    for name, seq in fastaparser.read_fasta(data.contigs_fpath):
+        aligns = [align for align in data.aligns.get(name, []) if align.len2 >= qconfig.min_alignment]
+        if not aligns:
+            continue
+        sorted_aligns = sorted(aligns, key=lambda x: (score_single_align(x), x.len2), reverse=True)
+        if not (sorted_aligns[0].len2 > len(seq) * 0.99 or len(seq) - sorted_aligns[0].len2 < 10):
+            contigs.append((sorted_aligns, len(seq), seq))
+    return contigs
+
+
+def bench_best_aligns_sets(data, contigs):
+    with open(os.devnull, 'w') as stdout_f:
+        for sorted_aligns, ctg_len, seq in contigs:
+            get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, data.reference_chromosomes)
+
+
+def bench_analyze_contigs(data):
+    report_fpath_pattern = os.path.join(data.output_dirpath, '%s_' + data.label)
+    icarus_out_f = open(os.path.join(data.output_dirpath, qconfig.icarus_report_fname_pattern % data.label), 'w')
+    icarus_out_f.write('\t'.join(['S1', 'E1', 'S2', 'E2', 'Reference', 'Contig', 'IDY', 'Ambiguous', 'Best_group']) + '\n')
+    ca_output = CAOutput(stdout_f=open(report_fpath_pattern % 'stdout', 'w'),
+                         misassembly_f=open(report_fpath_pattern % 'mis_contigs', 'w'),
+                         coords_filtered_f=CoordsWriter(os.path.join(data.output_dirpath, data.label + '.coords.filtered'),
+                                                        compress=not qconfig.no_gzip),
+                         icarus_out_f=icarus_out_f)
+    result = analyze_contigs(ca_output, data.contigs_fpath, report_fpath_pattern % 'unaligned',
+                             report_fpath_pattern % 'unaligned_info', data.aligns, {}, data.reference_chromosomes,
+                             threads=data.threads)
+    close_handlers(ca_output)
+    data.ref_aligns = result[1]
+
+
+def bench_analyze_coverage(data):
+    analyze_coverage(data.ref_aligns, data.reference_chromosomes, data.ns_by_chromosomes,
+                     os.path.join(data.output_dirpath, data.label + '.used_snps'))
+
+
+def load_genes(data):
+    container = genome_analyzer.FeatureContainer([data.genes_fpath], 'gene')
+    container.region_list = genes_parser.get_genes_from_file(data.genes_fpath, container.kind)
+    container.chr_names_dict = genome_analyzer.chromosomes_names_dict(container.kind, container.region_list,
+                                                                      list(data.reference_chromosomes.keys()))
+    return [container]
+
+
+def bench_genome_analyzer(data, containers):
+    data.containers = containers
+    genome_stats_dirpath = os.path.join(data.output_dirpath, 'genome_stats')
+    if not os.path.isdir(genome_stats_dirpath):
+        os.makedirs(genome_stats_dirpath)
+    ref_lengths, results = genome_analyzer.process_single_file(
+        data.contigs_fpath, 0, data.output_dirpath, genome_stats_dirpath,
+        data.reference_chromosomes, data.ns_by_chromosomes, data.containers)
+    # aligned lengths are used by Icarus
+    for chr_name in data.reference_chromosomes:
+        genome_analyzer.ref_lengths_by_contigs[chr_name] = [ref_lengths[chr_name]]
+
+
+def get_cumulative_ref_lengths(data):
+    cumulative_ref_lengths = [0]
+    for chr_len in data.reference_chromosomes.values():
+        cumulative_ref_lengths.append(cumulative_ref_lengths[-1] + chr_len)
+    return cumulative_ref_lengths
+
+
+def bench_icarus_parser(data):
+    report_fpath = os.path.join(data.output_dirpath, qconfig.icarus_report_fname_pattern % data.label)
+    aligned_blocks, misassembled_id_to_structure, contigs, ambiguity_alignments = parse_aligner_contig_report(
+        report_fpath, list(data.reference_chromosomes.keys()), get_cumulative_ref_lengths(data))
+    for block in aligned_blocks:
+        block.label = data.label
+    return check_misassembled_blocks(aligned_blocks, misassembled_id_to_structure)
+
+
+def bench_icarus_find_similar(data, aligned_blocks):
+    virtual_genome_size = sum(data.reference_chromosomes.values()) + 100 * (len(data.reference_chromosomes) - 1)
+    get_assemblies([data.contigs_fpath], [aligned_blocks], virtual_genome_size, find_similar=True)
+
+
+def bench_icarus(data):
+    icarus.do([data.contigs_fpath], os.path.join(data.output_dirpath, qconfig.icarus_report_fname_pattern),
+              data.output_dirpath, data.ref_fpath, features=data.containers)
+
+
+def write_reads_sam(data):
+    """
+    Sorted alignments of pairs of reads without errors covering the reference with READS_DEPTH on average
+    """
+    sam_fpath = os.path.join(data.output_dirpath, 'reads.sorted.sam')
+    rng = random.Random(0)
+    max_step = 2 * READ_LEN // READS_DEPTH
+    with open(sam_fpath, 'w') as out_f:
+        for chr_name, chr_len in data.reference_chromosomes.items():
+            out_f.write('@SQ\tSN:%s\tLN:%d\n' % (chr_name, chr_len))
+        for chr_name, chr_len in data.reference_chromosomes.items():
+            pos = 1
+            while pos + READ_LEN <= chr_len:
+                out_f.write('read\t99\t%s\t%d\t60\t%dM\t=\t%d\t%d\t*\t*\n' %
+                            (chr_name, pos, READ_LEN, pos, rng.randint(200, 500)))
+                pos += rng.randint(0, max_step)
+    return sam_fpath
+
+
+def bench_reads_coverage(data, sam_fpath):
+    cov_fpath = os.path.join(data.output_dirpath, 'reads.cov')
+    counters = get_coverage_counters(None, cov_fpath, os.path.join(data.output_dirpath, 'reads.physical.cov'),
+                                     os.path.join(data.output_dirpath, 'reads.uncovered'))
+    with open(sam_fpath) as sam_file:
+        process_alignments(sam_file, counters)
+
+
+# name --> (function, function preparing its arguments but not measured), benchmarks are run in this order
+BENCHMARKS = OrderedDict([
+    ('read_fasta', (bench_read_fasta, None)),
+    ('genome_stats', (bench_genome_stats, None)),
+    ('GC_content', (bench_GC_content, None)),
+    ('N50', (bench_N50, None)),
+    ('read_coords', (bench_read_coords, None)),
+    ('best_aligns_sets', (bench_best_aligns_sets, get_contigs_for_bss)),
+    ('analyze_contigs', (bench_analyze_contigs, None)),
+    ('analyze_coverage', (bench_analyze_coverage, None)),
+    ('genome_analyzer', (bench_genome_analyzer, load_genes)),
+    ('icarus_parser', (bench_icarus_parser, None)),
+    ('icarus_find_similar', (bench_icarus_find_similar, bench_icarus_parser)),
+    ('icarus', (bench_icarus, None)),
+    ('reads_coverage', (bench_reads_coverage, write_reads_sam)),
+])
+
+
+def run_benchmarks(data):
+    """
+    Runs all benchmarks (the next ones depend on the previous ones), returns name --> measured resources
+    """
+    results = OrderedDict()
+    profiling.start()
+    for name, (bench_fn, prepare_fn) in BENCHMARKS.items():
+        args = [data]
+        if prepare_fn:
+            args.append(prepare_fn(data))
+        with profiling.stage(name):
+            bench_fn(*args)
+        record = profiling.stages[-1]
+        results[name] = OrderedDict((metric, record[metric]) for metric in METRICS)
+        print('  %-20s %8.2f s %10.1f MB' % (name, record['wall_time'], float(record['peak_rss'] or 0) / MB))
+    return results
+
+
+def compare_with_baseline(results, baseline, time_tolerance, memory_tolerance):
+    """
+    Prints the comparison of results with the baseline, returns names of regressed benchmarks
+    """
+    regressions = []
+    print('%-20s %10s %10s %8s %12s %12s %8s' % ('Benchmark', 'Time (s)', 'Baseline', 'Change', 'Peak (MB)', 'Baseline', 'Change'))
+    for name, values in results.items():
+        if name not in baseline:
+            print('%-20s %10.2f %10s' % (name, values['wall_time'], '-'))
+            continue
+        base_values = baseline[name]
+        changes = []
+        is_regressed = False
+        for metric, tolerance, min_diff in [('wall_time', time_tolerance, MIN_TIME_DIFF),
+                                            ('peak_rss', memory_tolerance, MIN_MEMORY_DIFF)]:
+            value, base_value = values[metric], base_values.get(metric)
+            if value is None or not base_value:
+                changes.append('-')
+                continue
+            changes.append('%+.1f%%' % ((value - base_value) * 100.0 / base_value))
+            if value > base_value * (1 + tolerance) and value - base_value > min_diff:
+                is_regressed = True
+        if is_regressed:
+            regressions.append(name)
+        print('%-20s %10.2f %10.2f %8s %12.1f %12.1f %8s%s' % (
+            name, values['wall_time'], base_values['wall_time'], changes[0],
+            float(values['peak_rss'] or 0) / MB, float(base_values.get('peak_rss') or 0) / MB, changes[1],
+            '  REGRESSION' if is_regressed else ''))
+    return regressions
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]', description='Benchmarks of QUAST hot paths on synthetic data')
+    synthetic_data.add_params_options(parser)
+    parser.add_option('-d', '--data-dir', help='Directory for the synthetic data and the outputs. The data is reused '
+                                               'if it was generated with the same parameters [default: temporary directory]')
+    parser.add_option('-t', '--threads', type='int', default=1, help='Number of threads [default: %default]')
+    parser.add_option('--save-baseline', metavar='FILE', help='Save the results as a baseline (JSON)')
+    parser.add_option('--baseline', metavar='FILE', help='Compare the results with the baseline, '
+                                                         'the exit code is 1 in case of regressions')
+    parser.add_option('--time-tolerance', type='float', default=0.25,
+                      help='Allowed relative increase of wall time [default: %default]')
+    parser.add_option('--memory-tolerance', type='float', default=0.25,
+                      help='Allowed relative increase of peak RSS [default: %default]')
+    opts, args = parser.parse_args()
+
+    params = synthetic_data.get_params_from_options(opts)
+    baseline = None
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            baseline = json.load(f, object_pairs_hook=OrderedDict)
+        if baseline['params'] != params or baseline['threads'] != opts.threads:
+            sys.exit('Parameters of the data or number of threads differ from the baseline: ' +
+                     json.dumps(baseline['params']) + ', threads: ' + str(baseline['threads']))
+
+    data_dirpath = opts.data_dir or tempfile.mkdtemp(prefix='quast_benchmarks_')
+    try:
+        print('Preparing synthetic data in ' + data_dirpath + '...')
+        data_info = synthetic_data.prepare(data_dirpath, params)
+        print('  ' + ', '.join('%s: %s' % (name, value) for name, value in data_info['stats'].items()))
+        output_dirpath = os.path.join(data_dirpath, 'output')
+        if os.path.isdir(output_dirpath):
+            shutil.rmtree(output_dirpath)
+        os.makedirs(output_dirpath)
+        qconfig.output_dirpath = output_dirpath
+        qconfig.max_threads = opts.threads
+
+        print('Running benchmarks...')
+        results = run_benchmarks(BenchmarkData(data_dirpath, output_dirpath, opts.threads))
+        executors.shutdown()
+    finally:
+        if not opts.data_dir:
+            shutil.rmtree(data_dirpath, ignore_errors=True)
+
+    if opts.save_baseline:
+        with open(opts.save_baseline, 'w') as out_f:
+            json.dump(OrderedDict([('params', params), ('threads', opts.threads), ('python', platform.python_version()),
+                                   ('benchmarks', results)]), out_f, indent=2)
+        print('Baseline is saved to ' + opts.save_baseline)
+    if baseline:
+        print('')
+        regressions = compare_with_baseline(results, baseline['benchmarks'], opts.time_tolerance, opts.memory_tolerance)
+        if regressions:
+            sys.exit('Regressions: ' + ', '.join(regressions))
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Seeded generator of synthetic data for the benchmarks of QUAST hot paths:
+# a reference with repeats, an assembly with misassemblies, N-runs and unaligned contigs,
+# exact alignments of the assembly to the reference in the .coords format
+# (so minimap2 is not needed) and a GFF file with genes.
+#
+# The same parameters and seed always give the same files.
+# Note: the whole reference is kept in memory, i.e. ~3 GB of RAM for the human-size genome.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import binascii
+import json
+import os
+import random
+import sys
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from optparse import OptionParser
+
+quast_dirpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir)
+sys.path.insert(0, os.path.abspath(quast_dirpath))
+
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+from quast_libs.ca_utils.coords_store import CoordsWriter
+
+reference_fname = 'reference.fasta'
+contigs_fname = 'assembly.fasta'
+coords_fname = 'assembly.coords'
+genes_fname = 'genes.gff'
+params_fname = 'params.json'
+
+# genome size and number of contigs of the presets: from a bacterium to a fragmented human assembly
+SCALES = OrderedDict([
+    ('small', dict(genome_size=1000000, contigs=200, chromosomes=1)),
+    ('medium', dict(genome_size=50000000, contigs=20000, chromosomes=5)),
+    ('large', dict(genome_size=500000000, contigs=500000, chromosomes=20)),
+    ('human', dict(genome_size=3000000000, contigs=10000000, chromosomes=24)),
+])
+
+DEFAULT_PARAMS = OrderedDict([
+    ('seed', 1),
+    ('genome_size', 1000000),
+    ('contigs', 200),
+    ('chromosomes', 1),
+    ('coverage', 0.95),       # fraction of the reference covered by contigs
+    ('misassemblies', 0.05),  # fraction of chimeric contigs (relocations, translocations, inversions, local misassemblies)
+    ('n_runs', 0.1),          # fraction of contigs with a run of N's (scaffold gap)
+    ('unaligned', 0.02),      # fraction of contigs with random sequences
+    ('repeats', 0.03),        # fraction of the reference in copies of repeats
+    ('genes_per_mbp', 500),
+])
+
+SEQ_CHUNK_SIZE = 1024 * 1024
+FASTA_LINE_WIDTH = 60
+MIN_PIECE_LEN = 100  # minimal length of a part of a chimeric contig
+MIN_REPEAT_ALIGN_LEN = 100
+EXTENSIVE_DISTANCE = 10000  # distance between parts of relocations, well above the extensive misassembly threshold
+LOCAL_GAP = (100, 900)
+N_RUN_LEN = (10, 500)
+REPEAT_LEN = (500, 5000)
+REPEAT_COPIES = (2, 10)
+GENE_LEN = (300, 3000)
+
+ACGT_TRANSLATION = b'ACGT' * 64
+COMPLEMENT_TRANSLATION = bytearray(range(256))
+for _letter, _complement in zip(bytearray(b'ACGTN'), bytearray(b'TGCAN')):
+    COMPLEMENT_TRANSLATION[_letter] = _complement
+COMPLEMENT_TRANSLATION = bytes(COMPLEMENT_TRANSLATION)
+
+
+def parse_size(value):
+    """
+    Parses sizes like 3000, 50k, 1.5M or 3G
+    """
+    value = str(value).strip().upper()
+    multiplier = 1
+    if value and value[-1] in 'KMG':
+        multiplier = 1000 ** ('KMG'.index(value[-1]) + 1)
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def get_params(scale=None, **kwargs):
+    """
+    Returns parameters of the generator: defaults, then the preset of the scale, then kwargs (if not None)
+    """
+    params = OrderedDict(DEFAULT_PARAMS)
+    if scale:
+        params.update(SCALES[scale])
+    for name, value in kwargs.items():
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def random_seq(rng, length):
+    """
+    Random ACGT bytes of the length, they are generated by chunks from random bits (4 bases per random byte would be
+    more compact, but a byte per base is much faster to translate)
+    """
+    chunks = []
+    while length > 0:
+        chunk_len = min(length, SEQ_CHUNK_SIZE)
+        random_bytes = binascii.unhexlify('%0*x' % (2 * chunk_len, rng.getrandbits(8 * chunk_len)))
+        chunks.append(random_bytes.translate(ACGT_TRANSLATION))
+        length -= chunk_len
+    return b''.join(chunks)
+
+
+def rev_comp(seq):
+    return bytes(seq).translate(COMPLEMENT_TRANSLATION)[::-1]
+
+
+def write_fasta_entry(out_f, name, seq):
+    out_f.write(b'>' + name.encode('utf-8') + b'\n')
+    for i in range(0, len(seq), FASTA_LINE_WIDTH):
+        out_f.write(seq[i:i + FASTA_LINE_WIDTH])
+        out_f.write(b'\n')
+
+
+def split_number(total, weights):
+    """
+    Splits total into integer parts proportional to weights
+    """
+    parts = []
+    weights_sum = float(sum(weights))
+    cumulative_weight = 0
+    prev_bound = 0
+    for weight in weights:
+        cumulative_weight += weight
+        bound = int(round(total * cumulative_weight / weights_sum))
+        parts.append(bound - prev_bound)
+        prev_bound = bound
+    return parts
+
+
+class Reference(object):
+    """
+    Chromosomes (name --> bytearray) with copies of repeats: for each chromosome, a sorted list of
+    (start, end, family) of copies (0-based, end is exclusive) and for each family a list of (chromosome, start)
+    """
+    def __init__(self, rng, params):
+        self.seqs = OrderedDict()
+        n_chromosomes = max(1, params['chromosomes'])
+        lengths = split_number(params['genome_size'], [rng.uniform(0.5, 1.5) for _ in range(n_chromosomes)])
+        for i, chr_len in enumerate(lengths):
+            self.seqs['chr%d' % (i + 1)] = bytearray(random_seq(rng, max(1, chr_len)))
+        self.names = list(self.seqs.keys())
+        self.cumulative_lengths = []
+        total_len = 0
+        for name in self.names:
+            total_len += len(self.seqs[name])
+            self.cumulative_lengths.append(total_len)
+        self.total_len = total_len
+        self.copies = dict((name, []) for name in self.names)
+        self.families = []
+        self._add_repeats(rng, int(params['genome_size'] * params['repeats']))
+
+    def random_chromosome(self, rng):
+        """
+        Chromosome chosen with the probability proportional to its length
+        """
+        return self.names[bisect_right(self.cumulative_lengths, rng.randrange(self.total_len))]
+
+    def _add_repeats(self, rng, total_repeats_len):
+        placed_len = 0
+        n_placed, n_attempts = 0, 0
+        while placed_len < total_repeats_len and n_attempts < 1000 + 10 * n_placed:
+            unit_len = rng.randint(*REPEAT_LEN)
+            unit = random_seq(rng, unit_len)
+            family = []
+            for _ in range(rng.randint(*REPEAT_COPIES)):
+                n_attempts += 1
+                chr_name = self.random_chromosome(rng)
+                chr_seq = self.seqs[chr_name]
+                if len(chr_seq) < 10 * unit_len:
+                    continue
+                start = rng.randrange(len(chr_seq) - unit_len)
+                copies = self.copies[chr_name]
+                idx = bisect_left(copies, (start, ))
+                if (idx > 0 and copies[idx - 1][1] > start) or (idx < len(copies) and copies[idx][0] < start + unit_len):
+                    continue  # copies do not overlap, so each copy is exactly the unit
+                chr_seq[start:start + unit_len] = unit
+                copies.insert(idx, (start, start + unit_len, len(self.families)))
+                family.append((chr_name, start))
+                placed_len += unit_len
+                n_placed += 1
+            self.families.append(family)
+
+    def get_seq(self, chr_name, start, length, strand):
+        seq = bytes(self.seqs[chr_name][start:start + length])
+        return seq if strand == '+' else rev_comp(seq)
+
+    def overlapping_copies(self, chr_name, start, end):
+        copies = self.copies[chr_name]
+        idx = max(0, bisect_left(copies, (start, )) - 1)
+        while idx < len(copies) and copies[idx][0] < end:
+            if copies[idx][1] > start:
+                yield copies[idx]
+            idx += 1
+
+
+class ContigLayout(object):
+    """
+    Contig made of blocks: (chromosome, start, length, strand) for parts of the reference and (None, None, length, None)
+    for runs of N's. If the contig is reversed, its sequence is the reverse complement of the joined blocks
+    """
+    def __init__(self, name, blocks, reversed_contig=False):
+        self.name = name
+        self.blocks = blocks
+        self.reversed = reversed_contig
+        self.length = sum(block[2] for block in blocks)
+
+    def get_seq(self, reference):
+        seq = b''.join(reference.get_seq(chr_name, start, length, strand) if chr_name else b'N' * length
+                       for chr_name, start, length, strand in self.blocks)
+        return rev_comp(seq) if self.reversed else seq
+
+    def _make_align(self, chr_name, ref_start, ctg_start, length, strand):
+        # positions are 0-based in the joined blocks, the alignment is 1-based in the contig
+        is_forward = (strand == '+') != self.reversed
+        if self.reversed:
+            ctg_start = self.length - ctg_start - length
+        s2, e2 = ctg_start + 1, ctg_start + length
+        if not is_forward:
+            s2, e2 = e2, s2
+        return Mapping(s1=ref_start + 1, e1=ref_start + length, s2=s2, e2=e2, len1=length, len2=length,
+                       idy='100.00', ref=chr_name, contig=self.name, cigar='cs:Z::%d' % length)
+
+    def get_aligns(self, reference):
+        """
+        Exact alignments of the blocks and alignments of their parts from repeats to the other copies of the repeats
+        """
+        aligns = []
+        ctg_pos = 0
+        for chr_name, start, length, strand in self.blocks:
+            if chr_name:
+                aligns.append(self._make_align(chr_name, start, ctg_pos, length, strand))
+                for copy_start, copy_end, family in reference.overlapping_copies(chr_name, start, start + length):
+                    part_start, part_end = max(start, copy_start), min(start + length, copy_end)
+                    if part_end - part_start < MIN_REPEAT_ALIGN_LEN:
+                        continue
+                    if strand == '+':
+                        part_ctg_pos = ctg_pos + part_start - start
+                    else:
+                        part_ctg_pos = ctg_pos + start + length - part_end
+                    for other_chr_name, other_start in reference.families[family]:
+                        if (other_chr_name, other_start) != (chr_name, copy_start):
+                            aligns.append(self._make_align(other_chr_name, other_start + part_start - copy_start,
+                                                           part_ctg_pos, part_end - part_start, strand))
+            ctg_pos += length
+        return aligns
+
+
+def lognormal_lengths(rng, n, total_len):
+    # contig lengths of real assemblies have a heavy tail, sigma=1 gives N50 of about 3 mean lengths
+    weights = [rng.lognormvariate(0, 1) for _ in range(n)]
+    return [max(1, length) for length in split_number(total_len, weights)]
+
+
+def make_chimeric(rng, reference, chr_name, start, length, stats):
+    """
+    Replaces the second part of the contig with another part of the reference, returns blocks of the contig
+    """
+    first_len = rng.randint(MIN_PIECE_LEN, length - MIN_PIECE_LEN)
+    second_len = length - first_len
+    chr_len = len(reference.seqs[chr_name])
+    kinds = ['relocation', 'inversion', 'local']
+    if len(reference.names) > 1:
+        kinds.append('translocation')
+    kind = rng.choice(kinds)
+    second_chr_name, second_strand = chr_name, '+'
+    second_start = start + first_len
+    if kind == 'relocation':
+        if chr_len < 4 * EXTENSIVE_DISTANCE + second_len:
+            kind = 'inversion'
+        else:
+            second_start = rng.randrange(chr_len - second_len)
+            while abs(second_start - (start + first_len)) < EXTENSIVE_DISTANCE:
+                second_start = rng.randrange(chr_len - second_len)
+    if kind == 'translocation':
+        while second_chr_name == chr_name:
+            second_chr_name = reference.random_chromosome(rng)
+        second_chr_len = len(reference.seqs[second_chr_name])
+        second_len = min(second_len, second_chr_len)
+        second_start = rng.randrange(second_chr_len - second_len + 1)
+    elif kind == 'inversion':
+        second_strand = '-'
+    elif kind == 'local':
+        second_start = min(start + first_len + rng.randint(*LOCAL_GAP), chr_len - second_len)
+    stats[kind] += 1
+    return [(chr_name, start, first_len, '+'), (second_chr_name, second_start, second_len, second_strand)]
+
+
+def add_n_run(rng, blocks):
+    """
+    Replaces the middle of the longest block with a run of N's of the same length
+    """
+    idx = max(range(len(blocks)), key=lambda i: blocks[i][2])
+    chr_name, start, length, strand = blocks[idx]
+    n_len = rng.randint(N_RUN_LEN[0], min(N_RUN_LEN[1], length // 3))
+    left_len = rng.randint(length // 3 - n_len // 2, length - length // 3 - n_len)
+    right_len = length - left_len - n_len
+    if strand == '+':
+        left_start, right_start = start, start + left_len + n_len
+    else:
+        left_start, right_start = start + right_len + n_len, start
+    blocks[idx:idx + 1] = [(chr_name, left_start, left_len, strand), (None, None, n_len, None),
+                           (chr_name, right_start, right_len, strand)]
+
+
+def iter_contigs(rng, reference, params, stats):
+    """
+    Yields layouts of contigs: contigs of each chromosome in the order of the reference, unaligned contigs at the end
+    """
+    n_contigs = max(1, params['contigs'])
+    n_unaligned = int(round(n_contigs * params['unaligned']))
+    contigs_by_chromosomes = split_number(n_contigs - n_unaligned, [len(reference.seqs[name]) for name in reference.names])
+    contig_idx = 0
+    for chr_name, chr_contigs in zip(reference.names, contigs_by_chromosomes):
+        if not chr_contigs:
+            continue
+        chr_len = len(reference.seqs[chr_name])
+        lengths = lognormal_lengths(rng, chr_contigs, int(chr_len * params['coverage']))
+        gaps = split_number(max(0, chr_len - sum(lengths)), [rng.expovariate(1) for _ in range(chr_contigs + 1)])
+        pos = gaps[0]
+        for length, gap in zip(lengths, gaps[1:]):
+            length = min(length, chr_len - pos)
+            if length <= 0:
+                break
+            contig_idx += 1
+            blocks = [(chr_name, pos, length, '+')]
+            if length >= 2 * MIN_PIECE_LEN and rng.random() < params['misassemblies']:
+                blocks = make_chimeric(rng, reference, chr_name, pos, length, stats)
+            if length >= 3 * N_RUN_LEN[0] and rng.random() < params['n_runs']:
+                add_n_run(rng, blocks)
+                stats['n_runs'] += 1
+            yield ContigLayout('contig_%d' % contig_idx, blocks, reversed_contig=rng.random() < 0.5)
+            pos += length + gap
+    mean_len = max(1, int(reference.total_len * params['coverage'] / n_contigs))
+    for length in lognormal_lengths(rng, n_unaligned, mean_len * n_unaligned) if n_unaligned else []:
+        contig_idx += 1
+        yield ContigLayout('contig_%d' % contig_idx, [('random', None, length, None)])
+
+
+def generate(output_dirpath, params):
+    """
+    Generates the reference, the assembly, its alignments and genes into output_dirpath,
+    returns the parameters with the statistics of the generated data
+    """
+    if not os.path.isdir(output_dirpath):
+        os.makedirs(output_dirpath)
+    rng = random.Random(params['seed'])
+    reference = Reference(rng, params)
+    with open(os.path.join(output_dirpath, reference_fname), 'wb') as out_f:
+        for chr_name, seq in reference.seqs.items():
+            write_fasta_entry(out_f, chr_name, seq)
+
+    stats = OrderedDict((name, 0) for name in ['contigs', 'alignments', 'relocation', 'translocation',
+                                               'inversion', 'local', 'n_runs', 'unaligned'])
+    coords_writer = CoordsWriter(os.path.join(output_dirpath, coords_fname))
+    with open(os.path.join(output_dirpath, contigs_fname), 'wb') as out_f:
+        for contig in iter_contigs(rng, reference, params, stats):
+            stats['contigs'] += 1
+            if contig.blocks[0][0] == 'random':
+                stats['unaligned'] += 1
+                write_fasta_entry(out_f, contig.name, random_seq(rng, contig.length))
+                continue
+            write_fasta_entry(out_f, contig.name, contig.get_seq(reference))
+            for align in contig.get_aligns(reference):
+                coords_writer.write_align(align)
+                stats['alignments'] += 1
+    coords_writer.close()
+
+    n_genes = int(reference.total_len * params['genes_per_mbp'] / 1000000)
+    genes = []
+    for i in range(n_genes):
+        chr_name = reference.random_chromosome(rng)
+        gene_len = min(rng.randint(*GENE_LEN), len(reference.seqs[chr_name]))
+        start = rng.randint(1, len(reference.seqs[chr_name]) - gene_len + 1)
+        genes.append((reference.names.index(chr_name), start, start + gene_len - 1))
+    with open(os.path.join(output_dirpath, genes_fname), 'w') as out_f:
+        out_f.write('##gff-version 3\n')
+        for i, (chr_id, start, end) in enumerate(sorted(genes)):
+            out_f.write('\t'.join([reference.names[chr_id], 'synthetic', 'gene', str(start), str(end), '.', '+', '.',
+                                   'ID=gene_%d' % (i + 1)]) + '\n')
+
+    data_info = OrderedDict([('params', params), ('stats', stats),
+                             ('repeat_families', len([family for family in reference.families if len(family) > 1]))])
+    with open(os.path.join(output_dirpath, params_fname), 'w') as out_f:
+        json.dump(data_info, out_f, indent=2)
+    return data_info
+
+
+def prepare(output_dirpath, params):
+    """
+    Returns the info of the data in output_dirpath, the data is generated if it is missing or was generated with other parameters
+    """
+    params_fpath = os.path.join(output_dirpath, params_fname)
+    if os.path.isfile(params_fpath):
+        with open(params_fpath) as f:
+            data_info = json.load(f, object_pairs_hook=OrderedDict)
+        if data_info['params'] == params and all(os.path.isfile(os.path.join(output_dirpath, fname))
+                                                 for fname in [reference_fname, contigs_fname, coords_fname, genes_fname]):
+            return data_info
+    return generate(output_dirpath, params)
+
+
+def add_params_options(parser):
+    parser.add_option('--scale', choices=list(SCALES.keys()), default='small',
+                      help='Preset of genome size and number of contigs: ' + ', '.join(
+                          '%s (%s bp, %s contigs)' % (name, scale['genome_size'], scale['contigs']) for name, scale in SCALES.items()) +
+                      ' [default: %default]')
+    parser.add_option('--genome-size', help='Reference length, e.g. 5M or 3G (overrides the preset)')
+    parser.add_option('--contigs', help='Number of contigs, e.g. 1000 or 10M (overrides the preset)')
+    parser.add_option('--chromosomes', type='int', help='Number of chromosomes (overrides the preset)')
+    parser.add_option('--seed', type='int', help='Seed of the random generator [default: %d]' % DEFAULT_PARAMS['seed'])
+    for name in ['coverage', 'misassemblies', 'n_runs', 'unaligned', 'repeats']:
+        parser.add_option('--' + name.replace('_', '-'), type='float',
+                          help='Fraction of %s [default: %s]' % (name.replace('_', ' '), DEFAULT_PARAMS[name]))
+
+
+def get_params_from_options(opts):
+    return get_params(opts.scale, seed=opts.seed, chromosomes=opts.chromosomes,
+                      genome_size=parse_size(opts.genome_size) if opts.genome_size else None,
+                      contigs=parse_size(opts.contigs) if opts.contigs else None,
+                      coverage=opts.coverage, misassemblies=opts.misassemblies, n_runs=opts.n_runs,
+                      unaligned=opts.unaligned, repeats=opts.repeats)
+
+
+def main():
+    parser = OptionParser(usage='%prog -o <output_dir> [options]',
+                          description='Generates a synthetic reference, assembly, coords and genes for the benchmarks')
+    parser.add_option('-o', '--output-dir', help='Output directory')
+    add_params_options(parser)
+    opts, args = parser.parse_args()
+    if not opts.output_dir:
+        parser.error('output directory (-o) is required')
+    data_info = generate(opts.output_dir, get_params_from_options(opts))
+    print(json.dumps(data_info, indent=2))
+
+
+if __name__ == '__main__':
+    main()
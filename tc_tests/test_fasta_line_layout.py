@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+import os
+import sys
+from common import *
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from quast_libs import fastaparser
+
+name = os.path.basename(__file__)[5:-3]
+results_dirpath = get_results_dirpath(name)
+if os.path.exists(results_dirpath):
+    shutil.rmtree(results_dirpath)
+os.makedirs(results_dirpath)
+
+# random access by the index is possible only if all lines but the last have the same length
+entries = [
+    ('regular', 'ACGTA\nCGTAC\nGT\n', 'ACGTACGTACGT'),
+    ('irregular', 'ACGT\nA\nAC\n', 'ACGTAAC'),
+    ('long_last_line', 'ACG\nTAC\nGTACGT\n', 'ACGTACGTACGT'),
+    ('crlf', 'ACGT\r\nACGT\r\nA\r\n', 'ACGTACGTA'),
+    ('no_final_break', 'ACGT\nACGT\nAC', 'ACGTACGTAC'),  # the last entry of the file
+]
+fasta_fpath = os.path.join(results_dirpath, 'line_layout.fasta')
+with open(fasta_fpath, 'wb') as fasta_file:
+    for entry_name, raw_seq, seq in entries:
+        fasta_file.write(('>' + entry_name + '\n' + raw_seq).encode())
+
+random_access_entries = ['regular', 'no_final_break']
+for entry in fastaparser.get_fasta_index(fasta_fpath):
+    if bool(entry.line_bases) != (entry.name in random_access_entries):
+        print('Line layout of %s is detected incorrectly: %d bases per line' % (entry.name, entry.line_bases))
+        sys.exit(1)
+
+for entry_name, raw_seq, seq in entries:
+    fasta = fastaparser.read_fasta_entries(fasta_fpath, [entry_name])
+    if fasta != [(entry_name, seq)]:
+        print('Sequence %s is read incorrectly: %s instead of %s' % (entry_name, fasta, seq))
+        sys.exit(1)
+fasta = fastaparser.read_fasta_entries(fasta_fpath, random_access_entries)
+if fasta != [(entry_name, seq) for entry_name, raw_seq, seq in entries if entry_name in random_access_entries]:
+    print('Sequences are read incorrectly by random access: %s' % fasta)
+    sys.exit(1)
+print('All sequences are read correctly')